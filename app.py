@@ -1,112 +1,808 @@
-from flask import Flask, render_template, request, jsonify
-import sqlite3
+from flask import Flask, Response, g, render_template, request, jsonify, stream_with_context
 import os
+import atexit
+import hmac
+import logging
+import threading
+import time
 from datetime import datetime
+from functools import partial
+from config import Config
 from models.range_predictor import RangePredictor
+from models.prediction_cache import PredictionCache
+from models.model_registry import ModelRegistry, UnknownVehicleError
+from history_writer import HistoryWriter
+from history_shards import insert_predictions
+from database import ConnectionPool, connect
+from history_query import encode_cursor, fetch_history_page
+from history_export import EXPORT_FORMATS, stream_history
+from history_stats import query_stats, update_rollups
+from model_reloader import ModelReloader
+from trip_simulation import parse_trip, simulate_trip
+from weather import FileWeatherProvider, OpenMeteoProvider, WeatherError, WeatherService, parse_location
+from metrics import MetricsRegistry
+from log_config import configure_logging
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key')
 
-# Initialize the range predictor
-predictor = RangePredictor()
+logger = configure_logging(Config.LOG_LEVEL, Config.LOG_FILE, Config.LOG_FORMAT)
 
-def get_db_connection():
-    """Create a database connection."""
-    conn = sqlite3.connect('voltsage.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+# In-process metrics exposed at /metrics; the histograms stay None when disabled
+metrics = MetricsRegistry()
+request_duration = None
+request_stage_duration = None
+predictor_stage_duration = None
+history_write_duration = None
+requests_total = None
+if Config.METRICS_ENABLED:
+    request_duration = metrics.histogram(
+        'voltsage_request_duration_seconds', 'HTTP request latency.', ['route', 'method'])
+    requests_total = metrics.counter(
+        'voltsage_requests_total', 'HTTP requests by response status.', ['route', 'method', 'status'])
+    request_stage_duration = metrics.histogram(
+        'voltsage_request_stage_seconds', 'Time spent in each stage of prediction requests.', ['route', 'stage'])
+    predictor_stage_duration = metrics.histogram(
+        'voltsage_predictor_stage_seconds', 'Time spent inside the range predictor.', ['stage'])
+    history_write_duration = metrics.histogram(
+        'voltsage_history_write_seconds', 'Time to insert and commit a batch of history rows.')
+
+def create_prediction_cache():
+    """Build an empty prediction cache, or None when caching is disabled."""
+    if Config.PREDICTION_CACHE_SIZE <= 0:
+        return None
+    return PredictionCache(
+        max_entries=Config.PREDICTION_CACHE_SIZE,
+        temperature_resolution=Config.PREDICTION_CACHE_TEMPERATURE_RESOLUTION,
+        wind_speed_resolution=Config.PREDICTION_CACHE_WIND_SPEED_RESOLUTION,
+        cargo_weight_resolution=Config.PREDICTION_CACHE_CARGO_WEIGHT_RESOLUTION
+    )
+
+# Cache of the active predictor; a reloaded model starts with a fresh one
+prediction_cache = create_prediction_cache()
+
+# The model is loaded on first use (or by the warm-up thread), not at import time
+_predictor = None
+_predictor_lock = threading.Lock()
+_predictor_load_seconds = None
+
+def create_predictor(cache=None, load=True, model_path=Config.MODEL_PATH):
+    """Build the range predictor from configuration, loading or training its model."""
+    return RangePredictor(
+        model_path=model_path,
+        engine=Config.PREDICTION_ENGINE,
+        cache=cache,
+        grid_steps=(Config.GRID_TEMPERATURE_STEP, Config.GRID_WIND_SPEED_STEP, Config.GRID_CARGO_WEIGHT_STEP),
+        model_format=Config.MODEL_FORMAT,
+        verify_checksum=Config.MODEL_VERIFY_CHECKSUM,
+        compact_max_error=Config.COMPACT_MAX_ERROR_KM,
+        metrics=predictor_stage_duration,
+        load=load
+    )
+
+# Models of individual vehicles, each with its own prediction cache
+model_registry = ModelRegistry(
+    Config.MODEL_REGISTRY_DIR,
+    lambda model_path: create_predictor(create_prediction_cache(), load=False, model_path=model_path),
+    memory_budget_bytes=int(Config.MODEL_REGISTRY_MEMORY_MB * 1024 * 1024)
+)
+
+def get_predictor(vehicle_id=None, rows=1):
+    """Return the range predictor, loading it once in a thread-safe way.
+    
+    With a vehicle_id, returns that vehicle's predictor from the model registry,
+    counting rows predictions for it.
+    """
+    global _predictor, _predictor_load_seconds
+    if vehicle_id is not None:
+        return model_registry.get(vehicle_id, rows)
+    if _predictor is None:
+        with _predictor_lock:
+            if _predictor is None:
+                start = time.perf_counter()
+                _predictor = create_predictor(prediction_cache)
+                _predictor_load_seconds = time.perf_counter() - start
+    return _predictor
+
+def warm_up_predictor():
+    """Load the model ahead of the first request."""
+    try:
+        get_predictor()
+    except Exception as e:
+        print(f"Error warming up model: {e}")
+        logger.exception('Model warm-up failed')
+
+def swap_predictor(predictor, load_seconds):
+    """Make a reloaded predictor the active one.
+    
+    Requests that already fetched the old predictor finish on it; its cache is
+    dropped with it, so entries computed by the old model are never served.
+    """
+    global _predictor, _predictor_load_seconds, prediction_cache
+    with _predictor_lock:
+        prediction_cache = predictor.cache
+        _predictor = predictor
+        _predictor_load_seconds = load_seconds
+
+model_reloader = ModelReloader(
+    lambda load: create_predictor(create_prediction_cache(), load=load),
+    swap_predictor,
+    watch_path=Config.MODEL_PATH,
+    poll_interval=Config.MODEL_WATCH_INTERVAL_S
+)
+
+def create_weather_service():
+    """Build the weather lookup service, or None when location-based predictions are disabled."""
+    if Config.WEATHER_PROVIDER == 'none':
+        return None
+    if Config.WEATHER_PROVIDER == 'file':
+        provider = FileWeatherProvider(Config.WEATHER_STUB_PATH)
+    elif Config.WEATHER_PROVIDER == 'open-meteo':
+        provider = OpenMeteoProvider(Config.WEATHER_API_URL, Config.WEATHER_API_KEY, timeout=Config.WEATHER_TIMEOUT_S)
+    else:
+        raise ValueError(f"Unknown weather provider '{Config.WEATHER_PROVIDER}'. Choose open-meteo, file or none")
+    return WeatherService(
+        provider,
+        ttl=Config.WEATHER_CACHE_TTL_S,
+        max_entries=Config.WEATHER_CACHE_SIZE,
+        precision=Config.WEATHER_GEOHASH_PRECISION
+    )
+
+weather_service = create_weather_service()
+
+# Reusable database connections for request handlers
+db_pool = ConnectionPool(Config.DATABASE_PATH, max_idle=Config.DATABASE_POOL_SIZE)
+
+# Background history writer, started by init_app; until then history is written synchronously
+history_writer = None
+
+_initialized = False
+_init_lock = threading.Lock()
+
+def init_app():
+    """Start the serving process's background work: the history writer thread,
+    the model warm-up and the model file watcher.
+    
+    Importing the module starts no threads, so they are created in the process
+    that serves requests (after any fork) and not in tools that import the app.
+    run.py and asgi.py call this; calling it again does nothing.
+    """
+    global history_writer, _initialized
+    with _init_lock:
+        if _initialized:
+            return
+        _initialized = True
+    
+    # Write prediction history from a background thread unless disabled
+    if Config.HISTORY_ASYNC_WRITES:
+        writer = HistoryWriter(
+            partial(connect, Config.DATABASE_PATH),
+            max_queue_size=Config.HISTORY_QUEUE_SIZE,
+            batch_size=Config.HISTORY_BATCH_SIZE,
+            flush_interval=Config.HISTORY_FLUSH_INTERVAL_MS / 1000.0,
+            after_insert=update_rollups,
+            metrics=history_write_duration
+        )
+        writer.start()
+        atexit.register(writer.close)
+        history_writer = writer
+    
+    if Config.MODEL_WATCH:
+        model_reloader.start_watching()
+    
+    if Config.MODEL_WARMUP == 'eager':
+        get_predictor()
+    elif Config.MODEL_WARMUP == 'background':
+        threading.Thread(target=warm_up_predictor, name='model-warmup', daemon=True).start()
+
+def record_predictions(rows):
+    """Store prediction history rows, queued for the writer thread when enabled."""
+    if history_writer is not None:
+        history_writer.submit(rows)
+        return
+    
+    start = time.perf_counter()
+    with db_pool.connection() as conn:
+        insert_predictions(conn, rows)
+        update_rollups(conn, rows)
+        conn.commit()
+    if history_write_duration is not None:
+        history_write_duration.observe(time.perf_counter() - start)
+
+def record_stage(stage, start):
+    """Record the time since start as a stage of the current request; returns the current time."""
+    now = time.perf_counter()
+    g.stages[stage] = now - start
+    if request_stage_duration is not None:
+        request_stage_duration.observe(now - start, request.url_rule.rule, stage)
+    return now
+
+@app.before_request
+def start_request_timer():
+    """Start timing the request."""
+    g.request_start = time.perf_counter()
+    g.stages = {}
+
+# Error statuses that report a normal state rather than a failure: readiness
+# probes get 503 until the model has loaded
+EXPECTED_ERROR_STATUSES = {('/api/ready', 503)}
+
+def observe_request(method, path, route, status, duration, stages):
+    """Record metrics for a finished request and log it, with its stage timings."""
+    if request_duration is not None:
+        request_duration.observe(duration, route, method)
+        requests_total.inc(route, method, str(status))
+    
+    # Slow requests and server errors are logged above DEBUG with where the time went
+    if status >= 500 and (route, status) not in EXPECTED_ERROR_STATUSES:
+        level = logging.ERROR
+    elif duration * 1000 >= Config.SLOW_REQUEST_MS:
+        level = logging.WARNING
+    else:
+        level = logging.DEBUG
+    if logger.isEnabledFor(level):
+        logger.log(level, 'request', extra={'fields': {
+            'method': method,
+            'path': path,
+            'route': route,
+            'status': status,
+            'duration_ms': round(duration * 1000, 3),
+            'stages_ms': {stage: round(seconds * 1000, 3) for stage, seconds in stages.items()}
+        }})
+
+@app.after_request
+def log_request(response):
+    """Record request metrics and log the request."""
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    observe_request(request.method, request.path, route, response.status_code,
+                    time.perf_counter() - g.request_start, g.stages)
+    return response
+
+# Most percentiles a single prediction request may ask for
+MAX_PERCENTILES = 10
+
+def parse_percentiles(value):
+    """Parse the optional percentiles field of a prediction request.
+    
+    Returns the percentiles (None when not requested) and an error message.
+    """
+    if value is None or value is False:
+        return None, None
+    if value is True:
+        return list(Config.PREDICTION_PERCENTILES), None
+    if (not isinstance(value, list) or not 1 <= len(value) <= MAX_PERCENTILES
+            or any(isinstance(p, bool) or not isinstance(p, (int, float)) or not 0 <= p <= 100 for p in value)):
+        return None, f'percentiles must be true or a list of 1 to {MAX_PERCENTILES} numbers between 0 and 100'
+    return [float(p) for p in value], None
+
+def percentile_key(percentile):
+    """Response key for a percentile, e.g. p10 or p97.5."""
+    return f"p{percentile:g}"
 
 @app.route('/')
 def index():
     """Main page with the range prediction form."""
     return render_template('index.html')
 
+def uses_location(data):
+    """Whether a request gives a location instead of temperature and wind_speed."""
+    return 'temperature' not in data and 'wind_speed' not in data and ('latitude' in data or 'longitude' in data)
+
+def required_prediction_fields(data):
+    """Fields a prediction request or batch row must have."""
+    if uses_location(data):
+        return ['latitude', 'longitude', 'driving_style', 'cargo_weight']
+    return ['temperature', 'wind_speed', 'driving_style', 'cargo_weight']
+
+def parse_prediction_request(data):
+    """Validate a single prediction request body.
+    
+    Returns the model inputs, the requested percentiles and an error message.
+    When the request gives a location instead of the weather, the inputs hold
+    it as (latitude, longitude, time) under 'location' until resolve_weather
+    replaces it with the temperature and wind speed.
+    """
+    if not isinstance(data, dict):
+        return None, None, 'Request body must be an object'
+    
+    # Validate required fields
+    for field in required_prediction_fields(data):
+        if field not in data:
+            return None, None, f'Missing required field: {field}'
+    
+    if uses_location(data):
+        if weather_service is None:
+            return None, None, 'Weather lookups are disabled; provide temperature and wind_speed'
+        try:
+            inputs = {'location': parse_location(data['latitude'], data['longitude'], data.get('time'))}
+        except ValueError as e:
+            return None, None, str(e)
+    else:
+        inputs = {'temperature': data['temperature'], 'wind_speed': data['wind_speed']}
+    
+    # Extract parameters
+    try:
+        for field in ('temperature', 'wind_speed'):
+            if field in inputs:
+                inputs[field] = float(inputs[field])
+        inputs['driving_style'] = data['driving_style']
+        inputs['cargo_weight'] = float(data['cargo_weight'])
+    except (TypeError, ValueError):
+        return None, None, 'Invalid numeric values provided'
+    
+    # Validate driving style
+    valid_styles = ['aggressive', 'moderate', 'eco']
+    if inputs['driving_style'] not in valid_styles:
+        return None, None, 'Invalid driving style. Must be one of: aggressive, moderate, eco'
+    
+    if not isinstance(data.get('vehicle_id', ''), str):
+        return None, None, 'vehicle_id must be a string'
+    
+    percentiles, error = parse_percentiles(data.get('percentiles'))
+    return inputs, percentiles, error
+
+def resolve_weather(rows):
+    """Replace the location of parsed requests with the temperature and wind speed there.
+    
+    All locations are looked up together. Returns each row's weather lookup
+    (None for rows that gave the weather); raises WeatherError when it fails.
+    """
+    located = [row for row in rows if 'location' in row]
+    lookups = iter(weather_service.lookup_many([row['location'] for row in located]) if located else [])
+    weather = []
+    for row in rows:
+        if 'location' not in row:
+            weather.append(None)
+            continue
+        conditions = next(lookups)
+        del row['location']
+        row['temperature'] = conditions['temperature']
+        row['wind_speed'] = conditions['wind_speed']
+        weather.append({'geohash': conditions['geohash'], 'time': conditions['time']})
+    return weather
+
+def prediction_response(inputs, predicted_range, percentiles=None, bands=None, weather=None, vehicle_id=None):
+    """Build the /api/predict response body."""
+    response = {
+        'predicted_range_km': round(predicted_range, 2),
+        'temperature': inputs['temperature'],
+        'wind_speed': inputs['wind_speed'],
+        'driving_style': inputs['driving_style'],
+        'cargo_weight': inputs['cargo_weight']
+    }
+    if percentiles:
+        response['range_percentiles_km'] = {
+            percentile_key(p): round(float(band), 2) for p, band in zip(percentiles, bands)
+        }
+    if weather:
+        response['weather'] = weather
+    if vehicle_id is not None:
+        response['vehicle_id'] = vehicle_id
+    return response
+
+def record_prediction(inputs, predicted_range):
+    """Store a single prediction in the history."""
+    record_predictions([
+        (inputs['temperature'], inputs['wind_speed'], inputs['driving_style'], inputs['cargo_weight'],
+         predicted_range, datetime.now())
+    ])
+
 @app.route('/api/predict', methods=['POST'])
 def predict_range():
     """API endpoint for range prediction."""
     try:
+        start = time.perf_counter()
         data = request.get_json()
+        inputs, percentiles, error = parse_prediction_request(data)
+        if error:
+            return jsonify({'error': error}), 400
+        start = record_stage('parse', start)
         
-        # Validate required fields
-        required_fields = ['temperature', 'wind_speed', 'driving_style', 'cargo_weight']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
-        
-        # Extract parameters
-        temperature = float(data['temperature'])
-        wind_speed = float(data['wind_speed'])
-        driving_style = data['driving_style']
-        cargo_weight = float(data['cargo_weight'])
+        # Look up the weather for requests that gave a location
+        weather = None
+        if 'location' in inputs:
+            weather = resolve_weather([inputs])[0]
+            start = record_stage('weather', start)
         
-        # Validate driving style
-        valid_styles = ['aggressive', 'moderate', 'eco']
-        if driving_style not in valid_styles:
-            return jsonify({'error': 'Invalid driving style. Must be one of: aggressive, moderate, eco'}), 400
+        vehicle_id = data.get('vehicle_id')
+        predictor = get_predictor(vehicle_id)
+        if percentiles and not predictor.supports_percentiles:
+            return jsonify({'error': 'Percentiles are not available with the compact engine'}), 400
         
         # Make prediction
-        predicted_range = predictor.predict_range(
-            temperature=temperature,
-            wind_speed=wind_speed,
-            driving_style=driving_style,
-            cargo_weight=cargo_weight
-        )
+        result = predictor.predict_range(**inputs, percentiles=percentiles)
+        predicted_range, bands = result if percentiles else (result, None)
+        start = record_stage('inference', start)
         
         # Store prediction in database
-        conn = get_db_connection()
-        conn.execute('''
-            INSERT INTO predictions (temperature, wind_speed, driving_style, cargo_weight, predicted_range, created_at)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (temperature, wind_speed, driving_style, cargo_weight, predicted_range, datetime.now()))
-        conn.commit()
-        conn.close()
+        record_prediction(inputs, predicted_range)
+        start = record_stage('store', start)
         
-        return jsonify({
-            'predicted_range_km': round(predicted_range, 2),
-            'temperature': temperature,
-            'wind_speed': wind_speed,
-            'driving_style': driving_style,
-            'cargo_weight': cargo_weight
-        })
+        response = jsonify(prediction_response(inputs, predicted_range, percentiles, bands, weather, vehicle_id))
+        record_stage('respond', start)
+        return response
         
+    except UnknownVehicleError as e:
+        return jsonify({'error': str(e)}), 400
+    except WeatherError as e:
+        return jsonify({'error': f'Weather lookup failed: {e}'}), 502
     except ValueError as e:
         return jsonify({'error': 'Invalid numeric values provided'}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/predict/batch', methods=['POST'])
+def predict_range_batch():
+    """API endpoint for predicting many ranges in one request."""
+    try:
+        start = time.perf_counter()
+        data = request.get_json()
+        all_fields = ['temperature', 'wind_speed', 'latitude', 'longitude', 'time', 'driving_style', 'cargo_weight']
+        
+        # Accept either a list of row objects or an object of columnar arrays; rows
+        # (or the whole object) may give a location and time instead of the weather
+        if isinstance(data, list):
+            located = []
+            for i, row in enumerate(data):
+                if not isinstance(row, dict):
+                    return jsonify({'error': f'Row {i} must be an object'}), 400
+                for field in required_prediction_fields(row):
+                    if field not in row:
+                        return jsonify({'error': f'Missing required field in row {i}: {field}'}), 400
+                if uses_location(row):
+                    located.append(i)
+            vehicle_ids = {row.get('vehicle_id') for row in data}
+            if len(vehicle_ids) > 1:
+                return jsonify({'error': 'All rows must use the same vehicle_id'}), 400
+            vehicle_id = vehicle_ids.pop() if vehicle_ids else None
+            columns = {field: [row.get(field) for row in data] for field in all_fields}
+        elif isinstance(data, dict):
+            fields = required_prediction_fields(data) + (['time'] if 'time' in data else [])
+            for field in fields:
+                if field not in data:
+                    return jsonify({'error': f'Missing required field: {field}'}), 400
+                if not isinstance(data[field], list):
+                    return jsonify({'error': f'Field {field} must be an array'}), 400
+            columns = {field: data[field] for field in fields}
+            if len({len(values) for values in columns.values()}) != 1:
+                return jsonify({'error': 'All columns must have the same length'}), 400
+            count = len(columns['driving_style'])
+            for field in all_fields:
+                columns.setdefault(field, [None] * count)
+            located = list(range(count)) if uses_location(data) else []
+            vehicle_id = data.get('vehicle_id')
+        else:
+            return jsonify({'error': 'Request body must be an array of rows or an object of arrays'}), 400
+        
+        count = len(columns['driving_style'])
+        if count == 0:
+            return jsonify({'error': 'Batch must contain at least one row'}), 400
+        if count > Config.MAX_BATCH_SIZE:
+            return jsonify({'error': f'Batch size exceeds maximum of {Config.MAX_BATCH_SIZE}'}), 400
+        
+        # Validate the locations to look up
+        if located and weather_service is None:
+            return jsonify({'error': 'Weather lookups are disabled; provide temperature and wind_speed'}), 400
+        try:
+            points = [
+                parse_location(columns['latitude'][i], columns['longitude'][i], columns['time'][i], f' in row {i}')
+                for i in located
+            ]
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # Extract parameters; located rows get their weather after validation
+        located_rows = set(located)
+        temperatures = [None if i in located_rows else float(value) for i, value in enumerate(columns['temperature'])]
+        wind_speeds = [None if i in located_rows else float(value) for i, value in enumerate(columns['wind_speed'])]
+        driving_styles = columns['driving_style']
+        cargo_weights = [float(value) for value in columns['cargo_weight']]
+        
+        # Validate driving styles
+        valid_styles = ['aggressive', 'moderate', 'eco']
+        for i, style in enumerate(driving_styles):
+            if style not in valid_styles:
+                return jsonify({'error': f'Invalid driving style in row {i}. Must be one of: aggressive, moderate, eco'}), 400
+        
+        if not isinstance(vehicle_id, (str, type(None))):
+            return jsonify({'error': 'vehicle_id must be a string'}), 400
+        
+        percentiles, error = parse_percentiles(data.get('percentiles') if isinstance(data, dict) else None)
+        if error:
+            return jsonify({'error': error}), 400
+        start = record_stage('parse', start)
+        
+        # Look up the weather of every located row in one call
+        if located:
+            for i, conditions in zip(located, weather_service.lookup_many(points)):
+                temperatures[i] = conditions['temperature']
+                wind_speeds[i] = conditions['wind_speed']
+            start = record_stage('weather', start)
+        
+        predictor = get_predictor(vehicle_id, count)
+        if percentiles and not predictor.supports_percentiles:
+            return jsonify({'error': 'Percentiles are not available with the compact engine'}), 400
+        
+        # Make all predictions in a single model call
+        result = predictor.predict_batch(
+            temperature=temperatures,
+            wind_speed=wind_speeds,
+            driving_style=driving_styles,
+            cargo_weight=cargo_weights,
+            percentiles=percentiles
+        )
+        predicted_ranges, bands = result if percentiles else (result, None)
+        predicted_ranges = predicted_ranges.tolist()
+        start = record_stage('inference', start)
+        
+        # Store predictions in database
+        created_at = datetime.now()
+        record_predictions([
+            (temperatures[i], wind_speeds[i], driving_styles[i], cargo_weights[i], predicted_ranges[i], created_at)
+            for i in range(count)
+        ])
+        start = record_stage('store', start)
+        
+        response = {
+            'count': count,
+            'predicted_range_km': [round(value, 2) for value in predicted_ranges]
+        }
+        if vehicle_id is not None:
+            response['vehicle_id'] = vehicle_id
+        if percentiles:
+            response['range_percentiles_km'] = {
+                percentile_key(p): [round(value, 2) for value in band.tolist()]
+                for p, band in zip(percentiles, bands)
+            }
+        if located:
+            response['temperature'] = temperatures
+            response['wind_speed'] = wind_speeds
+        
+        response = jsonify(response)
+        record_stage('respond', start)
+        return response
+        
+    except UnknownVehicleError as e:
+        return jsonify({'error': str(e)}), 400
+    except WeatherError as e:
+        return jsonify({'error': f'Weather lookup failed: {e}'}), 502
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': 'Invalid numeric values provided'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/trip/simulate', methods=['POST'])
+def simulate_trip_range():
+    """API endpoint to simulate the charge and remaining range along a route."""
+    data = request.get_json(silent=True)
+    try:
+        options, segments = parse_trip(data, Config.MAX_TRIP_SEGMENTS)
+        vehicle_id = data.get('vehicle_id')
+        if not isinstance(vehicle_id, (str, type(None))):
+            raise ValueError('vehicle_id must be a string')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        predictor = get_predictor(vehicle_id, len(segments['distance_km']))
+        if options['percentile'] is not None and not predictor.supports_percentiles:
+            return jsonify({'error': 'Percentiles are not available with the compact engine'}), 400
+        
+        summary, waypoints = simulate_trip(predictor, **segments, **options)
+        summary['waypoints'] = waypoints
+        return jsonify(summary)
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/history')
 def get_history():
-    """API endpoint to get prediction history."""
+    """API endpoint to get prediction history, newest first, one page at a time."""
     try:
-        conn = get_db_connection()
-        predictions = conn.execute('''
-            SELECT * FROM predictions 
-            ORDER BY created_at DESC 
-            LIMIT 50
-        ''').fetchall()
-        conn.close()
-        
-        history = []
-        for pred in predictions:
-            history.append({
-                'id': pred['id'],
-                'temperature': pred['temperature'],
-                'wind_speed': pred['wind_speed'],
-                'driving_style': pred['driving_style'],
-                'cargo_weight': pred['cargo_weight'],
-                'predicted_range': pred['predicted_range'],
-                'created_at': pred['created_at']
-            })
-        
-        return jsonify(history)
+        with db_pool.connection() as conn:
+            predictions, fields, limit = fetch_history_page(conn, request.args)
+        
+        history = [{field: pred[field] for field in fields} for pred in predictions]
+        response = jsonify(history)
+        
+        # A full page may be followed by more rows
+        if len(predictions) == limit:
+            last = predictions[-1]
+            response.headers['X-Next-Cursor'] = encode_cursor(last['created_at'], last['id'])
         
+        return response
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/history/stats')
+def get_history_stats():
+    """API endpoint to get aggregate statistics over all prediction history."""
+    try:
+        with db_pool.connection() as conn:
+            stats = query_stats(conn, request.args)
+        return jsonify(stats)
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/history/export')
+def export_history():
+    """API endpoint to stream the full, or time-filtered, prediction history."""
+    fmt = request.args.get('format', 'ndjson')
+    try:
+        chunks = stream_history(request.args, fmt, database_path=Config.DATABASE_PATH)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    response = Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename=voltsage_history.{fmt}'
+    return response
+
+@app.route('/api/ready')
+def readiness():
+    """Readiness endpoint reporting whether the model has been loaded."""
+    if _predictor is None:
+        return jsonify({'ready': False}), 503
+    
+    return jsonify({
+        'ready': True,
+        'engine': _predictor.engine,
+        'model_path': _predictor.model_path,
+        'memory_mapped': _predictor.memory_mapped,
+        'load_seconds': round(_predictor_load_seconds, 3)
+    })
+
+@app.route('/api/cache/stats')
+def get_cache_stats():
+    """API endpoint to get prediction cache counters."""
+    if prediction_cache is None:
+        return jsonify({'enabled': False})
+    
+    stats = prediction_cache.stats()
+    stats['enabled'] = True
+    return jsonify(stats)
+
+@app.route('/api/history/writer/stats')
+def get_history_writer_stats():
+    """API endpoint to get background history writer counters."""
+    if history_writer is None:
+        return jsonify({'enabled': False})
+    
+    stats = history_writer.stats()
+    stats['enabled'] = True
+    return jsonify(stats)
+
+@app.route('/api/models/stats')
+def get_model_registry_stats():
+    """API endpoint to get the vehicle model registry's memory use and per-model usage."""
+    stats = model_registry.stats()
+    stats['available'] = model_registry.vehicle_ids()
+    return jsonify(stats)
+
+@app.route('/api/weather/stats')
+def get_weather_stats():
+    """API endpoint to get weather cache and provider counters."""
+    if weather_service is None:
+        return jsonify({'enabled': False})
+    
+    stats = weather_service.stats()
+    stats['enabled'] = True
+    return jsonify(stats)
+
+def _cache_lookups():
+    """Prediction cache hit and miss counters, or None when the cache is disabled."""
+    if prediction_cache is None:
+        return None
+    stats = prediction_cache.stats()
+    return {('hit',): stats['hits'], ('miss',): stats['misses']}
+
+def _weather_lookups():
+    """Weather cache lookups by result, or None when weather lookups are disabled."""
+    if weather_service is None:
+        return None
+    stats = weather_service.stats()
+    return {(result,): stats[key] for result, key in (('hit', 'hits'), ('miss', 'misses'), ('coalesced', 'coalesced'))}
+
+def _vehicle_model_requests():
+    """Requests served by each vehicle's model."""
+    return {(vehicle_id,): usage['requests'] for vehicle_id, usage in model_registry.stats()['models'].items()}
+
+def _history_rows():
+    """Background history writer row counters, or None when writes are synchronous."""
+    if history_writer is None:
+        return None
+    stats = history_writer.stats()
+    return {(outcome,): stats[outcome] for outcome in ('written', 'dropped', 'failed')}
+
+if Config.METRICS_ENABLED:
+    metrics.callback('voltsage_model_loaded', 'Whether the model has been loaded.',
+                     lambda: int(_predictor is not None))
+    metrics.callback('voltsage_model_load_seconds', 'Time taken to load the active model.',
+                     lambda: _predictor_load_seconds)
+    metrics.callback('voltsage_prediction_cache_entries', 'Entries in the prediction cache.',
+                     lambda: None if prediction_cache is None else prediction_cache.stats()['entries'])
+    metrics.callback('voltsage_prediction_cache_lookups_total', 'Prediction cache lookups by result.',
+                     _cache_lookups, ['result'], kind='counter')
+    metrics.callback('voltsage_vehicle_models_loaded', 'Vehicle models loaded in the registry.',
+                     lambda: model_registry.stats()['loaded'])
+    metrics.callback('voltsage_vehicle_models_memory_bytes', 'Estimated memory of the loaded vehicle models.',
+                     lambda: model_registry.stats()['memory_bytes'])
+    metrics.callback('voltsage_vehicle_model_evictions_total', 'Vehicle models evicted to stay within the memory budget.',
+                     lambda: model_registry.stats()['evictions'], kind='counter')
+    metrics.callback('voltsage_vehicle_model_requests_total', 'Requests served by each vehicle model.',
+                     _vehicle_model_requests, ['vehicle_id'], kind='counter')
+    metrics.callback('voltsage_weather_lookups_total', 'Weather cache lookups by result.',
+                     _weather_lookups, ['result'], kind='counter')
+    metrics.callback('voltsage_weather_fetches_total', 'Weather provider calls.',
+                     lambda: None if weather_service is None else weather_service.stats()['fetches'], kind='counter')
+    metrics.callback('voltsage_history_queue_depth', 'History rows waiting for the writer thread.',
+                     lambda: None if history_writer is None else history_writer.stats()['queue_depth'])
+    metrics.callback('voltsage_history_rows_total', 'History rows handled by the writer thread, by outcome.',
+                     _history_rows, ['outcome'], kind='counter')
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus metrics endpoint."""
+    if not Config.METRICS_ENABLED:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(metrics.render(), content_type=MetricsRegistry.CONTENT_TYPE)
+
+def check_admin_token():
+    """Return an error response unless the request carries the configured admin token."""
+    # Without a configured token the admin endpoints do not exist
+    if not Config.ADMIN_TOKEN:
+        return jsonify({'error': 'Admin endpoints are disabled; set ADMIN_TOKEN to enable them'}), 404
+    if not hmac.compare_digest(
+            request.headers.get('X-Admin-Token', ''), Config.ADMIN_TOKEN):
+        return jsonify({'error': 'Invalid or missing admin token'}), 403
+    return None
+
+@app.route('/api/admin/reload', methods=['GET', 'POST'])
+def reload_model():
+    """API endpoint to hot-reload (or retrain) the model, or get reload status."""
+    error = check_admin_token()
+    if error:
+        return error
+    
+    if request.method == 'GET':
+        return jsonify(model_reloader.stats())
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        retrain = bool(data.get('retrain', False))
+        
+        # A vehicle model is dropped from the registry and read again on its next request
+        if data.get('vehicle_id') is not None:
+            unloaded = model_registry.unload(data['vehicle_id'])
+            return jsonify({'status': 'unloaded' if unloaded else 'not_loaded', 'vehicle_id': data['vehicle_id']})
+        
+        if not data.get('wait', False):
+            if not model_reloader.reload_in_background(retrain):
+                return jsonify({'error': 'A model reload is already in progress'}), 409
+            return jsonify({'status': 'started', 'retrain': retrain}), 202
+        
+        if not model_reloader.reload(retrain):
+            return jsonify({'error': 'A model reload is already in progress'}), 409
+        
+        stats = model_reloader.stats()
+        stats['status'] = 'reloaded'
+        return jsonify(stats)
+        
+    except Exception as e:
+        return jsonify({'error': f'Model reload failed: {str(e)}'}), 500
+
 @app.route('/history')
 def history_page():
     """Page to display prediction history."""
     return render_template('history.html')
 
 if __name__ == '__main__':
+    init_app()
     app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
@@ -0,0 +1,268 @@
+"""
+ASGI entry point for VoltSage.
+
+Single-row POST /api/predict requests are validated on the event loop and
+micro-batched by a PredictionBatcher: requests arriving within
+ASYNC_BATCH_WINDOW_MS of each other (up to ASYNC_MAX_BATCH_SIZE) share one
+RangePredictor.predict_many call, which serves them from the prediction cache
+and evaluates the misses together (a lone request takes the single-row fast
+path). They are timed and logged like Flask requests. Every other request, including
+predictions asking for percentiles or a vehicle's model, is served by the
+Flask app in a worker thread. Run it with any ASGI server, e.g. python run_async.py or:
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+
+import asyncio
+import io
+import json
+import math
+import sys
+import threading
+import time
+from config import Config
+from prediction_batcher import PredictionBatcher
+from weather import WeatherError
+import app as flask_app
+
+batcher = PredictionBatcher(
+    lambda *columns: flask_app.get_predictor().predict_many(*columns),
+    window=Config.ASYNC_BATCH_WINDOW_MS / 1000.0,
+    max_batch_size=Config.ASYNC_MAX_BATCH_SIZE
+)
+
+async def _read_body(receive):
+    """Read the complete request body."""
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body', False):
+            break
+    return b''.join(chunks)
+
+async def _send_json(send, body, status=200):
+    """Send a JSON response."""
+    payload = json.dumps(body).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(payload)).encode())]
+    })
+    await send({'type': 'http.response.body', 'body': payload})
+
+def _record_stage(stages, stage, start):
+    """Record the time since start as a stage of a batched request; returns the current time."""
+    now = time.perf_counter()
+    stages[stage] = now - start
+    if flask_app.request_stage_duration is not None:
+        flask_app.request_stage_duration.observe(now - start, '/api/predict', stage)
+    return now
+
+async def predict_range(body, send):
+    """Coalesced /api/predict handler, returning the same responses as the Flask route."""
+    start = time.perf_counter()
+    stages = {}
+    status = await _predict_range(body, send, stages)
+    flask_app.observe_request('POST', '/api/predict', '/api/predict', status, time.perf_counter() - start, stages)
+
+async def _predict_range(body, send, stages):
+    """Validate, batch and answer a prediction request; returns the response status."""
+    start = time.perf_counter()
+    try:
+        data = json.loads(body)
+    except ValueError:
+        await _send_json(send, {'error': 'Request body must be valid JSON'}, 400)
+        return 400
+
+    inputs, percentiles, error = flask_app.parse_prediction_request(data)
+    if error:
+        await _send_json(send, {'error': error}, 400)
+        return 400
+    start = _record_stage(stages, 'parse', start)
+
+    # Look up the weather in a worker thread; concurrent lookups of a cell share one fetch
+    weather = None
+    if 'location' in inputs:
+        try:
+            weather = (await asyncio.get_running_loop().run_in_executor(None, flask_app.resolve_weather, [inputs]))[0]
+        except WeatherError as e:
+            await _send_json(send, {'error': f'Weather lookup failed: {e}'}, 502)
+            return 502
+        start = _record_stage(stages, 'weather', start)
+
+    # A non-finite row would fail the whole batch, so reject it here
+    if not all(math.isfinite(inputs[field]) for field in ('temperature', 'wind_speed', 'cargo_weight')):
+        await _send_json(send, {'error': 'Invalid numeric values provided'}, 400)
+        return 400
+
+    try:
+        predicted_range = await batcher.predict(**inputs)
+        start = _record_stage(stages, 'inference', start)
+        if flask_app.history_writer is not None:
+            # Only queues the row for the writer thread
+            flask_app.record_prediction(inputs, predicted_range)
+        else:
+            # A synchronous SQLite insert would block the event loop
+            await asyncio.get_running_loop().run_in_executor(
+                None, flask_app.record_prediction, inputs, predicted_range
+            )
+        start = _record_stage(stages, 'store', start)
+    except Exception as e:
+        await _send_json(send, {'error': str(e)}, 500)
+        return 500
+
+    await _send_json(send, flask_app.prediction_response(inputs, predicted_range, weather=weather))
+    _record_stage(stages, 'respond', start)
+    return 200
+
+def _wsgi_environ(scope, body):
+    """Translate an ASGI HTTP scope into a WSGI environ."""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        # The body has been read in full, so its length is known even for chunked requests
+        'CONTENT_LENGTH': str(len(body)),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ[name] = value
+        elif name in ('CONTENT_LENGTH', 'TRANSFER_ENCODING'):
+            continue
+        else:
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+class _ClientDisconnected(Exception):
+    """Raised in a WSGI worker thread once nothing reads its response any more."""
+
+async def call_wsgi(wsgi_app, scope, body, send):
+    """Serve a request with a WSGI app in a worker thread, streaming its response."""
+    loop = asyncio.get_running_loop()
+    # Bounded, so a large streamed export is not buffered ahead of the client
+    messages = asyncio.Queue(maxsize=16)
+    disconnected = threading.Event()
+
+    def put(message):
+        # Once the client has gone nothing drains the queue, so stop producing
+        if disconnected.is_set():
+            raise _ClientDisconnected()
+        asyncio.run_coroutine_threadsafe(messages.put(message), loop).result()
+
+    def start_response(status, headers, exc_info=None):
+        put(('start', int(status.split(' ', 1)[0]), headers))
+        return lambda data: put(('body', data))
+
+    def run():
+        try:
+            result = wsgi_app(_wsgi_environ(scope, body), start_response)
+            try:
+                for chunk in result:
+                    if chunk:
+                        put(('body', chunk))
+            finally:
+                # Closing the iterable also ends a streamed export's query
+                if hasattr(result, 'close'):
+                    result.close()
+            message = ('end',)
+        except _ClientDisconnected:
+            return
+        except Exception as e:
+            message = ('error', e)
+        try:
+            put(message)
+        except _ClientDisconnected:
+            pass
+
+    worker = loop.run_in_executor(None, run)
+    started = False
+    try:
+        while True:
+            message = await messages.get()
+            if message[0] == 'start':
+                _, status, headers = message
+                await send({
+                    'type': 'http.response.start',
+                    'status': status,
+                    'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+                })
+                started = True
+            elif message[0] == 'body':
+                await send({'type': 'http.response.body', 'body': message[1], 'more_body': True})
+            else:
+                if message[0] == 'error' and not started:
+                    await _send_json(send, {'error': str(message[1])}, 500)
+                else:
+                    await send({'type': 'http.response.body', 'body': b''})
+                break
+    except BaseException:
+        # The send failed or the task was cancelled: stop the worker, and free the
+        # queue so a put it is blocked on completes and it sees the flag
+        disconnected.set()
+        while not messages.empty():
+            messages.get_nowait()
+        raise
+    await worker
+
+async def _lifespan(receive, send):
+    """Acknowledge server startup and shutdown."""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            flask_app.init_app()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if flask_app.history_writer is not None:
+                flask_app.history_writer.flush()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope, receive, send):
+    """The VoltSage ASGI application."""
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+    # Servers without lifespan events start the background work on the first request
+    flask_app.init_app()
+
+    body = await _read_body(receive)
+    method, path = scope['method'], scope['path']
+
+    if method == 'POST' and path == '/api/predict':
+        # Percentile and vehicle model requests keep the Flask path: the batcher
+        # only runs the default model and does not compute bands
+        try:
+            data = json.loads(body)
+            batchable = not data.get('percentiles') and data.get('vehicle_id') is None
+        except (ValueError, AttributeError):
+            batchable = True
+        if batchable:
+            await predict_range(body, send)
+            return
+
+    if method == 'GET' and path == '/api/batcher/stats':
+        await _send_json(send, batcher.stats())
+        return
+
+    await call_wsgi(flask_app.app, scope, body, send)
@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+Load test and latency benchmark for the VoltSage API.
+Drives /api/predict, /api/predict/batch and /api/history through the Flask
+test client (in-process) and over a local socket, sweeping concurrency levels
+and payload sizes. Reports p50/p95/p99 latency, throughput and the time spent
+in each request stage, and can write the results as JSON and compare them with
+an earlier run:
+
+    python benchmarks/bench_api.py --output before.json
+    python benchmarks/bench_api.py --output after.json --compare before.json
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+STYLES = ['aggressive', 'moderate', 'eco']
+
+# Latency percentiles reported for every scenario and stage
+PERCENTILES = [50, 95, 99]
+
+def parse_list(value):
+    """Parse a comma-separated list of positive integers."""
+    try:
+        numbers = [int(item) for item in value.split(',') if item.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'expected comma-separated integers, got {value!r}')
+    if not numbers or min(numbers) < 1:
+        raise argparse.ArgumentTypeError('values must be positive integers')
+    return numbers
+
+def summarize(samples):
+    """Mean, percentiles and maximum of latency samples in seconds, as milliseconds."""
+    ms = np.asarray(samples, dtype=np.float64) * 1000.0
+    summary = {'mean': round(float(ms.mean()), 4)}
+    for p, value in zip(PERCENTILES, np.percentile(ms, PERCENTILES)):
+        summary[f'p{p}'] = round(float(value), 4)
+    summary['max'] = round(float(ms.max()), 4)
+    return summary
+
+class StageTimer:
+    """Times application functions by wrapping them for the duration of the benchmark.
+
+    Only the outermost call of a stage is timed on each thread, so a stage that
+    calls itself (e.g. predict_range falling back to predict_batch) counts once.
+    """
+
+    def __init__(self):
+        self.samples = {}
+        self._local = threading.local()
+        self._patched = []
+
+    def wrap(self, owner, name, stage):
+        """Replace owner.name with a timed version recording under stage."""
+        original = getattr(owner, name)
+        timer = self
+
+        def timed(*args, **kwargs):
+            active = getattr(timer._local, 'active', set())
+            if stage in active:
+                return original(*args, **kwargs)
+            timer._local.active = active | {stage}
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                timer.samples.setdefault(stage, []).append(time.perf_counter() - start)
+                timer._local.active = active
+
+        setattr(owner, name, timed)
+        self._patched.append((owner, name, original))
+
+    def reset(self):
+        """Discard the samples recorded so far."""
+        self.samples = {}
+
+    def restore(self):
+        """Put the original functions back."""
+        for owner, name, original in reversed(self._patched):
+            setattr(owner, name, original)
+        self._patched = []
+
+def random_row(rng):
+    """A prediction request row inside the documented input ranges."""
+    return {
+        'temperature': round(rng.uniform(-20, 40), 1),
+        'wind_speed': round(rng.uniform(0, 50), 1),
+        'driving_style': rng.choice(STYLES),
+        'cargo_weight': round(rng.uniform(0, 1000), 1)
+    }
+
+def build_scenarios(args):
+    """List of (name, method, path, payload size, request factory) to run."""
+    scenarios = []
+    if 'predict' in args.endpoints:
+        scenarios.append(('predict', 'POST', '/api/predict', 1,
+                          lambda rng, size: (None, random_row(rng))))
+    if 'batch' in args.endpoints:
+        for size in args.batch_sizes:
+            scenarios.append(('batch', 'POST', '/api/predict/batch', size,
+                              lambda rng, size: (None, [random_row(rng) for _ in range(size)])))
+    if 'history' in args.endpoints:
+        for size in args.history_limits:
+            scenarios.append(('history', 'GET', '/api/history', size,
+                              lambda rng, size: (f'limit={size}', None)))
+    return scenarios
+
+class InProcessClient:
+    """Sends requests through the Flask test client."""
+
+    mode = 'inprocess'
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self._local = threading.local()
+
+    def request(self, method, path, query, payload):
+        """Send one request and return its status code."""
+        # Test clients keep cookies and context state, so use one per thread
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.flask_app.test_client()
+        response = client.open(path, method=method, query_string=query, json=payload)
+        response.get_data()
+        return response.status_code
+
+    def close(self):
+        pass
+
+class SocketClient:
+    """Sends requests over HTTP, to a server started here or to --url."""
+
+    mode = 'socket'
+
+    def __init__(self, flask_app=None, url=None):
+        self.server = None
+        if url is None:
+            from werkzeug.serving import WSGIRequestHandler, make_server
+
+            class QuietHandler(WSGIRequestHandler):
+                def log_request(self, *args, **kwargs):
+                    pass
+
+            self.server = make_server('127.0.0.1', 0, flask_app, threaded=True, request_handler=QuietHandler)
+            threading.Thread(target=self.server.serve_forever, name='bench-server', daemon=True).start()
+            self.host, self.port = '127.0.0.1', self.server.server_port
+        else:
+            parts = urlsplit(url)
+            self.host, self.port = parts.hostname, parts.port or 80
+
+    def request(self, method, path, query, payload):
+        """Send one request and return its status code."""
+        body = None if payload is None else json.dumps(payload)
+        headers = {} if payload is None else {'Content-Type': 'application/json'}
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        try:
+            connection.request(method, f'{path}?{query}' if query else path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        finally:
+            connection.close()
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+
+def run_scenario(client, scenario, concurrency, requests, warmup, seed, on_start=None):
+    """Send requests from concurrency threads; return latencies, errors and wall time.
+
+    on_start is called after the warm-up requests, before the timed ones.
+    """
+    name, method, path, size, make_request = scenario
+    rng = random.Random(seed)
+    # Bodies are built up front so the clients only measure the request
+    bodies = [make_request(rng, size) for _ in range(warmup + requests)]
+
+    for query, payload in bodies[:warmup]:
+        client.request(method, path, query, payload)
+    if on_start is not None:
+        on_start()
+
+    counter = itertools.count(warmup)
+    latencies = []
+    errors = []
+
+    def worker():
+        while True:
+            index = next(counter)
+            if index >= len(bodies):
+                return
+            query, payload = bodies[index]
+            start = time.perf_counter()
+            try:
+                status = client.request(method, path, query, payload)
+            except Exception as e:
+                errors.append(str(e))
+                continue
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(f'HTTP {status}')
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    return latencies, errors, time.perf_counter() - start
+
+def git_commit():
+    """Current commit of the checkout, if it is a git repository."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def result_key(result):
+    """Identifies the same measurement across runs."""
+    return (result['mode'], result['endpoint'], result['payload_size'], result['concurrency'])
+
+def compare(results, baseline_path, threshold):
+    """Print the change from a previous run; return the number of regressions."""
+    with open(baseline_path) as f:
+        baseline = {result_key(result): result for result in json.load(f)['results']}
+
+    print(f"\n📐 Compared with {baseline_path} (regression threshold {threshold:g}%)")
+    regressions = 0
+    for result in results:
+        before = baseline.get(result_key(result))
+        if before is None:
+            continue
+        p99_change = (result['latency_ms']['p99'] / before['latency_ms']['p99'] - 1) * 100
+        throughput_change = (result['throughput_rps'] / before['throughput_rps'] - 1) * 100
+        regressed = p99_change > threshold or throughput_change < -threshold
+        regressions += regressed
+        mode, endpoint, size, concurrency = result_key(result)
+        print(f"   {'❌' if regressed else '✅'} {mode:<9} {endpoint:<8} size {size:<5} c={concurrency:<3} "
+              f"p99 {p99_change:+7.1f}%   throughput {throughput_change:+7.1f}%")
+    return regressions
+
+def main():
+    """Run the load test and print, save and compare the results."""
+    parser = argparse.ArgumentParser(description='Load test the VoltSage API.')
+    parser.add_argument('--mode', choices=['inprocess', 'socket', 'both'], default='both')
+    parser.add_argument('--url', help='benchmark a running server instead of starting one (socket mode)')
+    parser.add_argument('--endpoints', type=lambda value: value.split(','), default=['predict', 'batch', 'history'],
+                        help='comma-separated subset of predict, batch, history')
+    parser.add_argument('--concurrency', type=parse_list, default=[1, 4, 16])
+    parser.add_argument('--batch-sizes', type=parse_list, default=[10, 100, 1000],
+                        help='rows per /api/predict/batch request')
+    parser.add_argument('--history-limits', type=parse_list, default=[50, 1000],
+                        help='page sizes requested from /api/history')
+    parser.add_argument('--requests', type=int, default=500, help='timed requests per scenario')
+    parser.add_argument('--warmup', type=int, default=20, help='untimed requests per scenario')
+    parser.add_argument('--database', help='database to use (default: a fresh temporary one)')
+    parser.add_argument('--sync-writes', action='store_true',
+                        help='insert history on the request thread, so the store stage is the SQLite insert')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file from an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='percent change in p99 latency or throughput counted as a regression')
+    args = parser.parse_args()
+
+    unknown = set(args.endpoints) - {'predict', 'batch', 'history'}
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    # Settings are read when the app is imported, so configure the environment first
+    temp_dir = None
+    if args.database is None:
+        temp_dir = tempfile.TemporaryDirectory()
+        args.database = os.path.join(temp_dir.name, 'bench.db')
+    os.environ['DATABASE_PATH'] = args.database
+    if args.sync_writes:
+        os.environ['HISTORY_ASYNC_WRITES'] = 'False'
+
+    from setup_db import setup_database
+    if temp_dir is not None:
+        setup_database(args.database)
+
+    import app
+    from flask import Request
+    from models.range_predictor import RangePredictor
+    from config import Config
+    app.init_app()
+    app.get_predictor()
+
+    # Request stages: JSON decoding, validation, model inference and history storage
+    stages = StageTimer()
+    stages.wrap(Request, 'get_json', 'decode')
+    stages.wrap(app, 'parse_prediction_request', 'validate')
+    stages.wrap(RangePredictor, 'predict_range', 'inference')
+    stages.wrap(RangePredictor, 'predict_batch', 'inference')
+    stages.wrap(app, 'record_predictions', 'store')
+
+    clients = []
+    if args.mode in ('inprocess', 'both') and args.url is None:
+        clients.append(InProcessClient(app.app))
+    if args.mode in ('socket', 'both') or args.url is not None:
+        clients.append(SocketClient(app.app, args.url))
+
+    results = []
+    print("🏁 API load test")
+    print(f"   {'mode':<9} {'endpoint':<8} {'size':>5} {'conc':>4} {'req/s':>9} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  stages (mean ms)")
+    try:
+        for client in clients:
+            for scenario in build_scenarios(args):
+                # Stored history must be visible before paging through it
+                if scenario[0] == 'history' and app.history_writer is not None:
+                    app.history_writer.flush()
+
+                for concurrency in args.concurrency:
+                    latencies, errors, elapsed = run_scenario(
+                        client, scenario, concurrency, args.requests, args.warmup, args.seed,
+                        on_start=stages.reset
+                    )
+                    if not latencies:
+                        print(f"❌ {scenario[2]} failed: {errors[0] if errors else 'no responses'}")
+                        continue
+
+                    # A server given by --url runs elsewhere, so its stages are not seen here
+                    stage_summary = {} if args.url is not None else {
+                        name: summarize(samples) for name, samples in stages.samples.items()
+                    }
+                    result = {
+                        'mode': client.mode,
+                        'endpoint': scenario[0],
+                        'path': scenario[2],
+                        'payload_size': scenario[3],
+                        'concurrency': concurrency,
+                        'requests': len(latencies),
+                        'errors': len(errors),
+                        'elapsed_s': round(elapsed, 4),
+                        'throughput_rps': round(len(latencies) / elapsed, 2),
+                        'latency_ms': summarize(latencies),
+                        'stages_ms': stage_summary
+                    }
+                    results.append(result)
+
+                    latency = result['latency_ms']
+                    stage_text = ' '.join(f"{name}={summary['mean']:.3f}" for name, summary in stage_summary.items())
+                    print(f"   {client.mode:<9} {scenario[0]:<8} {scenario[3]:>5} {concurrency:>4} "
+                          f"{result['throughput_rps']:>9.1f} {latency['p50']:>9.3f} {latency['p95']:>9.3f} "
+                          f"{latency['p99']:>9.3f}  {stage_text}")
+                    if errors:
+                        print(f"      ⚠️ {len(errors)} errors, e.g. {errors[0]}")
+    finally:
+        for client in clients:
+            client.close()
+        stages.restore()
+
+    if args.output:
+        report = {
+            'meta': {
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'engine': Config.PREDICTION_ENGINE,
+                'model_format': Config.MODEL_FORMAT,
+                'prediction_cache_size': Config.PREDICTION_CACHE_SIZE,
+                'history_async_writes': app.history_writer is not None,
+                'url': args.url,
+                'requests': args.requests,
+                'warmup': args.warmup,
+                'seed': args.seed
+            },
+            'results': results
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+    regressions = compare(results, args.compare, args.threshold) if args.compare else 0
+
+    if app.history_writer is not None:
+        app.history_writer.close()
+    if temp_dir is not None:
+        temp_dir.cleanup()
+
+    if regressions:
+        print(f"\n⚠️ {regressions} regressions")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for single-row range predictions.
+Compares the pandas/sklearn reference path with the fast path used by
+RangePredictor.predict_range and checks that both return identical values,
+and that predict_batch costs less per row than a single predict_range call.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.range_predictor import RangePredictor
+
+CASES = [
+    (20.0, 10.0, 'moderate', 100.0),
+    (-5.0, 25.0, 'aggressive', 300.0),
+    (25.0, 5.0, 'eco', 50.0),
+    (35.0, 0.0, 'moderate', 450.0)
+]
+
+def time_per_call(func, iterations):
+    """Return the mean latency of func over the test cases in microseconds."""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for case in CASES:
+            func(*case)
+    elapsed = time.perf_counter() - start
+    return elapsed / (iterations * len(CASES)) * 1e6
+
+def time_per_batch_row(predictor, iterations):
+    """Return the mean latency of predict_batch over the test cases per row in microseconds."""
+    columns = [list(column) for column in zip(*CASES)]
+    start = time.perf_counter()
+    for _ in range(iterations):
+        predictor.predict_batch(*columns)
+    elapsed = time.perf_counter() - start
+    return elapsed / (iterations * len(CASES)) * 1e6
+
+def main(iterations=200):
+    """Run the benchmark and print per-call latency."""
+    predictor = RangePredictor()
+    
+    # Both paths must agree bit for bit
+    for case in CASES:
+        reference = predictor._predict_range_dataframe(*case)
+        fast = predictor.predict_range(*case)
+        if reference != fast:
+            print(f"❌ Mismatch for {case}: {fast!r} != {reference!r}")
+            sys.exit(1)
+    batch = predictor.predict_batch(*[list(column) for column in zip(*CASES)])
+    if batch.tolist() != [predictor.predict_range(*case) for case in CASES]:
+        print(f"❌ predict_batch differs from predict_range: {batch.tolist()}")
+        sys.exit(1)
+    
+    # Warm up all paths
+    time_per_call(predictor._predict_range_dataframe, 5)
+    time_per_call(predictor.predict_range, 5)
+    time_per_batch_row(predictor, 5)
+    
+    before = time_per_call(predictor._predict_range_dataframe, iterations)
+    after = time_per_call(predictor.predict_range, iterations)
+    batched = time_per_batch_row(predictor, iterations)
+    
+    print("🏁 predict_range latency per call")
+    print(f"   DataFrame path: {before:10.1f} µs")
+    print(f"   Fast path:      {after:10.1f} µs")
+    print(f"   Speedup:        {before / after:10.1f}x")
+    print(f"   Batch per row:  {batched:10.1f} µs ({len(CASES)} rows per batch)")
+    
+    # A batch must never cost more per row than predicting the rows one at a time
+    if batched >= after:
+        print(f"❌ predict_batch costs {batched:.1f} µs per row, more than a single call ({after:.1f} µs)")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
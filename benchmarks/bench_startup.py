@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Startup-time benchmark for the VoltSage app.
+Measures, in fresh interpreters, how long importing app.py takes and how long
+until the model is ready for each MODEL_WARMUP mode.
+"""
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside the child interpreter and prints import and ready times in seconds
+PROBE = '''
+import time
+start = time.perf_counter()
+import app
+imported = time.perf_counter() - start
+app.init_app()
+app.get_predictor()
+ready = time.perf_counter() - start
+print(imported, ready)
+'''
+
+def measure(mode, runs):
+    """Return the mean (import, ready) seconds for a warm-up mode."""
+    env = dict(os.environ, MODEL_WARMUP=mode, HISTORY_ASYNC_WRITES='False')
+    totals = [0.0, 0.0]
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True
+        ).stdout.split()
+        totals[0] += float(output[-2])
+        totals[1] += float(output[-1])
+    return totals[0] / runs, totals[1] / runs
+
+def main(runs=3):
+    """Run the benchmark and print startup times."""
+    print("🏁 App startup time")
+    for mode in ['eager', 'background', 'lazy']:
+        imported, ready = measure(mode, runs)
+        print(f"   {mode:<10} import: {imported * 1000:8.1f} ms   model ready: {ready * 1000:8.1f} ms")
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
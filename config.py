@@ -13,20 +13,93 @@ class Config:
     
     # Database settings
     DATABASE_PATH = os.environ.get('DATABASE_PATH', 'voltsage.db')
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 8))
+    DATABASE_BUSY_TIMEOUT_MS = int(os.environ.get('DATABASE_BUSY_TIMEOUT_MS', 5000))
+    DATABASE_CACHE_SIZE_KB = int(os.environ.get('DATABASE_CACHE_SIZE_KB', 16384))
+    DATABASE_MMAP_SIZE = int(os.environ.get('DATABASE_MMAP_SIZE', 268435456))
+    DATABASE_STATEMENT_CACHE_SIZE = int(os.environ.get('DATABASE_STATEMENT_CACHE_SIZE', 128))
+    EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 5000))
+    STATS_HISTOGRAM_BIN_KM = float(os.environ.get('STATS_HISTOGRAM_BIN_KM', 5.0))
+    # Monthly history shards kept by history_retention.py; older ones are archived to files
+    HISTORY_RETENTION_MONTHS = int(os.environ.get('HISTORY_RETENTION_MONTHS', 12))
+    HISTORY_ARCHIVE_DIR = os.environ.get('HISTORY_ARCHIVE_DIR', 'archive')
+    HISTORY_ARCHIVE_FORMAT = os.environ.get('HISTORY_ARCHIVE_FORMAT', 'npz')  # npz or parquet (needs pyarrow)
+    
+    # Background prediction history writer
+    HISTORY_ASYNC_WRITES = os.environ.get('HISTORY_ASYNC_WRITES', 'True').lower() == 'true'
+    HISTORY_QUEUE_SIZE = int(os.environ.get('HISTORY_QUEUE_SIZE', 10000))
+    HISTORY_BATCH_SIZE = int(os.environ.get('HISTORY_BATCH_SIZE', 100))
+    HISTORY_FLUSH_INTERVAL_MS = float(os.environ.get('HISTORY_FLUSH_INTERVAL_MS', 50))
     
     # Model settings
     MODEL_PATH = os.environ.get('MODEL_PATH', 'models/ev_range_model.joblib')
+    MODEL_WARMUP = os.environ.get('MODEL_WARMUP', 'background')  # background, eager or lazy
+    MODEL_FORMAT = os.environ.get('MODEL_FORMAT', 'joblib')  # joblib or mmap
+    MODEL_VERIFY_CHECKSUM = os.environ.get('MODEL_VERIFY_CHECKSUM', 'True').lower() == 'true'
+    MODEL_WATCH = os.environ.get('MODEL_WATCH', 'False').lower() == 'true'
+    MODEL_WATCH_INTERVAL_S = float(os.environ.get('MODEL_WATCH_INTERVAL_S', 5.0))
+    
+    # Per-vehicle models (<vehicle_id>.joblib) selected by vehicle_id, loaded on first use
+    # and evicted least recently used first to stay within the memory budget
+    MODEL_REGISTRY_DIR = os.environ.get('MODEL_REGISTRY_DIR', 'models/vehicles')
+    MODEL_REGISTRY_MEMORY_MB = float(os.environ.get('MODEL_REGISTRY_MEMORY_MB', 1024))
+    
+    # Incremental training settings
+    TRAINING_MEMORY_LIMIT_MB = float(os.environ.get('TRAINING_MEMORY_LIMIT_MB', 512))
+    TRAINING_ESTIMATORS_PER_CHUNK = int(os.environ.get('TRAINING_ESTIMATORS_PER_CHUNK', 10))
+    TRAINING_MAX_ESTIMATORS = int(os.environ.get('TRAINING_MAX_ESTIMATORS', 200))
+    
+    # Test R² the hyperparameter sweep's selected model must reach
+    TUNING_MIN_R2 = float(os.environ.get('TUNING_MIN_R2', 0.96))
+    
+    PREDICTION_ENGINE = os.environ.get('PREDICTION_ENGINE', 'sklearn')  # sklearn, flat, grid or compact
+    
+    # Lookup grid spacing used by the grid engine
+    GRID_TEMPERATURE_STEP = float(os.environ.get('GRID_TEMPERATURE_STEP', 1.0))
+    GRID_WIND_SPEED_STEP = float(os.environ.get('GRID_WIND_SPEED_STEP', 2.0))
+    GRID_CARGO_WEIGHT_STEP = float(os.environ.get('GRID_CARGO_WEIGHT_STEP', 20.0))
+    
+    # Largest measured error (km) versus the forest that the compact engine may have
+    COMPACT_MAX_ERROR_KM = float(os.environ.get('COMPACT_MAX_ERROR_KM', 40.0))
+    
+    # Prediction cache settings (0 entries disables the cache)
+    PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 0))
+    PREDICTION_CACHE_TEMPERATURE_RESOLUTION = float(os.environ.get('PREDICTION_CACHE_TEMPERATURE_RESOLUTION', 0.5))
+    PREDICTION_CACHE_WIND_SPEED_RESOLUTION = float(os.environ.get('PREDICTION_CACHE_WIND_SPEED_RESOLUTION', 1.0))
+    PREDICTION_CACHE_CARGO_WEIGHT_RESOLUTION = float(os.environ.get('PREDICTION_CACHE_CARGO_WEIGHT_RESOLUTION', 5.0))
     
     # API settings
     API_RATE_LIMIT = os.environ.get('API_RATE_LIMIT', '100 per minute')
+    MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 10000))
+    MAX_TRIP_SEGMENTS = int(os.environ.get('MAX_TRIP_SEGMENTS', 10000))
+    # Per-tree percentiles returned when a prediction request sets "percentiles": true
+    PREDICTION_PERCENTILES = [float(p) for p in os.environ.get('PREDICTION_PERCENTILES', '10,90').split(',')]
+    ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')  # required by /api/admin endpoints, which are disabled when empty
     
-    # Weather API settings (for future integration)
+    # Async server settings (asgi.py): concurrent /api/predict requests are batched
+    ASYNC_BATCH_WINDOW_MS = float(os.environ.get('ASYNC_BATCH_WINDOW_MS', 2.0))
+    ASYNC_MAX_BATCH_SIZE = int(os.environ.get('ASYNC_MAX_BATCH_SIZE', 256))
+    
+    # Weather settings: predictions given a location and time look up temperature and wind speed
+    # none, file or open-meteo; the default makes no outbound calls, Open-Meteo is opt-in
+    WEATHER_PROVIDER = os.environ.get('WEATHER_PROVIDER', 'none')
     WEATHER_API_KEY = os.environ.get('WEATHER_API_KEY', '')
     WEATHER_API_URL = os.environ.get('WEATHER_API_URL', 'https://api.open-meteo.com/v1/')
+    WEATHER_STUB_PATH = os.environ.get('WEATHER_STUB_PATH', 'weather_stub.json')  # read by the file provider
+    WEATHER_TIMEOUT_S = float(os.environ.get('WEATHER_TIMEOUT_S', 2.0))
+    # Conditions are cached per geohash cell (precision 5 is about 5 km) and UTC hour
+    WEATHER_GEOHASH_PRECISION = int(os.environ.get('WEATHER_GEOHASH_PRECISION', 5))
+    WEATHER_CACHE_TTL_S = float(os.environ.get('WEATHER_CACHE_TTL_S', 1800))
+    WEATHER_CACHE_SIZE = int(os.environ.get('WEATHER_CACHE_SIZE', 10000))
     
     # Logging settings
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
-    LOG_FILE = os.environ.get('LOG_FILE', 'voltsage.log')
+    LOG_FILE = os.environ.get('LOG_FILE', 'voltsage.log')  # empty logs to stderr
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')  # json or text
+    SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 500))  # requests logged as warnings
+    
+    # Metrics settings (Prometheus text format at /metrics)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True').lower() == 'true'
     
     # Development settings
     HOST = os.environ.get('HOST', '0.0.0.0')
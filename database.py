@@ -0,0 +1,57 @@
+import queue
+import sqlite3
+from contextlib import contextmanager
+from config import Config
+
+def connect(path=None):
+    """Open a SQLite connection tuned for concurrent readers and writers."""
+    conn = sqlite3.connect(
+        path or Config.DATABASE_PATH,
+        timeout=Config.DATABASE_BUSY_TIMEOUT_MS / 1000.0,
+        check_same_thread=False,
+        cached_statements=Config.DATABASE_STATEMENT_CACHE_SIZE
+    )
+    conn.row_factory = sqlite3.Row
+
+    # WAL lets readers proceed while a writer commits; NORMAL skips the fsync per commit
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA cache_size=-{int(Config.DATABASE_CACHE_SIZE_KB)}')
+    conn.execute(f'PRAGMA mmap_size={int(Config.DATABASE_MMAP_SIZE)}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    return conn
+
+class ConnectionPool:
+    """Pool of reusable SQLite connections shared by request threads."""
+
+    def __init__(self, path=None, max_idle=8):
+        self.path = path or Config.DATABASE_PATH
+        self._idle = queue.LifoQueue(maxsize=max_idle)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a with block."""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = connect(self.path)
+
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            # Keep the connection, and its prepared statements, for the next request
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def close(self):
+        """Close every idle connection."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
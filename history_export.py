@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Stream the prediction history as NDJSON or CSV.
+Used by the /api/history/export endpoint and runnable as a command:
+
+    python history_export.py --format csv --start 2024-01-01 --output history.csv
+"""
+
+import argparse
+import csv
+import io
+import json
+import sys
+from config import Config
+from database import connect
+from history_query import HISTORY_COLUMNS, build_filters, parse_fields, parse_timestamp
+from history_shards import shards_between
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+def build_export_query(args, table='predictions'):
+    """Build the export query, oldest first, for the given filter arguments."""
+    fields = parse_fields(args.get('fields'))
+    clauses, params = build_filters(args)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    sql = f'''
+        SELECT {', '.join(fields)} FROM {table}
+        {where}
+        ORDER BY created_at, id
+    '''
+    return sql, params, fields
+
+def _format_ndjson(fields, rows):
+    """Serialize rows as newline delimited JSON objects."""
+    return ''.join(json.dumps(dict(zip(fields, row))) + '\n' for row in rows)
+
+def _format_csv(fields, rows):
+    """Serialize rows as CSV lines."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+def stream_history(args, fmt='ndjson', chunk_size=None, database_path=None):
+    """Yield the matching history as text chunks, holding one chunk of rows at a time.
+
+    Filters are validated before the generator is returned, so a ValueError is
+    raised to the caller rather than in the middle of a stream.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Invalid format. Must be one of: {', '.join(EXPORT_FORMATS)}")
+
+    sql, params, fields = build_export_query(args)
+    start = parse_timestamp(args['start'], 'start') if args.get('start') else None
+    end = parse_timestamp(args['end'], 'end') if args.get('end') else None
+    chunk_size = chunk_size or Config.EXPORT_CHUNK_SIZE
+    formatter = _format_ndjson if fmt == 'ndjson' else _format_csv
+
+    def generate():
+        # A dedicated connection, since the stream outlives any single request handler call
+        conn = connect(database_path)
+        try:
+            if fmt == 'csv':
+                yield _format_csv(fields, [fields])
+            # Shards cover disjoint months, so exporting them in order keeps the history sorted
+            for shard in shards_between(conn, start, end):
+                cursor = conn.execute(build_export_query(args, table=shard)[0], params)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield formatter(fields, [tuple(row) for row in rows])
+        finally:
+            conn.close()
+
+    return generate()
+
+def main(argv=None):
+    """Export the prediction history from the command line."""
+    parser = argparse.ArgumentParser(description='Export VoltSage prediction history.')
+    parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='ndjson')
+    parser.add_argument('--start', help='Only rows created at or after this ISO timestamp')
+    parser.add_argument('--end', help='Only rows created before this ISO timestamp')
+    parser.add_argument('--driving-style', choices=['aggressive', 'moderate', 'eco'])
+    parser.add_argument('--fields', help=f"Comma separated columns ({','.join(HISTORY_COLUMNS)})")
+    parser.add_argument('--database', default=Config.DATABASE_PATH, help='SQLite database path')
+    parser.add_argument('--output', help='Output file (default: stdout)')
+    options = parser.parse_args(argv)
+
+    args = {
+        'start': options.start,
+        'end': options.end,
+        'driving_style': options.driving_style,
+        'fields': options.fields
+    }
+
+    try:
+        chunks = stream_history(args, options.format, database_path=options.database)
+    except ValueError as e:
+        parser.error(str(e))
+
+    output = open(options.output, 'w', newline='') if options.output else sys.stdout
+    try:
+        for chunk in chunks:
+            output.write(chunk)
+    finally:
+        if options.output:
+            output.close()
+
+if __name__ == '__main__':
+    main()
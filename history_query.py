@@ -0,0 +1,131 @@
+import base64
+import json
+from datetime import datetime
+from history_shards import shards_between
+
+# Columns of the predictions table that clients may request
+HISTORY_COLUMNS = ['id', 'temperature', 'wind_speed', 'driving_style', 'cargo_weight', 'predicted_range', 'created_at']
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+def encode_cursor(created_at, row_id):
+    """Encode the keyset position of the last row of a page."""
+    raw = json.dumps([created_at, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor."""
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(created_at), int(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def parse_timestamp(value, name):
+    """Normalize an ISO timestamp to the format stored in created_at."""
+    try:
+        return datetime.fromisoformat(value).isoformat(sep=' ')
+    except ValueError:
+        raise ValueError(f'Invalid timestamp for {name}: {value}')
+
+def parse_fields(value):
+    """Parse a comma separated column projection."""
+    if not value:
+        return list(HISTORY_COLUMNS)
+
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    for field in fields:
+        if field not in HISTORY_COLUMNS:
+            raise ValueError(f'Unknown field: {field}. Must be one of: {", ".join(HISTORY_COLUMNS)}')
+    return fields
+
+def build_filters(args):
+    """Build a WHERE clause and parameters from request arguments."""
+    clauses = []
+    params = []
+
+    driving_style = args.get('driving_style')
+    if driving_style:
+        if driving_style not in ['aggressive', 'moderate', 'eco']:
+            raise ValueError('Invalid driving style. Must be one of: aggressive, moderate, eco')
+        clauses.append('driving_style = ?')
+        params.append(driving_style)
+
+    for name, clause in (('min_temperature', 'temperature >= ?'), ('max_temperature', 'temperature <= ?')):
+        if args.get(name) not in (None, ''):
+            try:
+                params.append(float(args.get(name)))
+            except ValueError:
+                raise ValueError(f'Invalid numeric value for {name}')
+            clauses.append(clause)
+
+    for name, clause in (('start', 'created_at >= ?'), ('end', 'created_at < ?')):
+        if args.get(name):
+            clauses.append(clause)
+            params.append(parse_timestamp(args.get(name), name))
+
+    return clauses, params
+
+def build_history_query(args, table='predictions'):
+    """Build the keyset-paginated history query for the given request arguments.
+
+    Returns the SQL, its parameters, the projected fields and the page size.
+    """
+    fields = parse_fields(args.get('fields'))
+
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('Invalid numeric value for limit')
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+
+    clauses, params = build_filters(args)
+
+    # Continue strictly after the last row of the previous page
+    if args.get('cursor'):
+        created_at, row_id = decode_cursor(args.get('cursor'))
+        clauses.append('(created_at, id) < (?, ?)')
+        params.extend([created_at, row_id])
+
+    # The cursor always needs created_at and id, even when they are not projected
+    columns = list(dict.fromkeys(fields + ['created_at', 'id']))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    sql = f'''
+        SELECT {', '.join(columns)} FROM {table}
+        {where}
+        ORDER BY created_at DESC, id DESC
+        LIMIT ?
+    '''
+    params.append(limit)
+
+    return sql, params, fields, limit
+
+def fetch_history_page(conn, args):
+    """Fetch one page of history, newest first, reading only the shards that can hold it.
+
+    Shards cover disjoint months, so reading them newest first and stopping once the
+    page is full returns the same rows as the query over the predictions view.
+    Returns the rows, the projected fields and the page size.
+    """
+    # Validates the arguments once, before any shard is read
+    _, _, fields, limit = build_history_query(args)
+
+    # Rows continue strictly before the cursor, which bounds created_at from above
+    start = parse_timestamp(args['start'], 'start') if args.get('start') else None
+    end = parse_timestamp(args['end'], 'end') if args.get('end') else None
+    if args.get('cursor'):
+        cursor_created_at = decode_cursor(args.get('cursor'))[0]
+        # The end bound is exclusive, so include the cursor's own month
+        cursor_end = cursor_created_at + '\uffff'
+        end = cursor_end if end is None else min(end, cursor_end)
+
+    rows = []
+    for shard in shards_between(conn, start, end, newest_first=True):
+        sql, params, _, _ = build_history_query(args, table=shard)
+        params[-1] = limit - len(rows)
+        rows.extend(conn.execute(sql, params).fetchall())
+        if len(rows) >= limit:
+            break
+    return rows, fields, limit
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Retention and compaction of the prediction history.
+Monthly shards older than the retention window are written to compressed
+columnar archive files and dropped. Their hourly and daily rollups stay in the
+database, so /api/history/stats still covers archived months at that
+resolution. The database is then analyzed and vacuumed; VACUUM rewrites the
+whole file and blocks writers, so run this offline or at a quiet time:
+
+    python history_retention.py --keep-months 12 --archive-dir archive
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import zipfile
+from datetime import datetime
+import numpy as np
+from config import Config
+from database import connect
+from history_shards import SHARD_COLUMNS, drop_shard, ensure_shards, list_shards, shard_bounds
+
+ARCHIVE_FORMATS = ['npz', 'parquet']
+
+# Shard rows held in memory at a time while writing an archive
+ARCHIVE_CHUNK_ROWS = 50000
+
+# NumPy dtypes of the archived columns
+ARCHIVE_DTYPES = {
+    'id': np.int64,
+    'temperature': np.float64,
+    'wind_speed': np.float64,
+    'driving_style': str,
+    'cargo_weight': np.float64,
+    'predicted_range': np.float64,
+    'created_at': str
+}
+
+def retention_cutoff(keep_months, now=None):
+    """First timestamp kept: the start of the oldest of the keep_months newest months."""
+    if keep_months < 1:
+        raise ValueError('keep_months must be at least 1')
+    now = now or datetime.now()
+    months = now.year * 12 + now.month - 1 - (keep_months - 1)
+    return datetime(months // 12, months % 12 + 1, 1).isoformat(sep=' ')
+
+def expired_shards(conn, keep_months, now=None):
+    """Shards whose whole month is older than the retention window."""
+    cutoff = retention_cutoff(keep_months, now)
+    return [name for name in list_shards(conn) if shard_bounds(name)[1] <= cutoff]
+
+def _chunk_columns(rows, dtypes):
+    """Convert a chunk of shard rows to NumPy columns."""
+    return {
+        column: np.array([row[i] for row in rows], dtype=dtypes[column])
+        for i, column in enumerate(SHARD_COLUMNS)
+    }
+
+def _write_npz(cursor, path, dtypes, chunk_size):
+    """Write the cursor's rows as a compressed npz file, one chunk in memory at a time.
+
+    Each chunk's columns are appended to a raw file per column, which are then
+    copied into the archive behind their .npy headers. Returns the row count.
+    """
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(path) or '.') as spool:
+        raw_paths = {column: os.path.join(spool, column) for column in SHARD_COLUMNS}
+        count = 0
+        raw_files = {column: open(raw_path, 'wb') for column, raw_path in raw_paths.items()}
+        try:
+            for rows in iter(lambda: cursor.fetchmany(chunk_size), []):
+                for column, values in _chunk_columns(rows, dtypes).items():
+                    values.tofile(raw_files[column])
+                count += len(rows)
+        finally:
+            for raw_file in raw_files.values():
+                raw_file.close()
+
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+            for column, raw_path in raw_paths.items():
+                header = {
+                    'descr': np.lib.format.dtype_to_descr(np.dtype(dtypes[column])),
+                    'fortran_order': False,
+                    'shape': (count,)
+                }
+                with archive.open(f'{column}.npy', 'w', force_zip64=True) as member, open(raw_path, 'rb') as raw:
+                    np.lib.format.write_array_header_1_0(member, header)
+                    shutil.copyfileobj(raw, member, 1 << 20)
+    return count
+
+def _write_parquet(cursor, path, dtypes, chunk_size):
+    """Write the cursor's rows as a Parquet file, one row group per chunk. Returns the row count."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Writing Parquet archives requires pyarrow: pip install pyarrow")
+
+    writer = None
+    count = 0
+    try:
+        for rows in iter(lambda: cursor.fetchmany(chunk_size), []):
+            table = pa.table(_chunk_columns(rows, dtypes))
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema, compression='zstd')
+            writer.write_table(table)
+            count += len(rows)
+        if writer is None:
+            pq.write_table(pa.table(_chunk_columns([], dtypes)), path, compression='zstd')
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+def write_archive(cursor, path, fmt, dtypes, chunk_size=ARCHIVE_CHUNK_ROWS):
+    """Write a cursor over shard rows to a compressed columnar file, replacing it atomically.
+
+    Rows are fetched chunk_size at a time, so memory use does not grow with the
+    shard. Returns the number of rows written.
+    """
+    temp_path = f'{path}.tmp'
+    try:
+        if fmt == 'npz':
+            count = _write_npz(cursor, temp_path, dtypes, chunk_size)
+        else:
+            count = _write_parquet(cursor, temp_path, dtypes, chunk_size)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return count
+
+def archive_row_count(path):
+    """Number of rows in an archive, read from its headers without loading the columns."""
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).metadata.num_rows
+    counts = set()
+    with zipfile.ZipFile(path) as archive:
+        for member in archive.namelist():
+            with archive.open(member) as f:
+                np.lib.format.read_magic(f)
+                shape, _, _ = np.lib.format.read_array_header_1_0(f)
+                counts.add(shape[0])
+    if len(counts) != 1:
+        raise ValueError(f'Archive {path} has columns of different lengths')
+    return counts.pop()
+
+def read_archive(path):
+    """Load an archive written by archive_shard as a dict of NumPy columns."""
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        table = pq.read_table(path)
+        return {column: table.column(column).to_numpy() for column in table.column_names}
+    with np.load(path) as data:
+        return {column: data[column] for column in data.files}
+
+def archive_shard(conn, name, archive_dir, fmt='npz', chunk_size=ARCHIVE_CHUNK_ROWS):
+    """Archive a shard to archive_dir and drop it; returns the archive path and row count."""
+    if fmt not in ARCHIVE_FORMATS:
+        raise ValueError(f"Invalid archive format. Must be one of: {', '.join(ARCHIVE_FORMATS)}")
+
+    # Text columns are stored at the width of their longest value in the shard
+    dtypes = dict(ARCHIVE_DTYPES)
+    text_columns = [column for column in SHARD_COLUMNS if dtypes[column] is str]
+    widths = conn.execute(
+        f"SELECT {', '.join(f'MAX(LENGTH({column}))' for column in text_columns)} FROM {name}"
+    ).fetchone()
+    for column, width in zip(text_columns, widths):
+        dtypes[column] = f'<U{max(width or 0, 1)}'
+
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f'{name}.{fmt}')
+    cursor = conn.execute(f"SELECT {', '.join(SHARD_COLUMNS)} FROM {name} ORDER BY created_at, id")
+    count = write_archive(cursor, path, fmt, dtypes, chunk_size)
+
+    # Check the file before dropping the only other copy of the rows
+    expected = conn.execute(f'SELECT COUNT(*) FROM {name}').fetchone()[0]
+    if count != expected or archive_row_count(path) != expected:
+        raise ValueError(f'Archive {path} does not contain all {expected} rows of {name}')
+
+    month_start, month_end = shard_bounds(name)
+    conn.execute('''
+        INSERT OR REPLACE INTO prediction_archives
+            (shard, month_start, month_end, path, format, row_count, archived_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (name, month_start, month_end, path, fmt, count, datetime.now().isoformat(sep=' ')))
+    drop_shard(conn, name)
+    conn.commit()
+    return path, count
+
+def compact_database(conn, vacuum=True):
+    """Refresh the planner statistics and, with vacuum, rewrite the file to release free pages."""
+    conn.execute('ANALYZE')
+    conn.commit()
+    if vacuum:
+        conn.execute('VACUUM')
+        # Truncate the write-ahead log, which VACUUM grows to the size of the database
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+def main(argv=None):
+    """Archive expired shards and compact the database."""
+    parser = argparse.ArgumentParser(description='Archive old VoltSage prediction history and compact the database.')
+    parser.add_argument('--keep-months', type=int, default=Config.HISTORY_RETENTION_MONTHS,
+                        help='Months kept in the database, including the current one')
+    parser.add_argument('--archive-dir', default=Config.HISTORY_ARCHIVE_DIR, help='Directory for archive files')
+    parser.add_argument('--format', choices=ARCHIVE_FORMATS, default=Config.HISTORY_ARCHIVE_FORMAT)
+    parser.add_argument('--database', default=Config.DATABASE_PATH, help='SQLite database path')
+    parser.add_argument('--no-vacuum', action='store_true', help='Only run ANALYZE after archiving')
+    parser.add_argument('--dry-run', action='store_true', help='List the shards that would be archived')
+    options = parser.parse_args(argv)
+
+    if not os.path.exists(options.database):
+        print(f"Database '{options.database}' not found. Run setup_db.py first.")
+        sys.exit(1)
+
+    conn = connect(options.database)
+    try:
+        try:
+            shards = expired_shards(conn, options.keep_months)
+        except ValueError as e:
+            parser.error(str(e))
+
+        if options.dry_run:
+            for name in shards:
+                count = conn.execute(f'SELECT COUNT(*) FROM {name}').fetchone()[0]
+                print(f"Would archive {name} ({count} rows)")
+            print(f"{len(shards)} of {len(list_shards(conn))} shards are older than {options.keep_months} months.")
+            return
+
+        for name in shards:
+            path, count = archive_shard(conn, name, options.archive_dir, options.format)
+            print(f"Archived {name}: {count} rows to {path}")
+
+        # Create next month's shard ahead of its first insert
+        for name in ensure_shards(conn):
+            print(f"Created {name}")
+        conn.commit()
+
+        compact_database(conn, vacuum=not options.no_vacuum)
+        print(f"Archived {len(shards)} shards; {len(list_shards(conn))} remain in '{options.database}'.")
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    main()
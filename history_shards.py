@@ -0,0 +1,192 @@
+"""
+Monthly shards of the prediction history.
+Rows live in one table per calendar month of created_at (predictions_YYYY_MM),
+each with its own indexes, so inserts only touch the current month's B-trees
+and old months can be archived by dropping a table. The predictions view is the
+UNION ALL of every shard for readers that do not route by time themselves.
+"""
+
+from datetime import datetime
+
+SHARD_PREFIX = 'predictions_'
+
+# Matches shard table names in sqlite_master
+SHARD_GLOB = SHARD_PREFIX + '[0-9][0-9][0-9][0-9]_[0-9][0-9]'
+
+SHARD_COLUMNS = ['id', 'temperature', 'wind_speed', 'driving_style', 'cargo_weight', 'predicted_range', 'created_at']
+
+def shard_name(created_at):
+    """Shard holding a created_at timestamp (a datetime or a stored string)."""
+    return SHARD_PREFIX + str(created_at)[:7].replace('-', '_')
+
+def shard_bounds(name):
+    """First timestamp of a shard's month and of the next month, as stored strings."""
+    year, month = int(name[-7:-3]), int(name[-2:])
+    start = datetime(year, month, 1)
+    end = datetime(year + month // 12, month % 12 + 1, 1)
+    return start.isoformat(sep=' '), end.isoformat(sep=' ')
+
+def list_shards(conn):
+    """Names of the shard tables, oldest first."""
+    rows = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ? ORDER BY name",
+        (SHARD_GLOB,)
+    ).fetchall()
+    return [row[0] for row in rows]
+
+def shards_between(conn, start=None, end=None, newest_first=False):
+    """Shards that can hold rows with start <= created_at < end (either bound optional)."""
+    shards = []
+    for name in list_shards(conn):
+        month_start, month_end = shard_bounds(name)
+        if (start is None or month_end > start) and (end is None or month_start < end):
+            shards.append(name)
+    return shards[::-1] if newest_first else shards
+
+def create_shard(conn, name):
+    """Create a shard table with the history indexes."""
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY,
+            temperature REAL NOT NULL,
+            wind_speed REAL NOT NULL,
+            driving_style TEXT NOT NULL,
+            cargo_weight REAL NOT NULL,
+            predicted_range REAL NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Same indexes as the single table had: filtered scans and covered time-ordered scans
+    conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{name}_style_created_at ON {name}(driving_style, created_at)')
+    conn.execute(f'''
+        CREATE INDEX IF NOT EXISTS idx_{name}_created_at_cover
+        ON {name}(created_at, driving_style, temperature, predicted_range)
+    ''')
+
+def rebuild_view(conn):
+    """Point the predictions view at the current set of shards."""
+    columns = ', '.join(SHARD_COLUMNS)
+    selects = [f'SELECT {columns} FROM {name}' for name in list_shards(conn)]
+    if not selects:
+        selects = ['SELECT ' + ', '.join(f'NULL AS {column}' for column in SHARD_COLUMNS) + ' WHERE 0']
+    conn.execute('DROP VIEW IF EXISTS predictions')
+    conn.execute(f"CREATE VIEW predictions AS {' UNION ALL '.join(selects)}")
+
+def ensure_shards(conn, now=None, months_ahead=1):
+    """Create the shards of the current and the next months_ahead months. The caller commits.
+
+    Run from setup and the retention job, so the first insert of a month
+    normally finds its shard already in place. Returns the created shards.
+    """
+    now = now or datetime.now()
+    existing = set(list_shards(conn))
+    created = []
+    for ahead in range(months_ahead + 1):
+        months = now.year * 12 + now.month - 1 + ahead
+        name = shard_name(f'{months // 12:04d}-{months % 12 + 1:02d}')
+        if name not in existing:
+            create_shard(conn, name)
+            created.append(name)
+    if created:
+        rebuild_view(conn)
+    return created
+
+def drop_shard(conn, name):
+    """Drop a shard and remove it from the predictions view. The caller commits."""
+    conn.execute(f'DROP TABLE IF EXISTS {name}')
+    rebuild_view(conn)
+
+def create_archive_catalog(conn):
+    """Create the table recording archived shards."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS prediction_archives (
+            shard TEXT PRIMARY KEY,
+            month_start TEXT NOT NULL,
+            month_end TEXT NOT NULL,
+            path TEXT NOT NULL,
+            format TEXT NOT NULL,
+            row_count INTEGER NOT NULL,
+            archived_at TEXT NOT NULL
+        )
+    ''')
+
+def archived_until(conn):
+    """End of the newest archived month, or None when nothing has been archived."""
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'prediction_archives'").fetchone() is None:
+        return None
+    return conn.execute('SELECT MAX(month_end) FROM prediction_archives').fetchone()[0]
+
+def insert_predictions(conn, rows):
+    """Insert prediction rows into their monthly shards. The caller commits.
+
+    rows are (temperature, wind_speed, driving_style, cargo_weight, predicted_range,
+    created_at) tuples. Ids come from one sequence, so they stay unique across shards.
+    """
+    by_shard = {}
+    for row in rows:
+        by_shard.setdefault(shard_name(row[5]), []).append(row)
+
+    # Take the write lock before checking for the shards, so a month's first insert
+    # creates its shard and rebuilds the view in the same transaction as the rows,
+    # and a concurrent writer waits instead of racing on the DDL
+    if not conn.in_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+    existing = set(list_shards(conn))
+    missing = [name for name in by_shard if name not in existing]
+    for name in missing:
+        create_shard(conn, name)
+    if missing:
+        rebuild_view(conn)
+
+    # Reserve the ids first; under the write lock the read is consistent
+    conn.execute('UPDATE prediction_sequence SET next_id = next_id + ?', (len(rows),))
+    next_id = conn.execute('SELECT next_id FROM prediction_sequence').fetchone()[0] - len(rows)
+
+    for name, shard_rows in by_shard.items():
+        conn.executemany(
+            f'''INSERT INTO {name} (id, temperature, wind_speed, driving_style, cargo_weight,
+                                     predicted_range, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)''',
+            [(next_id + i,) + tuple(row) for i, row in enumerate(shard_rows)]
+        )
+        next_id += len(shard_rows)
+
+def shard_predictions_table(conn):
+    """Move the rows of a single predictions table into monthly shards.
+
+    Ids are kept, and the table is replaced by the predictions view.
+    """
+    conn.execute('CREATE TABLE IF NOT EXISTS prediction_sequence (next_id INTEGER NOT NULL)')
+    create_archive_catalog(conn)
+    table = conn.execute("SELECT type FROM sqlite_master WHERE name = 'predictions'").fetchone()
+    last_id = 0
+    if table is not None and table[0] == 'table':
+        # AUTOINCREMENT never reused the ids of deleted rows, so neither does the sequence
+        last_id = conn.execute('''
+            SELECT MAX(COALESCE((SELECT MAX(id) FROM predictions), 0),
+                       COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'predictions'), 0))
+        ''').fetchone()[0]
+        months = [row[0] for row in conn.execute('''
+            SELECT DISTINCT substr(created_at, 1, 7) FROM predictions
+            WHERE created_at GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-*'
+        ''')]
+        for month in months:
+            name = shard_name(month)
+            create_shard(conn, name)
+            start, end = shard_bounds(name)
+            conn.execute(f'''
+                INSERT INTO {name} ({', '.join(SHARD_COLUMNS)})
+                SELECT {', '.join(SHARD_COLUMNS)} FROM predictions
+                WHERE created_at >= ? AND created_at < ?
+            ''', (start, end))
+
+        # Rows whose created_at is not a timestamp would not fall in any month
+        total = conn.execute('SELECT COUNT(*) FROM predictions').fetchone()[0]
+        moved = sum(conn.execute(f'SELECT COUNT(*) FROM {shard_name(month)}').fetchone()[0] for month in months)
+        if moved != total:
+            raise ValueError(f'Only {moved} of {total} predictions have a valid created_at; not sharding')
+        conn.execute('DROP TABLE predictions')
+
+    if conn.execute('SELECT COUNT(*) FROM prediction_sequence').fetchone()[0] == 0:
+        conn.execute('INSERT INTO prediction_sequence (next_id) VALUES (?)', (last_id + 1,))
+    rebuild_view(conn)
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Incrementally maintained rollups of the prediction history.
+Every batch of inserted predictions updates per-hour and per-day aggregates and
+range histograms, so statistics over all history never scan the predictions table.
+Run this module with --rebuild to recompute the rollups from scratch:
+
+    python history_stats.py --rebuild
+"""
+
+import math
+import sys
+from datetime import datetime, timedelta
+from config import Config
+from database import connect
+from history_query import parse_timestamp
+from history_shards import archived_until
+from models.range_predictor import DRIVING_STYLES
+
+# Rollup granularities and the created_at prefix that identifies their bucket
+ROLLUP_PERIODS = {
+    'hour': (13, ':00:00'),
+    'day': (10, ' 00:00:00')
+}
+
+GROUP_BY_OPTIONS = ['driving_style', 'hour', 'day']
+DEFAULT_PERCENTILES = [10, 50, 90]
+
+UPSERT_ROLLUP_SQL = '''
+    INSERT INTO prediction_rollups (period, bucket, driving_style, count, range_sum, range_min, range_max)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (period, bucket, driving_style) DO UPDATE SET
+        count = count + excluded.count,
+        range_sum = range_sum + excluded.range_sum,
+        range_min = MIN(range_min, excluded.range_min),
+        range_max = MAX(range_max, excluded.range_max)
+'''
+
+UPSERT_HISTOGRAM_SQL = '''
+    INSERT INTO prediction_range_histogram (period, bucket, driving_style, range_bin, count)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (period, bucket, driving_style, range_bin) DO UPDATE SET
+        count = count + excluded.count
+'''
+
+def create_rollup_tables(conn):
+    """Create the rollup tables if they do not exist."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS prediction_rollups (
+            period TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            driving_style TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            range_sum REAL NOT NULL,
+            range_min REAL NOT NULL,
+            range_max REAL NOT NULL,
+            PRIMARY KEY (period, bucket, driving_style)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS prediction_range_histogram (
+            period TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            driving_style TEXT NOT NULL,
+            range_bin INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (period, bucket, driving_style, range_bin)
+        ) WITHOUT ROWID
+    ''')
+
+def update_rollups(conn, rows, bin_width=None):
+    """Fold newly inserted prediction rows into the rollups.
+
+    rows use the predictions insert order (temperature, wind_speed, driving_style,
+    cargo_weight, predicted_range, created_at). The caller commits.
+    """
+    bin_width = bin_width or Config.STATS_HISTOGRAM_BIN_KM
+    rollups = {}
+    histogram = {}
+
+    # Aggregate the batch in memory so each bucket is upserted once
+    for row in rows:
+        driving_style, predicted_range, created_at = row[2], row[4], str(row[5])
+        range_bin = math.floor(predicted_range / bin_width)
+
+        for period, (length, suffix) in ROLLUP_PERIODS.items():
+            key = (period, created_at[:length] + suffix, driving_style)
+            aggregate = rollups.get(key)
+            if aggregate is None:
+                rollups[key] = [1, predicted_range, predicted_range, predicted_range]
+            else:
+                aggregate[0] += 1
+                aggregate[1] += predicted_range
+                aggregate[2] = min(aggregate[2], predicted_range)
+                aggregate[3] = max(aggregate[3], predicted_range)
+
+            histogram_key = key + (range_bin,)
+            histogram[histogram_key] = histogram.get(histogram_key, 0) + 1
+
+    conn.executemany(UPSERT_ROLLUP_SQL, [key + tuple(value) for key, value in rollups.items()])
+    conn.executemany(UPSERT_HISTOGRAM_SQL, [key + (count,) for key, count in histogram.items()])
+
+def rebuild_rollups(conn, bin_width=None):
+    """Recompute every rollup from the predictions table.
+
+    Used to backfill existing databases and after changing STATS_HISTOGRAM_BIN_KM.
+    Rollups of archived months are kept as they are, since their rows are gone.
+    """
+    bin_width = bin_width or Config.STATS_HISTOGRAM_BIN_KM
+    kept_until = archived_until(conn) or ''
+    conn.execute('DELETE FROM prediction_rollups WHERE bucket >= ?', (kept_until,))
+    conn.execute('DELETE FROM prediction_range_histogram WHERE bucket >= ?', (kept_until,))
+
+    for period, (length, suffix) in ROLLUP_PERIODS.items():
+        bucket = f"substr(created_at, 1, {length}) || '{suffix}'"
+        conn.execute(f'''
+            INSERT INTO prediction_rollups (period, bucket, driving_style, count, range_sum, range_min, range_max)
+            SELECT ?, {bucket}, driving_style, COUNT(*), SUM(predicted_range),
+                   MIN(predicted_range), MAX(predicted_range)
+            FROM predictions
+            GROUP BY {bucket}, driving_style
+        ''', (period,))
+        # Predicted ranges are positive, so truncating matches math.floor in update_rollups
+        conn.execute(f'''
+            INSERT INTO prediction_range_histogram (period, bucket, driving_style, range_bin, count)
+            SELECT ?, {bucket}, driving_style, CAST(predicted_range / ? AS INTEGER) AS range_bin, COUNT(*)
+            FROM predictions
+            GROUP BY {bucket}, driving_style, range_bin
+        ''', (period, bin_width))
+
+def _parse_group_by(value):
+    """Parse a comma separated group_by argument."""
+    group_by = [column.strip() for column in (value or '').split(',') if column.strip()]
+    for column in group_by:
+        if column not in GROUP_BY_OPTIONS:
+            raise ValueError(f"Invalid group_by: {column}. Must be one of: {', '.join(GROUP_BY_OPTIONS)}")
+    if 'hour' in group_by and 'day' in group_by:
+        raise ValueError('Cannot group by both hour and day')
+    return group_by
+
+def _parse_percentiles(value):
+    """Parse a comma separated list of percentiles."""
+    if not value:
+        return list(DEFAULT_PERCENTILES)
+    try:
+        percentiles = [float(p) for p in value.split(',')]
+    except ValueError:
+        raise ValueError('Invalid numeric value for percentiles')
+    if any(not 0 <= p <= 100 for p in percentiles):
+        raise ValueError('Percentiles must be between 0 and 100')
+    return percentiles
+
+def _parse_bound(value, name, period, round_up):
+    """Parse a start or end argument and round it to a bucket of the queried period.
+
+    The rollups resolve whole hours (or days), so start is floored and end is
+    ceiled to the bucket: the bounds cover every bucket they touch.
+    """
+    timestamp = datetime.fromisoformat(parse_timestamp(value, name))
+    bucket = timestamp.replace(minute=0, second=0, microsecond=0)
+    step = timedelta(hours=1)
+    if period == 'day':
+        bucket = bucket.replace(hour=0)
+        step = timedelta(days=1)
+    if round_up and bucket != timestamp:
+        bucket += step
+    return bucket.isoformat(sep=' ')
+
+def _percentile(histogram, total, percentile, bin_width, lower, upper):
+    """Interpolate a percentile from sorted (range_bin, count) pairs."""
+    target = percentile / 100.0 * total
+    seen = 0
+    for range_bin, count in histogram:
+        if seen + count >= target:
+            value = (range_bin + (target - seen) / count) * bin_width
+            return min(max(value, lower), upper)
+        seen += count
+    return upper
+
+def _percentile_key(percentile):
+    """Response key for a percentile, e.g. p90 or p99.9."""
+    return f"p{percentile:g}"
+
+def query_stats(conn, args, bin_width=None):
+    """Aggregate the rollups according to request arguments."""
+    bin_width = bin_width or Config.STATS_HISTOGRAM_BIN_KM
+    group_by = _parse_group_by(args.get('group_by', 'driving_style'))
+    percentiles = _parse_percentiles(args.get('percentiles'))
+
+    # Hourly rollups are needed for hour groups and for time bounds finer than a day
+    bounded = args.get('start') or args.get('end')
+    period = 'day' if 'day' in group_by or not ('hour' in group_by or bounded) else 'hour'
+    start = _parse_bound(args['start'], 'start', period, round_up=False) if args.get('start') else None
+    end = _parse_bound(args['end'], 'end', period, round_up=True) if args.get('end') else None
+
+    driving_style = args.get('driving_style')
+    if driving_style and driving_style not in DRIVING_STYLES:
+        raise ValueError(f"Invalid driving style. Must be one of: {', '.join(DRIVING_STYLES)}")
+
+    clauses = ['period = ?']
+    params = [period]
+    if driving_style:
+        clauses.append('driving_style = ?')
+        params.append(driving_style)
+    if start:
+        clauses.append('bucket >= ?')
+        params.append(start)
+    if end:
+        clauses.append('bucket < ?')
+        params.append(end)
+    where = ' AND '.join(clauses)
+
+    columns = ['driving_style' if column == 'driving_style' else 'bucket' for column in group_by]
+    select = ''.join(f'{column}, ' for column in columns)
+    group = f"GROUP BY {', '.join(columns)}" if columns else ''
+
+    summaries = conn.execute(f'''
+        SELECT {select}SUM(count), SUM(range_sum), MIN(range_min), MAX(range_max)
+        FROM prediction_rollups
+        WHERE {where}
+        {group}
+        ORDER BY {', '.join(columns) or 1}
+    ''', params).fetchall()
+
+    histograms = {}
+    for row in conn.execute(f'''
+        SELECT {select}range_bin, SUM(count)
+        FROM prediction_range_histogram
+        WHERE {where}
+        {group}{', ' if columns else 'GROUP BY '}range_bin
+        ORDER BY {''.join(f'{column}, ' for column in columns)}range_bin
+    ''', params):
+        histograms.setdefault(tuple(row[:len(columns)]), []).append((row[-2], row[-1]))
+
+    groups = []
+    for row in summaries:
+        key = tuple(row[:len(columns)])
+        count, range_sum, range_min, range_max = row[len(columns):]
+        if not count:
+            continue
+
+        group = dict(zip(group_by, key))
+        group.update({
+            'count': count,
+            'mean': range_sum / count,
+            'min': range_min,
+            'max': range_max
+        })
+        for percentile in percentiles:
+            group[_percentile_key(percentile)] = _percentile(
+                histograms.get(key, []), count, percentile, bin_width, range_min, range_max
+            )
+        groups.append(group)
+
+    return {
+        'group_by': group_by,
+        'period': period,
+        'histogram_bin_km': bin_width,
+        'start': start,
+        'end': end,
+        'groups': groups
+    }
+
+def main():
+    """Rebuild the rollups of the configured database."""
+    if '--rebuild' not in sys.argv[1:]:
+        print("Usage: python history_stats.py --rebuild")
+        sys.exit(1)
+
+    conn = connect(Config.DATABASE_PATH)
+    rebuild_rollups(conn)
+    conn.commit()
+    conn.close()
+    print(f"Rebuilt prediction rollups in '{Config.DATABASE_PATH}'.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+import logging
+import queue
+import threading
+import time
+from history_shards import insert_predictions
+from log_config import LOGGER_NAME
+
+logger = logging.getLogger(f'{LOGGER_NAME}.history')
+
+# Queue marker asking the writer thread to exit
+_STOP = object()
+
+class HistoryWriter:
+    """Background thread that group-commits prediction history rows."""
+
+    def __init__(self, connect, max_queue_size=10000, batch_size=100, flush_interval=0.05,
+                 after_insert=None, metrics=None, retry_interval=1.0):
+        self.connect = connect
+        # Seconds to wait before opening the connection again after it failed
+        self.retry_interval = retry_interval
+        # Called with (conn, batch) inside each batch's transaction
+        self.after_insert = after_insert
+        # Histogram timing each batch's insert and commit, or None
+        self.metrics = metrics
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = None
+        self._closing = threading.Event()
+        self._lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.connect_errors = 0
+
+    def start(self):
+        """Start the writer thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, rows):
+        """Queue history rows without blocking; returns the number of rows dropped."""
+        dropped = 0
+        for row in rows:
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                dropped += 1
+
+        if dropped:
+            with self._lock:
+                self.dropped += dropped
+        return dropped
+
+    def flush(self):
+        """Block until every queued row has been committed.
+
+        Without a running writer thread (never started, closed or died) the queued
+        rows are written on the calling thread instead of waiting forever.
+        """
+        pending = self._queue.all_tasks_done
+        with pending:
+            while self._queue.unfinished_tasks and self._writer_alive():
+                pending.wait(0.1)
+        if not self._writer_alive():
+            self._write_queued()
+
+    def close(self, timeout=5.0):
+        """Write the remaining rows and stop the writer thread.
+
+        Gives up after about timeout seconds each for queueing the stop marker
+        and for the thread to finish, so a stuck writer cannot hang shutdown.
+        """
+        if self._thread is None:
+            return
+
+        self._closing.set()
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.warning('History writer queue still full at shutdown; %d rows not written',
+                           self._queue.qsize())
+            return
+
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning('History writer did not finish within %gs; %d rows not written',
+                           timeout, self._queue.qsize())
+            return
+        self._thread = None
+
+    def stats(self):
+        """Return queue depth and write counters."""
+        with self._lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'queue_capacity': self._queue.maxsize,
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'batches': self.batches,
+                'connect_errors': self.connect_errors
+            }
+
+    def _writer_alive(self):
+        """Whether the writer thread is running."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def _write_queued(self):
+        """Write every queued row on the calling thread."""
+        batch = self._drain()
+        if not batch:
+            return
+        conn = self._open()
+        if conn is None:
+            self._discard(batch)
+            return
+        try:
+            self._write(conn, batch)
+        finally:
+            conn.close()
+
+    def _next_batch(self):
+        """Collect up to batch_size rows, waiting at most flush_interval after the first."""
+        first = self._queue.get()
+        if first is _STOP:
+            return None, True
+
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                row = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if row is _STOP:
+                return batch, True
+            batch.append(row)
+        return batch, False
+
+    def _drain(self):
+        """Collect every row still queued at shutdown."""
+        batch = []
+        while True:
+            try:
+                row = self._queue.get_nowait()
+            except queue.Empty:
+                return batch
+            if row is not _STOP:
+                batch.append(row)
+            else:
+                self._queue.task_done()
+
+    def _write(self, conn, batch):
+        """Insert a batch in one transaction."""
+        try:
+            start = time.perf_counter()
+            insert_predictions(conn, batch)
+            if self.after_insert is not None:
+                self.after_insert(conn, batch)
+            conn.commit()
+            if self.metrics is not None:
+                self.metrics.observe(time.perf_counter() - start)
+            with self._lock:
+                self.written += len(batch)
+                self.batches += 1
+        except Exception:
+            conn.rollback()
+            with self._lock:
+                self.failed += len(batch)
+            logger.exception('Error writing %d prediction history rows', len(batch))
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    def _open(self):
+        """Open the thread's connection, or return None after counting the error."""
+        try:
+            return self.connect()
+        except Exception:
+            with self._lock:
+                self.connect_errors += 1
+            logger.exception('Error opening the prediction history database')
+            return None
+
+    def _discard(self, batch):
+        """Count a batch that could not be written as failed."""
+        with self._lock:
+            self.failed += len(batch)
+        for _ in batch:
+            self._queue.task_done()
+
+    def _run(self):
+        """Writer thread main loop."""
+        # SQLite connections must be used from the thread that opened them, so the
+        # thread opens its own and retries while the database is unavailable
+        conn = None
+        try:
+            while True:
+                batch, stopping = self._next_batch()
+                if stopping:
+                    batch = (batch or []) + self._drain()
+
+                if batch and conn is None:
+                    conn = self._open()
+                if batch and conn is None:
+                    self._discard(batch)
+                    # Pause before the next attempt, unless shutting down
+                    if not stopping:
+                        self._closing.wait(self.retry_interval)
+                elif batch:
+                    self._write(conn, batch)
+
+                if stopping:
+                    self._queue.task_done()
+                    return
+        finally:
+            if conn is not None:
+                conn.close()
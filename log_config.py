@@ -0,0 +1,61 @@
+import json
+import logging
+import sys
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+
+# Logger used by the app; modules log through children of it
+LOGGER_NAME = 'voltsage'
+
+LOG_FORMATS = ['json', 'text']
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the fields passed as extra={'fields': {...}}."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines with the extra fields appended as key=value pairs."""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        return line
+
+def configure_logging(level='INFO', log_file='', log_format='json'):
+    """Send the app's log records to log_file (stderr when empty) at level.
+
+    Replaces handlers from an earlier call, so reconfiguring does not duplicate output.
+    """
+    if log_format not in LOG_FORMATS:
+        raise ValueError(f"Unknown log format '{log_format}'. Choose one of: {', '.join(LOG_FORMATS)}")
+
+    if log_file:
+        handler = RotatingFileHandler(log_file, maxBytes=10240000, backupCount=10, delay=True)
+    else:
+        handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if log_format == 'json' else TextFormatter())
+
+    logger = logging.getLogger(LOGGER_NAME)
+    for old in list(logger.handlers):
+        logger.removeHandler(old)
+        old.close()
+    logger.addHandler(handler)
+    logger.setLevel(level.upper())
+    logger.propagate = False
+    return logger
@@ -0,0 +1,170 @@
+import math
+import os
+import threading
+import time
+
+# Inputs every replacement model must predict sensibly before it is swapped in
+SMOKE_CASES = [
+    (20.0, 10.0, 'moderate', 100.0),
+    (-30.0, 80.0, 'aggressive', 900.0),
+    (45.0, 0.0, 'eco', 0.0),
+    (0.0, 30.0, 'eco', 500.0),
+    (35.0, 50.0, 'aggressive', 250.0)
+]
+
+# Plausible predicted range in km
+SMOKE_RANGE = (0.0, 1000.0)
+
+def smoke_test(predictor, cases=SMOKE_CASES):
+    """Raise ValueError unless the predictor gives plausible single and batch predictions."""
+    predictions = list(predictor.predict_batch(*zip(*cases)))
+    predictions += [predictor.predict_range(*case) for case in cases]
+
+    for case, predicted_range in zip(cases + cases, predictions):
+        if not (math.isfinite(predicted_range) and SMOKE_RANGE[0] < predicted_range <= SMOKE_RANGE[1]):
+            raise ValueError(f"Implausible prediction {predicted_range} for {case}")
+
+class ModelReloader:
+    """Loads a replacement model in the background and swaps it in once it passes a smoke test.
+
+    create(load=False) returns an unloaded predictor and swap(predictor, seconds)
+    makes it the active one. Requests already holding the old predictor finish on it.
+    """
+
+    def __init__(self, create, swap, watch_path=None, poll_interval=5.0):
+        self.create = create
+        self.swap = swap
+        self.watch_path = watch_path
+        self.poll_interval = poll_interval
+
+        self._reload_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._stop = threading.Event()
+        self._file_state = None
+        self.reloads = 0
+        self.failures = 0
+        self.last_reload = None
+        self.last_error = None
+        self.last_seconds = None
+
+    def reload(self, retrain=False):
+        """Load (or retrain) and swap in a new model; returns False if a reload is already running.
+
+        Raises the load or smoke test error, leaving the active model in place.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        self._reload(retrain)
+        return True
+
+    def reload_in_background(self, retrain=False):
+        """Start a reload in a thread; returns False if a reload is already running."""
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+
+        def run():
+            try:
+                self._reload(retrain)
+            except Exception:
+                pass
+
+        threading.Thread(target=run, name='model-reload', daemon=True).start()
+        return True
+
+    def _reload(self, retrain):
+        """Build, check and swap in a new predictor, releasing the reload lock when done."""
+        try:
+            start = time.perf_counter()
+            predictor = self.create(load=False)
+            if retrain:
+                # Only a model that passes the smoke test replaces the file on disk
+                predictor.train_model(save=False)
+                smoke_test(predictor)
+                predictor.save_model()
+            else:
+                predictor.load_model(train_on_error=False)
+            smoke_test(predictor)
+            seconds = time.perf_counter() - start
+
+            self.swap(predictor, seconds)
+            with self._lock:
+                self.reloads += 1
+                self.last_reload = time.time()
+                self.last_error = None
+                self.last_seconds = seconds
+            print(f"Model reloaded from {predictor.model_path} in {seconds:.2f}s")
+        except Exception as e:
+            with self._lock:
+                self.failures += 1
+                self.last_error = str(e)
+            print(f"Error reloading model, keeping the current one: {e}")
+            raise
+        finally:
+            # Our own retrain rewrites the watched file; do not reload it a second time
+            self._file_state = self._read_file_state()
+            self._reload_lock.release()
+
+    @property
+    def reloading(self):
+        """Whether a reload is in progress."""
+        return self._reload_lock.locked()
+
+    def start_watching(self):
+        """Reload whenever the watched model file changes."""
+        if self._watcher is None and self.watch_path:
+            self._file_state = self._read_file_state()
+            self._watcher = threading.Thread(target=self._watch, name='model-watcher', daemon=True)
+            self._watcher.start()
+
+    def stop_watching(self):
+        """Stop the file watcher thread."""
+        if self._watcher is not None:
+            self._stop.set()
+            self._watcher.join()
+            self._watcher = None
+            self._stop.clear()
+
+    def stats(self):
+        """Return reload counters and the outcome of the last attempt."""
+        with self._lock:
+            return {
+                'reloading': self.reloading,
+                'watching': self._watcher is not None,
+                'reloads': self.reloads,
+                'failures': self.failures,
+                'last_reload': self.last_reload,
+                'last_seconds': self.last_seconds,
+                'last_error': self.last_error
+            }
+
+    def _read_file_state(self):
+        """Modification time and size of the watched file, or None if it is missing."""
+        if not self.watch_path:
+            return None
+        try:
+            stat = os.stat(self.watch_path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _watch(self):
+        """Watcher thread main loop."""
+        pending = None
+        while not self._stop.wait(self.poll_interval):
+            state = self._read_file_state()
+            if state is None or state == self._file_state:
+                pending = None
+                continue
+
+            # Wait until the file is unchanged for a full interval, so a copy in progress is not loaded
+            if state != pending:
+                pending = state
+                continue
+
+            pending = None
+            try:
+                self.reload()
+            except Exception:
+                # Do not retry the same broken file on every poll
+                self._file_state = state
@@ -0,0 +1,225 @@
+import bisect
+import math
+import numpy as np
+
+# Numeric axes of the surrogate, in the order of the first three feature columns
+COMPACT_AXES = ['temperature', 'wind_speed', 'cargo_weight']
+
+# Default number of knots per axis
+DEFAULT_KNOTS = (19, 11, 11)
+
+# Pairs of axes with a bilinear interaction term, and the evenly spaced knots per axis of its grid
+INTERACTION_PAIRS = ((0, 1), (0, 2), (1, 2))
+DEFAULT_PAIR_KNOTS = 7
+
+class CompactModel:
+    """Per-driving-style piecewise-linear surrogate of the forest.
+
+    log(range) is the sum of one piecewise-linear function per numeric feature plus one
+    coarse bilinear function per pair of features, with separate knot values for every
+    style. Predictions are clipped to the range of the forest's leaf values, and inputs
+    outside the knots are clamped to the end knots, so the model only needs NumPy (or
+    plain Python for single rows). Without pair_knots the model is purely additive.
+    """
+
+    def __init__(self, knots, coefficients, styles, lower, upper, signature='',
+                 max_error=None, mean_error=None, p99_error=None, pair_knots=None):
+        self.knots = [np.asarray(axis_knots, dtype=np.float64) for axis_knots in knots]
+        self.pair_knots = (None if pair_knots is None else
+                           [np.asarray(axis_knots, dtype=np.float64) for axis_knots in pair_knots])
+        # One row of knot values per style, indexed by the label encoder's style code
+        self.coefficients = np.asarray(coefficients, dtype=np.float64)
+        self.styles = list(styles)
+        self.lower = float(lower)
+        self.upper = float(upper)
+        self.signature = signature
+        self.max_error = max_error
+        self.mean_error = mean_error
+        self.p99_error = p99_error
+
+        # Column of each axis's first knot in a coefficient row
+        self._offsets = np.cumsum([0] + [len(axis_knots) for axis_knots in self.knots[:-1]]).tolist()
+
+        # Column of each interaction grid's first cell, after the per-axis knots
+        self._pairs = []
+        if self.pair_knots is not None:
+            offset = sum(len(axis_knots) for axis_knots in self.knots)
+            for a, b in INTERACTION_PAIRS:
+                self._pairs.append((a, b, offset))
+                offset += len(self.pair_knots[a]) * len(self.pair_knots[b])
+
+        # Plain lists for the single-row path, which is faster than NumPy scalars
+        self._knot_lists = [axis_knots.tolist() for axis_knots in self.knots]
+        self._pair_knot_lists = ([] if self.pair_knots is None else
+                                 [axis_knots.tolist() for axis_knots in self.pair_knots])
+        self._coefficient_lists = self.coefficients.tolist()
+
+    @property
+    def n_parameters(self):
+        """Number of fitted knot values."""
+        return self.coefficients.size
+
+    @staticmethod
+    def place_knots(thresholds, low, high, count):
+        """Knots at quantiles of the forest's split thresholds on one feature.
+
+        The forest splits most often where the range changes fastest, so the
+        surrogate gets its resolution there. Falls back to even spacing.
+        """
+        thresholds = np.asarray(thresholds, dtype=np.float64)
+        thresholds = thresholds[(thresholds > low) & (thresholds < high)]
+        if len(thresholds) == 0:
+            return np.linspace(low, high, count)
+
+        inner = np.quantile(thresholds, np.linspace(0, 1, count)[1:-1])
+        return np.unique(np.concatenate([[low], inner, [high]]))
+
+    @staticmethod
+    def n_columns(knots, pair_knots=None):
+        """Number of knot values per style for the given per-axis and interaction knots."""
+        columns = sum(len(axis_knots) for axis_knots in knots)
+        if pair_knots is not None:
+            columns += sum(len(pair_knots[a]) * len(pair_knots[b]) for a, b in INTERACTION_PAIRS)
+        return columns
+
+    @classmethod
+    def fit(cls, predict_matrix, input_ranges, knots, styles, bounds, signature='',
+            n_samples=40000, seed=0, pair_knots=None):
+        """Fit the surrogate to predict_matrix on random points covering input_ranges.
+
+        bounds are the smallest and largest range the forest can predict.
+        """
+        rng = np.random.default_rng(seed)
+        model = cls(knots, np.zeros((len(styles), cls.n_columns(knots, pair_knots))), styles,
+                    bounds[0], bounds[1], signature, pair_knots=pair_knots)
+
+        for style_code in range(len(styles)):
+            X = np.empty((n_samples, len(COMPACT_AXES) + 1), dtype=np.float64)
+            for axis, name in enumerate(COMPACT_AXES):
+                X[:, axis] = rng.uniform(*input_ranges[name], n_samples)
+            X[:, 3] = style_code
+
+            # Least squares on the log of the forest's predictions
+            basis = model._basis(X)
+            target = np.log(np.maximum(predict_matrix(X), 1e-9))
+            model.coefficients[style_code] = np.linalg.lstsq(basis, target, rcond=None)[0]
+
+        model._coefficient_lists = model.coefficients.tolist()
+        return model
+
+    def evaluate_error(self, predict_matrix, input_ranges, n_samples=20000, seed=1):
+        """Measure the error against predict_matrix on fresh random points."""
+        rng = np.random.default_rng(seed)
+        X = np.empty((n_samples, len(COMPACT_AXES) + 1), dtype=np.float64)
+        for axis, name in enumerate(COMPACT_AXES):
+            X[:, axis] = rng.uniform(*input_ranges[name], n_samples)
+        X[:, 3] = rng.integers(0, len(self.styles), n_samples)
+
+        errors = np.abs(self.predict_matrix(X) - predict_matrix(X))
+        self.max_error = float(errors.max())
+        self.mean_error = float(errors.mean())
+        self.p99_error = float(np.percentile(errors, 99))
+        return self.max_error
+
+    def _basis(self, X):
+        """Piecewise-linear (hat function) weights of every row on every knot."""
+        rows = np.arange(len(X))
+        basis = np.zeros((len(X), self.coefficients.shape[1]), dtype=np.float64)
+        for axis, (axis_knots, offset) in enumerate(zip(self.knots, self._offsets)):
+            index, fraction = self._locate(X[:, axis], axis_knots)
+            basis[rows, offset + index] = 1 - fraction
+            basis[rows, offset + index + 1] = fraction
+        for a, b, offset in self._pairs:
+            width = len(self.pair_knots[b])
+            index_a, fraction_a = self._locate(X[:, a], self.pair_knots[a])
+            index_b, fraction_b = self._locate(X[:, b], self.pair_knots[b])
+            for step_a, weight_a in ((0, 1 - fraction_a), (1, fraction_a)):
+                for step_b, weight_b in ((0, 1 - fraction_b), (1, fraction_b)):
+                    cell = offset + (index_a + step_a) * width + index_b + step_b
+                    basis[rows, cell] += weight_a * weight_b
+        return basis
+
+    @staticmethod
+    def _locate(x, axis_knots):
+        """Segment index and position within it, clamped to the end knots."""
+        index = np.clip(np.searchsorted(axis_knots, x, side='right') - 1, 0, len(axis_knots) - 2)
+        fraction = np.clip((x - axis_knots[index]) / (axis_knots[index + 1] - axis_knots[index]), 0, 1)
+        return index, fraction
+
+    @staticmethod
+    def _locate_one(x, axis_knots):
+        """Single-value version of _locate on a plain list of knots."""
+        i = min(max(bisect.bisect_right(axis_knots, x) - 1, 0), len(axis_knots) - 2)
+        return i, min(max((x - axis_knots[i]) / (axis_knots[i + 1] - axis_knots[i]), 0.0), 1.0)
+
+    def predict(self, temperature, wind_speed, style_code, cargo_weight):
+        """Predict the range of a single row."""
+        coefficients = self._coefficient_lists[int(style_code)]
+        values = (temperature, wind_speed, cargo_weight)
+        total = 0.0
+        for x, axis_knots, offset in zip(values, self._knot_lists, self._offsets):
+            i, fraction = self._locate_one(x, axis_knots)
+            total += coefficients[offset + i] * (1 - fraction) + coefficients[offset + i + 1] * fraction
+        for a, b, offset in self._pairs:
+            width = len(self._pair_knot_lists[b])
+            i, fa = self._locate_one(values[a], self._pair_knot_lists[a])
+            j, fb = self._locate_one(values[b], self._pair_knot_lists[b])
+            cell = offset + i * width + j
+            total += ((coefficients[cell] * (1 - fb) + coefficients[cell + 1] * fb) * (1 - fa)
+                      + (coefficients[cell + width] * (1 - fb) + coefficients[cell + width + 1] * fb) * fa)
+        return min(max(math.exp(total), self.lower), self.upper)
+
+    def predict_matrix(self, X):
+        """Predict the range of every row of a feature matrix."""
+        style = X[:, 3].astype(np.intp)
+        total = np.zeros(len(X), dtype=np.float64)
+        for axis, (axis_knots, offset) in enumerate(zip(self.knots, self._offsets)):
+            index, fraction = self._locate(X[:, axis], axis_knots)
+            total += (self.coefficients[style, offset + index] * (1 - fraction)
+                      + self.coefficients[style, offset + index + 1] * fraction)
+        for a, b, offset in self._pairs:
+            width = len(self.pair_knots[b])
+            index_a, fa = self._locate(X[:, a], self.pair_knots[a])
+            index_b, fb = self._locate(X[:, b], self.pair_knots[b])
+            cell = offset + index_a * width + index_b
+            total += ((self.coefficients[style, cell] * (1 - fb)
+                       + self.coefficients[style, cell + 1] * fb) * (1 - fa)
+                      + (self.coefficients[style, cell + width] * (1 - fb)
+                         + self.coefficients[style, cell + width + 1] * fb) * fa)
+        return np.clip(np.exp(total), self.lower, self.upper)
+
+    def save(self, path):
+        """Save the model as a NumPy archive."""
+        np.savez(
+            path,
+            coefficients=self.coefficients,
+            styles=np.array(self.styles),
+            bounds=np.array([self.lower, self.upper]),
+            signature=np.array(self.signature),
+            errors=np.array([np.nan if e is None else e
+                             for e in (self.max_error, self.mean_error, self.p99_error)]),
+            **{f'knots_{name}': axis_knots for name, axis_knots in zip(COMPACT_AXES, self.knots)},
+            **({} if self.pair_knots is None else
+               {f'pair_knots_{name}': axis_knots for name, axis_knots in zip(COMPACT_AXES, self.pair_knots)})
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Load a model saved with save()."""
+        with np.load(path) as data:
+            max_error, mean_error, p99_error = data['errors'].tolist()
+            pair_knots = None
+            if f'pair_knots_{COMPACT_AXES[0]}' in data:
+                pair_knots = [data[f'pair_knots_{name}'] for name in COMPACT_AXES]
+            return cls(
+                knots=[data[f'knots_{name}'] for name in COMPACT_AXES],
+                coefficients=data['coefficients'],
+                styles=data['styles'].tolist(),
+                lower=data['bounds'][0],
+                upper=data['bounds'][1],
+                signature=str(data['signature']),
+                max_error=max_error,
+                mean_error=mean_error,
+                p99_error=p99_error,
+                pair_knots=pair_knots
+            )
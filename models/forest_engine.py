@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+import struct
+import numpy as np
+
+# Marker sklearn uses for the children of a leaf node
+TREE_LEAF = -1
+
+# Flat binary artifact layout: magic, format version and JSON header length,
+# the JSON header, then the node arrays, each starting on an ALIGNMENT boundary
+FOREST_MAGIC = b'VSFOREST'
+FOREST_FORMAT_VERSION = 1
+PREFIX = struct.Struct('<8sII')
+ALIGNMENT = 64
+
+# Arrays stored in the artifact and their on-disk dtypes
+ARTIFACT_ARRAYS = {
+    'feature': '<i8',
+    'threshold': '<f8',
+    'children': '<i8',
+    'value': '<f8',
+    'roots': '<i8'
+}
+
+def _align(offset):
+    """Round offset up to the next ALIGNMENT boundary."""
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+class FlatForest:
+    """Vectorized evaluator for a fitted RandomForestRegressor stored as flat arrays."""
+
+    def __init__(self, feature, threshold, children, value, roots, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        # Interleaved left/right children, so a branch is a single gather
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+
+    @classmethod
+    def from_forest(cls, forest):
+        """Export every tree of a fitted forest into contiguous node arrays."""
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        max_depth = 0
+        offset = 0
+
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            node_ids = np.arange(tree.node_count, dtype=np.int64)
+            is_leaf = tree.children_left == TREE_LEAF
+
+            # Leaves point at themselves so extra steps past their depth are no-ops
+            left = np.where(is_leaf, node_ids, tree.children_left) + offset
+            right = np.where(is_leaf, node_ids, tree.children_right) + offset
+            feature = np.where(is_leaf, 0, tree.feature)
+
+            features.append(feature)
+            thresholds.append(tree.threshold)
+            lefts.append(left)
+            rights.append(right)
+            values.append(tree.value[:, 0, 0])
+            roots.append(offset)
+
+            max_depth = max(max_depth, tree.max_depth)
+            offset += tree.node_count
+
+        children = np.column_stack([np.concatenate(lefts), np.concatenate(rights)]).ravel()
+
+        return cls(
+            feature=np.ascontiguousarray(np.concatenate(features), dtype=np.intp),
+            threshold=np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64),
+            children=np.ascontiguousarray(children, dtype=np.intp),
+            value=np.ascontiguousarray(np.concatenate(values), dtype=np.float64),
+            roots=np.asarray(roots, dtype=np.intp),
+            max_depth=max_depth
+        )
+
+    def save(self, path, metadata=None):
+        """Write the node arrays to a flat binary file that load() can memory-map.
+
+        The file is written under a temporary name and renamed into place, so
+        processes loading it concurrently never see a partial artifact.
+        """
+        arrays = {name: np.ascontiguousarray(getattr(self, name), dtype=dtype)
+                  for name, dtype in ARTIFACT_ARRAYS.items()}
+
+        # Lay the arrays out back to back, hashing the payload as it will be written
+        layout = {}
+        digest = hashlib.sha256()
+        offset = 0
+        for name, array in arrays.items():
+            padding = _align(offset) - offset
+            digest.update(bytes(padding))
+            offset += padding
+            layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+            digest.update(array.tobytes())
+            offset += array.nbytes
+
+        header = json.dumps({
+            'arrays': layout,
+            'max_depth': int(self.max_depth),
+            'payload_size': offset,
+            'sha256': digest.hexdigest(),
+            'metadata': metadata or {}
+        }).encode()
+        payload_offset = _align(PREFIX.size + len(header))
+
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(PREFIX.pack(FOREST_MAGIC, FOREST_FORMAT_VERSION, len(header)))
+            f.write(header)
+            f.write(bytes(payload_offset - f.tell()))
+            for name, array in arrays.items():
+                f.write(bytes(payload_offset + layout[name]['offset'] - f.tell()))
+                f.write(array.tobytes())
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path, verify=True):
+        """Memory-map a forest written by save().
+
+        The arrays are read-only views of the file, so every process mapping the
+        same artifact shares one copy of the forest in the page cache. Returns the
+        forest and the metadata it was saved with.
+        """
+        with open(path, 'rb') as f:
+            prefix = f.read(PREFIX.size)
+            if len(prefix) != PREFIX.size:
+                raise ValueError(f"Truncated forest artifact: {path}")
+            magic, version, header_length = PREFIX.unpack(prefix)
+            if magic != FOREST_MAGIC:
+                raise ValueError(f"Not a forest artifact: {path}")
+            if version != FOREST_FORMAT_VERSION:
+                raise ValueError(f"Unsupported forest artifact version {version} "
+                                 f"(expected {FOREST_FORMAT_VERSION})")
+            header = json.loads(f.read(header_length))
+
+        payload = np.memmap(path, dtype=np.uint8, mode='r',
+                            offset=_align(PREFIX.size + header_length),
+                            shape=(header['payload_size'],))
+        if verify and hashlib.sha256(payload).hexdigest() != header['sha256']:
+            raise ValueError(f"Forest artifact checksum mismatch: {path}")
+
+        arrays = {}
+        for name, spec in header['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape']))
+            start = spec['offset']
+            arrays[name] = payload[start:start + count * dtype.itemsize].view(dtype).reshape(spec['shape'])
+
+        return cls(max_depth=header['max_depth'], **arrays), header['metadata']
+
+    @property
+    def n_trees(self):
+        """Number of trees in the forest."""
+        return len(self.roots)
+
+    def apply(self, X):
+        """Return the leaf node reached in every tree, as a trees x rows matrix."""
+        # sklearn compares float32 features against float64 thresholds
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        n_rows, n_features = X.shape
+
+        # Index into the flattened matrix to gather one feature per row and tree
+        values = X.ravel()
+        row_offsets = np.arange(n_rows, dtype=np.intp) * n_features
+        nodes = np.repeat(self.roots[:, np.newaxis], n_rows, axis=1)
+
+        # Step every row through every tree one level at a time
+        for _ in range(self.max_depth):
+            go_right = values[row_offsets + self.feature[nodes]] > self.threshold[nodes]
+            nodes = self.children[2 * nodes + go_right]
+
+        return nodes
+
+    def predict_trees(self, X):
+        """Return the prediction of every tree as a trees x rows matrix."""
+        return self.value[self.apply(X)]
+
+    def predict(self, X):
+        """Predict the forest mean for every row of X."""
+        per_tree = self.predict_trees(X)
+
+        # Add the trees one at a time into a float64 accumulator, in tree order, as
+        # RandomForestRegressor.predict does, so results match it exactly
+        total = np.zeros(per_tree.shape[1], dtype=np.float64)
+        for tree_predictions in per_tree:
+            total += tree_predictions
+
+        return total / self.n_trees
@@ -0,0 +1,179 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime
+
+# Vehicle ids name model files, so they are restricted to safe file name characters
+VEHICLE_ID_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$')
+
+MODEL_SUFFIX = '.joblib'
+
+class UnknownVehicleError(ValueError):
+    """No model file exists for the requested vehicle."""
+
+class ModelRegistry:
+    """Range predictors for many vehicles, loaded on first use and evicted LRU under a memory budget.
+
+    Each vehicle's model is models_dir/<vehicle_id>.joblib (with its derived
+    engine artifacts next to it). create(model_path) returns an unloaded
+    RangePredictor for one of them. Predictors that are evicted while a request
+    still holds them finish that request and are then freed.
+    """
+
+    def __init__(self, models_dir, create, memory_budget_bytes):
+        if memory_budget_bytes <= 0:
+            raise ValueError("memory_budget_bytes must be positive")
+
+        self.models_dir = models_dir
+        self.create = create
+        self.memory_budget_bytes = memory_budget_bytes
+
+        # vehicle_id -> (predictor, memory bytes), least recently used first
+        self._models = OrderedDict()
+        # vehicle_id -> Future of the load in progress
+        self._loading = {}
+        # vehicle_id -> usage counters, kept across evictions
+        self._usage = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+        self.failures = 0
+
+    def model_path(self, vehicle_id):
+        """Path of a vehicle's model file."""
+        return os.path.join(self.models_dir, vehicle_id + MODEL_SUFFIX)
+
+    def vehicle_ids(self):
+        """Ids of the vehicles with a model file, sorted."""
+        if not os.path.isdir(self.models_dir):
+            return []
+        return sorted(
+            name[:-len(MODEL_SUFFIX)] for name in os.listdir(self.models_dir)
+            if name.endswith(MODEL_SUFFIX) and VEHICLE_ID_PATTERN.match(name[:-len(MODEL_SUFFIX)])
+        )
+
+    def get(self, vehicle_id, rows=1):
+        """Return the vehicle's predictor, loading it if needed, and count rows predictions for it.
+
+        Raises UnknownVehicleError for an unknown vehicle. Concurrent requests for
+        a vehicle that is loading wait for that load instead of starting another.
+        """
+        with self._lock:
+            entry = self._models.get(vehicle_id)
+            if entry is not None:
+                self._models.move_to_end(vehicle_id)
+                self._count_use(vehicle_id, rows)
+                return entry[0]
+            future = self._loading.get(vehicle_id)
+            loader = future is None
+            if loader:
+                if not isinstance(vehicle_id, str) or not VEHICLE_ID_PATTERN.match(vehicle_id) or \
+                        not os.path.exists(self.model_path(vehicle_id)):
+                    raise UnknownVehicleError(f"Unknown vehicle_id '{vehicle_id}'")
+                future = self._loading[vehicle_id] = Future()
+
+        if loader:
+            self._load(vehicle_id, future)
+        predictor = future.result()
+        with self._lock:
+            self._count_use(vehicle_id, rows)
+        return predictor
+
+    def _usage_for(self, vehicle_id):
+        """Usage counters of a vehicle, created on first use. Call with the lock held."""
+        usage = self._usage.get(vehicle_id)
+        if usage is None:
+            usage = self._usage[vehicle_id] = {
+                'requests': 0, 'rows': 0, 'loads': 0, 'evictions': 0, 'failures': 0,
+                'load_seconds': None, 'last_used': None
+            }
+        return usage
+
+    def _count_use(self, vehicle_id, rows):
+        """Record a request for a vehicle. Call with the lock held."""
+        usage = self._usage_for(vehicle_id)
+        usage['requests'] += 1
+        usage['rows'] += rows
+        usage['last_used'] = time.time()
+
+    def _load(self, vehicle_id, future):
+        """Load a vehicle's predictor, make room for it and settle the future."""
+        path = self.model_path(vehicle_id)
+        try:
+            # Free room before loading, estimating the model's size from its file
+            with self._lock:
+                self._evict(os.path.getsize(path))
+
+            start = time.perf_counter()
+            predictor = self.create(path)
+            predictor.load_model(train_on_error=False)
+            seconds = time.perf_counter() - start
+            memory_bytes = predictor.memory_bytes()
+        except Exception as e:
+            with self._lock:
+                self.failures += 1
+                self._usage_for(vehicle_id)['failures'] += 1
+                del self._loading[vehicle_id]
+            future.set_exception(e)
+            return
+
+        with self._lock:
+            self._evict(memory_bytes)
+            self._models[vehicle_id] = (predictor, memory_bytes)
+            del self._loading[vehicle_id]
+            self.loads += 1
+            usage = self._usage_for(vehicle_id)
+            usage['loads'] += 1
+            usage['load_seconds'] = seconds
+        future.set_result(predictor)
+
+    def _evict(self, needed_bytes):
+        """Evict least recently used models until needed_bytes more fit the budget. Call with the lock held.
+
+        A model larger than the whole budget is still loaded once the others are gone.
+        """
+        while self._models and self._memory_bytes() + needed_bytes > self.memory_budget_bytes:
+            vehicle_id, _ = self._models.popitem(last=False)
+            self.evictions += 1
+            self._usage_for(vehicle_id)['evictions'] += 1
+
+    def _memory_bytes(self):
+        """Memory of the loaded models. Call with the lock held."""
+        return sum(memory_bytes for _, memory_bytes in self._models.values())
+
+    def unload(self, vehicle_id):
+        """Drop a vehicle's loaded model so the next request reads its file again; returns whether it was loaded."""
+        with self._lock:
+            return self._models.pop(vehicle_id, None) is not None
+
+    def loaded(self):
+        """Ids of the loaded vehicles, least recently used first."""
+        with self._lock:
+            return list(self._models)
+
+    def stats(self):
+        """Return the memory use, load and eviction counters, and per-vehicle usage."""
+        with self._lock:
+            models = {}
+            for vehicle_id, usage in self._usage.items():
+                entry = self._models.get(vehicle_id)
+                models[vehicle_id] = dict(
+                    usage,
+                    loaded=entry is not None,
+                    memory_bytes=entry[1] if entry is not None else 0,
+                    last_used=datetime.fromtimestamp(usage['last_used']).isoformat() if usage['last_used'] else None
+                )
+            return {
+                'models_dir': self.models_dir,
+                'memory_budget_bytes': self.memory_budget_bytes,
+                'memory_bytes': self._memory_bytes(),
+                'loaded': len(self._models),
+                'loading': len(self._loading),
+                'loads': self.loads,
+                'evictions': self.evictions,
+                'failures': self.failures,
+                'models': models
+            }
@@ -0,0 +1,80 @@
+from collections import OrderedDict
+import threading
+
+class PredictionCache:
+    """Bounded LRU cache of range predictions keyed on quantized inputs."""
+
+    def __init__(self, max_entries=10000, temperature_resolution=0.5,
+                 wind_speed_resolution=1.0, cargo_weight_resolution=5.0):
+        if max_entries <= 0:
+            raise ValueError("max_entries must be positive")
+        if min(temperature_resolution, wind_speed_resolution, cargo_weight_resolution) <= 0:
+            raise ValueError("Quantization resolutions must be positive")
+
+        self.max_entries = max_entries
+        self.temperature_resolution = temperature_resolution
+        self.wind_speed_resolution = wind_speed_resolution
+        self.cargo_weight_resolution = cargo_weight_resolution
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, temperature, wind_speed, driving_style, cargo_weight):
+        """Quantize the inputs into a cache key."""
+        return (
+            round(temperature / self.temperature_resolution),
+            round(wind_speed / self.wind_speed_resolution),
+            driving_style,
+            round(cargo_weight / self.cargo_weight_resolution)
+        )
+
+    def inputs(self, key):
+        """Return the representative model inputs of a cache key's bucket."""
+        temperature, wind_speed, driving_style, cargo_weight = key
+        return (
+            temperature * self.temperature_resolution,
+            wind_speed * self.wind_speed_resolution,
+            driving_style,
+            cargo_weight * self.cargo_weight_resolution
+        )
+
+    def get(self, key):
+        """Return the cached prediction for key, or None on a miss."""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Store a prediction, evicting the least recently used entry when full."""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every cached prediction, e.g. after the model changed."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return the cache size and hit/miss/eviction counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,135 @@
+import numpy as np
+
+# Numeric grid axes, in the order of the first three feature columns
+GRID_AXES = ['temperature', 'wind_speed', 'cargo_weight']
+
+class RangeGrid:
+    """Precomputed range predictions on a regular grid, answered by trilinear interpolation."""
+
+    def __init__(self, origin, step, values, styles, signature='', max_error=None, mean_error=None):
+        self.origin = np.asarray(origin, dtype=np.float64)
+        self.step = np.asarray(step, dtype=np.float64)
+        # One 3-D array per driving style, indexed by the label encoder's style code
+        self.values = np.asarray(values, dtype=np.float64)
+        self.styles = list(styles)
+        self.signature = signature
+        self.max_error = max_error
+        self.mean_error = mean_error
+
+        self.upper = self.origin + self.step * (np.array(self.values.shape[1:]) - 1)
+        self._bounds = list(zip(self.origin.tolist(), self.upper.tolist()))
+
+    @classmethod
+    def build(cls, predict_matrix, input_ranges, steps, styles, signature='', chunk_size=20000):
+        """Evaluate predict_matrix on every grid point covering input_ranges."""
+        axes = []
+        for name, step in zip(GRID_AXES, steps):
+            low, high = input_ranges[name]
+            count = int(np.ceil((high - low) / step)) + 1
+            axes.append(low + step * np.arange(count))
+
+        # Every grid point for every style, in the model's feature column order
+        mesh = np.meshgrid(np.arange(len(styles)), *axes, indexing='ij')
+        X = np.column_stack([mesh[1].ravel(), mesh[2].ravel(), mesh[3].ravel(), mesh[0].ravel()])
+
+        values = np.empty(len(X), dtype=np.float64)
+        for start in range(0, len(X), chunk_size):
+            values[start:start + chunk_size] = predict_matrix(X[start:start + chunk_size])
+
+        return cls(
+            origin=[axis[0] for axis in axes],
+            step=steps,
+            values=values.reshape(mesh[0].shape),
+            styles=styles,
+            signature=signature
+        )
+
+    def evaluate_error(self, predict_matrix, n_samples=5000, seed=1):
+        """Measure the interpolation error against predict_matrix on random off-grid points."""
+        rng = np.random.default_rng(seed)
+        X = np.empty((n_samples, len(GRID_AXES) + 1), dtype=np.float64)
+        for axis, (low, high) in enumerate(self._bounds):
+            X[:, axis] = rng.uniform(low, high, n_samples)
+        X[:, 3] = rng.integers(0, len(self.styles), n_samples)
+
+        errors = np.abs(self.interpolate_matrix(X) - predict_matrix(X))
+        self.max_error = float(errors.max())
+        self.mean_error = float(errors.mean())
+        return self.max_error
+
+    def contains(self, temperature, wind_speed, cargo_weight):
+        """Whether a point lies inside the grid."""
+        (t_low, t_high), (w_low, w_high), (c_low, c_high) = self._bounds
+        return (t_low <= temperature <= t_high and w_low <= wind_speed <= w_high
+                and c_low <= cargo_weight <= c_high)
+
+    def contains_matrix(self, X):
+        """Boolean mask of the rows of X that lie inside the grid."""
+        return ((X[:, :3] >= self.origin) & (X[:, :3] <= self.upper)).all(axis=1)
+
+    def interpolate(self, temperature, wind_speed, style_code, cargo_weight):
+        """Interpolate the range of a single point inside the grid."""
+        index = []
+        fraction = []
+        for x, origin, step, size in zip((temperature, wind_speed, cargo_weight),
+                                         self.origin, self.step, self.values.shape[1:]):
+            position = (x - origin) / step
+            i = min(int(position), size - 2)
+            index.append(i)
+            fraction.append(position - i)
+
+        i, j, k = index
+        t, w, c = fraction
+        cube = self.values[int(style_code), i:i + 2, j:j + 2, k:k + 2]
+
+        # Collapse one axis at a time
+        square = cube[0] * (1 - t) + cube[1] * t
+        line = square[0] * (1 - w) + square[1] * w
+        return float(line[0] * (1 - c) + line[1] * c)
+
+    def interpolate_matrix(self, X):
+        """Interpolate the range of every row of a feature matrix inside the grid."""
+        sizes = np.array(self.values.shape[1:])
+        position = (X[:, :3] - self.origin) / self.step
+        index = np.minimum(position.astype(np.intp), sizes - 2)
+        fraction = position - index
+        style = X[:, 3].astype(np.intp)
+
+        result = np.zeros(len(X), dtype=np.float64)
+        for corner in range(8):
+            offset = [(corner >> 2) & 1, (corner >> 1) & 1, corner & 1]
+            weight = np.ones(len(X), dtype=np.float64)
+            for axis, bit in enumerate(offset):
+                weight *= fraction[:, axis] if bit else 1 - fraction[:, axis]
+            result += weight * self.values[style,
+                                           index[:, 0] + offset[0],
+                                           index[:, 1] + offset[1],
+                                           index[:, 2] + offset[2]]
+        return result
+
+    def save(self, path):
+        """Save the grid as a NumPy archive."""
+        np.savez(
+            path,
+            origin=self.origin,
+            step=self.step,
+            values=self.values,
+            styles=np.array(self.styles),
+            signature=np.array(self.signature),
+            max_error=np.array(np.nan if self.max_error is None else self.max_error),
+            mean_error=np.array(np.nan if self.mean_error is None else self.mean_error)
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Load a grid saved with save()."""
+        with np.load(path) as data:
+            return cls(
+                origin=data['origin'],
+                step=data['step'],
+                values=data['values'],
+                styles=data['styles'].tolist(),
+                signature=str(data['signature']),
+                max_error=float(data['max_error']),
+                mean_error=float(data['mean_error'])
+            )
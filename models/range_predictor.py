@@ -1,100 +1,167 @@
 import numpy as np
-import pandas as pd
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.preprocessing import LabelEncoder
-from sklearn.model_selection import train_test_split
-import joblib
+import hashlib
+import math
 import os
+import threading
+import time
+from models.compact_model import CompactModel, COMPACT_AXES, DEFAULT_KNOTS, DEFAULT_PAIR_KNOTS
+from models.forest_engine import FlatForest
+from models.range_grid import RangeGrid
+
+# pandas, scikit-learn and joblib are imported inside the methods that need them,
+# so importing this module (and the app) stays fast until a model is loaded
+
+# Driving styles understood by the model
+DRIVING_STYLES = ['aggressive', 'moderate', 'eco']
+
+# Column order of the feature matrix the model is fitted on
+FEATURE_COLUMNS = ['temperature', 'wind_speed', 'cargo_weight', 'driving_style_encoded']
+
+# Documented input ranges of the numeric features (see docs/API.md)
+INPUT_RANGES = {
+    'temperature': (-40.0, 50.0),
+    'wind_speed': (0.0, 100.0),
+    'cargo_weight': (0.0, 1000.0)
+}
+
+# Inference engines selectable for predictions
+ENGINES = ['sklearn', 'flat', 'grid', 'compact']
+
+# On-disk model formats: a joblib pickle only, or the pickle plus a shared memory-mapped forest
+MODEL_FORMATS = ['joblib', 'mmap']
+
+# Default lookup grid spacing for temperature (°C), wind speed (km/h) and cargo weight (kg)
+DEFAULT_GRID_STEPS = (1.0, 2.0, 20.0)
 
 class RangePredictor:
     """Machine learning model for predicting EV range based on various factors."""
     
-    def __init__(self, model_path='models/ev_range_model.joblib'):
+    def __init__(self, model_path='models/ev_range_model.joblib', engine='sklearn', cache=None,
+                 grid_steps=DEFAULT_GRID_STEPS, load=True, model_format='joblib', verify_checksum=True,
+                 compact_max_error=40.0, metrics=None, base_range=400.0):
+        if engine not in ENGINES:
+            raise ValueError(f"Engine must be one of: {', '.join(ENGINES)}")
+        if model_format not in MODEL_FORMATS:
+            raise ValueError(f"Model format must be one of: {', '.join(MODEL_FORMATS)}")
+        
         self.model_path = model_path
+        self.engine = engine
+        self.cache = cache
+        # Histogram (labelled by stage) timing predictions, or None to skip timing
+        self.metrics = metrics
+        self.grid_steps = tuple(grid_steps)
+        self.grid_path = os.path.splitext(model_path)[0] + '.grid.npz'
+        self.model_format = model_format
+        self.verify_checksum = verify_checksum
+        self.forest_path = os.path.splitext(model_path)[0] + '.forest'
+        self.compact_path = os.path.splitext(model_path)[0] + '.compact.npz'
+        self.compact_max_error = compact_max_error
+        # Full-battery range (km) in ideal conditions of the vehicle the synthetic data describes
+        self.base_range = base_range
         self.model = None
-        self.label_encoder = LabelEncoder()
+        self.label_encoder = None
+        self.style_classes = []
         self.is_trained = False
+        self._signature = None
+        # Trained with save=False: the model file on disk belongs to another model
+        self._unsaved = False
+        
+        # Fast-path state, rebuilt whenever the model changes
+        self._style_codes = {}
+        self._trees = []
+        self._flat_forest = None
+        self.grid = None
+        self.compact = None
+        self._interval_forest = None
+        self._buffers = threading.local()
         
         # Load existing model if available
+        if not load:
+            return
         if os.path.exists(model_path):
             self.load_model()
         else:
             self.train_model()
     
-    def generate_synthetic_data(self, n_samples=1000):
+    def generate_synthetic_data(self, n_samples=1000, seed=42):
         """Generate synthetic training data based on realistic EV range factors."""
         
-        np.random.seed(42)  # For reproducibility
+        # Local generator for reproducibility without touching NumPy's global state
+        return self._synthetic_chunk(np.random.default_rng(seed), n_samples)
+    
+    def generate_synthetic_chunks(self, n_samples, chunk_size=1000000, seed=42):
+        """Yield synthetic training data in DataFrames of at most chunk_size rows."""
+        rng = np.random.default_rng(seed)
+        for start in range(0, n_samples, chunk_size):
+            yield self._synthetic_chunk(rng, min(chunk_size, n_samples - start))
+    
+    def _synthetic_chunk(self, rng, n_samples):
+        """Draw n_samples synthetic rows from rng."""
+        import pandas as pd
         
         # Generate realistic ranges of values
-        temperature = np.random.uniform(-10, 40, n_samples)  # Celsius
-        wind_speed = np.random.uniform(0, 30, n_samples)     # km/h
-        driving_styles = np.random.choice(['aggressive', 'moderate', 'eco'], n_samples)
-        cargo_weight = np.random.uniform(0, 500, n_samples)  # kg
-        
-        # Base range (km) - typical EV range
-        base_range = 400
-        
-        # Calculate range based on factors
-        ranges = []
-        for i in range(n_samples):
-            range_km = base_range
-            
-            # Temperature effect (battery efficiency decreases in extreme temperatures)
-            temp_factor = 1.0
-            if temperature[i] < 0:
-                temp_factor = 0.85  # Cold reduces range
-            elif temperature[i] > 30:
-                temp_factor = 0.90  # Heat reduces range slightly
-            
-            # Wind resistance effect
-            wind_factor = 1.0 - (wind_speed[i] * 0.01)  # Wind reduces range
-            
-            # Driving style effect
-            style_factor = 1.0
-            if driving_styles[i] == 'aggressive':
-                style_factor = 0.75  # Aggressive driving reduces range
-            elif driving_styles[i] == 'eco':
-                style_factor = 1.15  # Eco driving increases range
-            
-            # Cargo weight effect
-            weight_factor = 1.0 - (cargo_weight[i] * 0.0002)  # Weight reduces range
-            
-            # Apply all factors
-            range_km = range_km * temp_factor * wind_factor * style_factor * weight_factor
-            
-            # Add some realistic noise
-            range_km += np.random.normal(0, 10)
-            
-            # Ensure range is positive and reasonable
-            range_km = max(200, min(500, range_km))
-            
-            ranges.append(range_km)
+        temperature = rng.uniform(-10, 40, n_samples)  # Celsius
+        wind_speed = rng.uniform(0, 30, n_samples)     # km/h
+        style_codes = rng.integers(0, len(DRIVING_STYLES), n_samples)
+        cargo_weight = rng.uniform(0, 500, n_samples)  # kg
         
-        # Create DataFrame
+        # Base range (km) of the vehicle
+        base_range = self.base_range
+        
+        # Temperature effect (battery efficiency decreases in extreme temperatures)
+        temp_factor = np.where(temperature < 0, 0.85, np.where(temperature > 30, 0.90, 1.0))
+        
+        # Wind resistance effect
+        wind_factor = 1.0 - wind_speed * 0.01
+        
+        # Driving style effect (aggressive, moderate, eco)
+        style_factor = np.array([0.75, 1.0, 1.15])[style_codes]
+        
+        # Cargo weight effect
+        weight_factor = 1.0 - cargo_weight * 0.0002
+        
+        # Apply all factors and add some realistic noise
+        range_km = base_range * temp_factor * wind_factor * style_factor * weight_factor
+        range_km += rng.normal(0, 10, n_samples)
+        
+        # Ensure range is positive and reasonable
+        np.clip(range_km, 0.5 * base_range, 1.25 * base_range, out=range_km)
+        
+        # Create DataFrame; a categorical keeps the style column compact for large sets
         data = pd.DataFrame({
             'temperature': temperature,
             'wind_speed': wind_speed,
-            'driving_style': driving_styles,
+            'driving_style': pd.Categorical.from_codes(style_codes, DRIVING_STYLES),
             'cargo_weight': cargo_weight,
-            'range_km': ranges
+            'range_km': range_km
         })
         
         return data
     
-    def train_model(self):
-        """Train the machine learning model."""
+    def train_model(self, n_estimators=100, max_depth=10, min_samples_leaf=1, n_samples=2000,
+                    n_jobs=-1, save=True):
+        """Train the machine learning model.
+        
+        Returns the R² scores and the test mean absolute error in km.
+        """
+        from sklearn.ensemble import RandomForestRegressor
+        from sklearn.metrics import mean_absolute_error
+        from sklearn.model_selection import train_test_split
+        from sklearn.preprocessing import LabelEncoder
+        
         print("Training EV range prediction model...")
         
         # Generate training data
-        data = self.generate_synthetic_data(n_samples=2000)
+        data = self.generate_synthetic_data(n_samples=n_samples)
         
         # Prepare features
         X = data[['temperature', 'wind_speed', 'driving_style', 'cargo_weight']].copy()
         y = data['range_km']
         
         # Encode driving style
+        self.label_encoder = LabelEncoder()
         X['driving_style_encoded'] = self.label_encoder.fit_transform(X['driving_style'])
+        self.style_classes = list(self.label_encoder.classes_)
         X = X.drop('driving_style', axis=1)
         
         # Split data
@@ -104,28 +171,388 @@ class RangePredictor:
         
         # Train Random Forest model
         self.model = RandomForestRegressor(
-            n_estimators=100,
-            max_depth=10,
+            n_estimators=n_estimators,
+            max_depth=max_depth,
+            min_samples_leaf=min_samples_leaf,
             random_state=42,
-            n_jobs=-1
+            n_jobs=n_jobs
         )
         
         self.model.fit(X_train, y_train)
         
         # Evaluate model
-        train_score = self.model.score(X_train, y_train)
-        test_score = self.model.score(X_test, y_test)
+        scores = {
+            'train_r2': self.model.score(X_train, y_train),
+            'test_r2': self.model.score(X_test, y_test),
+            'test_mae_km': mean_absolute_error(y_test, self.model.predict(X_test))
+        }
         
         print(f"Model training completed!")
-        print(f"Training R² score: {train_score:.3f}")
-        print(f"Testing R² score: {test_score:.3f}")
+        print(f"Training R² score: {scores['train_r2']:.3f}")
+        print(f"Testing R² score: {scores['test_r2']:.3f}")
+        
+        # Save model
+        self._unsaved = False
+        if save:
+            self.save_model()
+        self._unsaved = not save
+        self.is_trained = True
+        self._prepare_fast_path()
+        
+        return scores
+    
+    def train_incremental(self, chunks, estimators_per_chunk=10, max_estimators=200, max_depth=10,
+                          holdout_fraction=0.05, max_holdout_rows=100000):
+        """Train the forest chunk by chunk, growing estimators_per_chunk trees per chunk.
+        
+        Only one chunk is in memory at a time. A small sample of every chunk is held
+        out (up to max_holdout_rows) to score the finished model.
+        """
+        import pandas as pd
+        from sklearn.ensemble import RandomForestRegressor
+        from sklearn.preprocessing import LabelEncoder
+        
+        print("Training EV range prediction model incrementally...")
+        
+        self.label_encoder = LabelEncoder().fit(DRIVING_STYLES)
+        self.style_classes = list(self.label_encoder.classes_)
+        self.model = RandomForestRegressor(
+            n_estimators=0,
+            max_depth=max_depth,
+            random_state=42,
+            n_jobs=-1,
+            warm_start=True
+        )
+        
+        holdout = []
+        holdout_rows = 0
+        rows_seen = 0
+        for chunk_number, chunk in enumerate(chunks, start=1):
+            if self.model.n_estimators >= max_estimators:
+                print(f"Reached {max_estimators} trees, ignoring remaining chunks")
+                break
+            
+            # Skip rows with unknown styles or missing values
+            chunk = chunk[chunk['driving_style'].isin(DRIVING_STYLES)].dropna()
+            if chunk.empty:
+                continue
+            
+            X = pd.DataFrame({
+                'temperature': chunk['temperature'].to_numpy(dtype=np.float64),
+                'wind_speed': chunk['wind_speed'].to_numpy(dtype=np.float64),
+                'cargo_weight': chunk['cargo_weight'].to_numpy(dtype=np.float64),
+                'driving_style_encoded': self.label_encoder.transform(chunk['driving_style'].astype(str))
+            }, columns=FEATURE_COLUMNS)
+            y = chunk['range_km'].to_numpy(dtype=np.float64)
+            
+            # Hold out the tail of the chunk for evaluation
+            n_holdout = min(int(len(X) * holdout_fraction), max_holdout_rows - holdout_rows)
+            if n_holdout > 0:
+                holdout.append((X.iloc[-n_holdout:], y[-n_holdout:]))
+                holdout_rows += n_holdout
+                X, y = X.iloc[:-n_holdout], y[:-n_holdout]
+            
+            # warm_start keeps the existing trees and fits only the new ones on this chunk
+            self.model.n_estimators = min(self.model.n_estimators + estimators_per_chunk, max_estimators)
+            self.model.fit(X, y)
+            rows_seen += len(X)
+            print(f"Chunk {chunk_number}: {len(X)} rows, {self.model.n_estimators} trees")
+        
+        if self.model.n_estimators == 0:
+            raise ValueError("No training rows found.")
+        
+        print(f"Model training completed on {rows_seen} rows!")
+        if holdout:
+            X_test = pd.concat([X for X, _ in holdout])
+            y_test = np.concatenate([y for _, y in holdout])
+            print(f"Holdout R² score: {self.model.score(X_test, y_test):.3f}")
         
         # Save model
         self.save_model()
         self.is_trained = True
+        self._prepare_fast_path()
+    
+    def _prepare_fast_path(self, flat_forest=None, compact=None):
+        """Precompute the lookups used by the single-row fast path.
+        
+        flat_forest is a memory-mapped forest that replaces the sklearn model, and
+        compact a loaded surrogate that replaces the forest altogether.
+        """
+        self._style_codes = {
+            style: float(code) for code, style in enumerate(self.style_classes)
+        }
+        self._trees = [estimator.tree_ for estimator in self.model.estimators_] if self.model is not None else []
+        if self.model is not None:
+            # Predictions are too small to gain from joblib's threads, which only add dispatch cost
+            self.model.n_jobs = 1
+        self._flat_forest = flat_forest
+        self.grid = None
+        self.compact = compact
+        self._interval_forest = None
+        self._buffers = threading.local()
+        
+        if self.engine == 'flat' and flat_forest is None:
+            self._flat_forest = self._compile_flat_forest()
+        # The grid and surrogate are keyed to the saved file; until save_model() the forest serves
+        elif self.engine == 'grid' and not self._unsaved:
+            self.grid = self._load_or_build_grid()
+        elif self.engine == 'compact' and compact is None and not self._unsaved:
+            self.compact = self._load_or_build_compact()
+        
+        # Cached predictions belong to the previous model
+        if self.cache is not None:
+            self.cache.clear()
+    
+    def _validation_inputs(self, n_samples=512):
+        """Build a deterministic feature matrix spanning the documented input ranges."""
+        rng = np.random.default_rng(0)
+        X = np.empty((n_samples, len(FEATURE_COLUMNS)), dtype=np.float64)
+        X[:, 0] = rng.uniform(*INPUT_RANGES['temperature'], n_samples)
+        X[:, 1] = rng.uniform(*INPUT_RANGES['wind_speed'], n_samples)
+        X[:, 2] = rng.uniform(*INPUT_RANGES['cargo_weight'], n_samples)
+        X[:, 3] = rng.integers(0, len(self.style_classes), n_samples)
+        return X
+    
+    def _compile_flat_forest(self):
+        """Export the forest to flat arrays and check it against model.predict."""
+        import pandas as pd
+        
+        flat_forest = FlatForest.from_forest(self.model)
+        
+        X = self._validation_inputs()
+        expected = self.model.predict(pd.DataFrame(X, columns=FEATURE_COLUMNS))
+        if not np.array_equal(flat_forest.predict(X), expected):
+            print("Flat forest predictions differ from model.predict, using sklearn engine")
+            return None
+        
+        print(f"Flat forest compiled: {flat_forest.n_trees} trees, {len(flat_forest.value)} nodes")
+        return flat_forest
+    
+    def _model_signature(self):
+        """Fingerprint of the saved model file, used to match derived artifacts."""
+        if self._signature is None:
+            digest = hashlib.sha256()
+            with open(self.model_path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+            self._signature = digest.hexdigest()
+        return self._signature
+    
+    def _load_or_build_grid(self):
+        """Load the lookup grid saved for this model, or build and save a new one."""
+        signature = self._model_signature()
+        
+        if os.path.exists(self.grid_path):
+            try:
+                grid = RangeGrid.load(self.grid_path)
+                if grid.signature == signature and grid.step.tolist() == list(self.grid_steps):
+                    print(f"Range grid loaded from {self.grid_path} (max error {grid.max_error:.2f} km)")
+                    return grid
+            except Exception as e:
+                print(f"Error loading range grid: {e}")
+        
+        print("Building range lookup grid...")
+        grid = RangeGrid.build(
+            self._predict_matrix,
+            INPUT_RANGES,
+            self.grid_steps,
+            styles=list(self.style_classes),
+            signature=signature
+        )
+        max_error = grid.evaluate_error(self._predict_matrix)
+        grid.save(self.grid_path)
+        print(f"Range grid saved to {self.grid_path}: {grid.values.size} points, "
+              f"max error {max_error:.2f} km, mean error {grid.mean_error:.2f} km")
+        return grid
+    
+    def _forest_split_thresholds(self, feature_index):
+        """Thresholds of every split on one feature across the forest."""
+        if self._flat_forest is not None:
+            forest = self._flat_forest
+            internal = forest.children[0::2] != np.arange(len(forest.value))
+            return forest.threshold[internal & (forest.feature == feature_index)]
+        return np.concatenate([tree.threshold[tree.feature == feature_index] for tree in self._trees])
+    
+    def _forest_value_bounds(self):
+        """Smallest and largest leaf value, which bound every forest prediction."""
+        if self._flat_forest is not None:
+            values = self._flat_forest.value
+        else:
+            values = np.concatenate([tree.value.ravel() for tree in self._trees])
+        return float(values.min()), float(values.max())
+    
+    def _read_compact(self):
+        """Load the compact surrogate saved for this model, or None if there is none."""
+        if not os.path.exists(self.compact_path):
+            return None
+        try:
+            compact = CompactModel.load(self.compact_path)
+        except Exception as e:
+            print(f"Error loading compact model: {e}")
+            return None
+        # Surrogates saved before the interaction terms are rebuilt
+        if compact.signature != self._model_signature() or compact.pair_knots is None:
+            return None
+        return compact
+    
+    def _within_bound(self, compact):
+        """Whether the surrogate's measured error is within compact_max_error."""
+        return self.compact_max_error is None or compact.max_error <= self.compact_max_error
+    
+    def _check_compact(self, compact):
+        """Return the surrogate if its measured error is within compact_max_error, else None."""
+        if not self._within_bound(compact):
+            print(f"Compact model max error {compact.max_error:.2f} km exceeds "
+                  f"{self.compact_max_error:g} km, using the forest")
+            return None
+        return compact
+    
+    def _load_or_build_compact(self):
+        """Load the compact surrogate saved for this model, or distill and save a new one."""
+        compact = self._read_compact()
+        if compact is not None:
+            compact = self._check_compact(compact)
+            if compact is not None:
+                print(f"Compact model loaded from {self.compact_path} (max error {compact.max_error:.2f} km)")
+            return compact
+        
+        print("Distilling compact model...")
+        knots = [
+            CompactModel.place_knots(self._forest_split_thresholds(index), *INPUT_RANGES[name], count)
+            for index, (name, count) in enumerate(zip(FEATURE_COLUMNS[:3], DEFAULT_KNOTS))
+        ]
+        compact = CompactModel.fit(
+            self._predict_matrix,
+            INPUT_RANGES,
+            knots,
+            styles=list(self.style_classes),
+            bounds=self._forest_value_bounds(),
+            signature=self._model_signature(),
+            pair_knots=[np.linspace(*INPUT_RANGES[name], DEFAULT_PAIR_KNOTS) for name in COMPACT_AXES]
+        )
+        compact.evaluate_error(self._predict_matrix, INPUT_RANGES)
+        compact.save(self.compact_path)
+        print(f"Compact model saved to {self.compact_path}: {compact.n_parameters} parameters, "
+              f"max error {compact.max_error:.2f} km, p99 error {compact.p99_error:.2f} km, "
+              f"mean error {compact.mean_error:.2f} km")
+        return self._check_compact(compact)
+    
+    def _feature_buffer(self):
+        """Return this thread's reusable single-row feature buffer."""
+        buffer = getattr(self._buffers, 'row', None)
+        if buffer is None:
+            # Trees compare float32 features, matching sklearn's input conversion
+            buffer = np.empty((1, len(FEATURE_COLUMNS)), dtype=np.float32)
+            self._buffers.row = buffer
+        return buffer
+    
+    def predict_range(self, temperature, wind_speed, driving_style, cargo_weight, percentiles=None):
+        """Predict EV range based on input parameters.
+        
+        With percentiles (e.g. [10, 90]), returns the prediction and an array of the
+        matching percentiles of the individual trees' predictions.
+        """
+        if self.metrics is None:
+            return self._predict_single(temperature, wind_speed, driving_style, cargo_weight, percentiles)
+        
+        start = time.perf_counter()
+        try:
+            return self._predict_single(temperature, wind_speed, driving_style, cargo_weight, percentiles)
+        finally:
+            self.metrics.observe(time.perf_counter() - start, 'predict_range')
     
-    def predict_range(self, temperature, wind_speed, driving_style, cargo_weight):
-        """Predict EV range based on input parameters."""
+    def _predict_single(self, temperature, wind_speed, driving_style, cargo_weight, percentiles):
+        """Validate a single row and predict it, through the cache when enabled."""
+        evaluate = self._evaluate_row if self.metrics is None else self._timed_evaluate_row
+        
+        if not self.is_trained and self.model is None:
+            raise ValueError("Model not trained. Please train the model first.")
+        
+        # Validate inputs
+        style_code = self._style_codes.get(driving_style)
+        if style_code is None:
+            raise ValueError("Driving style must be one of: aggressive, moderate, eco")
+        if not (math.isfinite(temperature) and math.isfinite(wind_speed) and math.isfinite(cargo_weight)):
+            raise ValueError("Input contains NaN or infinity.")
+        
+        if percentiles is not None:
+            # Bands are computed at the exact inputs, never from the cache
+            X = np.array([[temperature, wind_speed, cargo_weight, style_code]], dtype=np.float64)
+            bands = self._percentile_bands(X, percentiles)[:, 0]
+            return evaluate(temperature, wind_speed, style_code, cargo_weight), bands
+        
+        if self.cache is None:
+            return evaluate(temperature, wind_speed, style_code, cargo_weight)
+        
+        # Serve repeated conditions from the cache, predicting at the bucket's inputs
+        key = self.cache.key(temperature, wind_speed, driving_style, cargo_weight)
+        predicted_range = self.cache.get(key)
+        if predicted_range is None:
+            temperature, wind_speed, driving_style, cargo_weight = self.cache.inputs(key)
+            predicted_range = evaluate(temperature, wind_speed, style_code, cargo_weight)
+            self.cache.put(key, predicted_range)
+        
+        return predicted_range
+    
+    def _tree_predictions(self, X):
+        """Evaluate every tree once, returning a trees x rows matrix of predictions."""
+        forest = self._flat_forest
+        if forest is None:
+            if self.model is None:
+                raise ValueError("Prediction percentiles need the forest, which is not loaded with the compact engine")
+            # Exported on first use when the engine does not already keep flat arrays
+            if self._interval_forest is None:
+                self._interval_forest = FlatForest.from_forest(self.model)
+            forest = self._interval_forest
+        return forest.predict_trees(X)
+    
+    def _percentile_bands(self, X, percentiles):
+        """Percentiles of the per-tree predictions, as a percentiles x rows matrix."""
+        percentiles = np.asarray(percentiles, dtype=np.float64)
+        if percentiles.ndim != 1 or not ((percentiles >= 0) & (percentiles <= 100)).all():
+            raise ValueError("Percentiles must be between 0 and 100")
+        if not np.isfinite(X).all():
+            raise ValueError("Input contains NaN or infinity.")
+        return np.percentile(self._tree_predictions(X), percentiles, axis=0)
+    
+    def _timed_evaluate_row(self, temperature, wind_speed, style_code, cargo_weight):
+        """Evaluate a single row, recording the time as the model stage."""
+        start = time.perf_counter()
+        try:
+            return self._evaluate_row(temperature, wind_speed, style_code, cargo_weight)
+        finally:
+            self.metrics.observe(time.perf_counter() - start, 'model')
+    
+    def _evaluate_row(self, temperature, wind_speed, style_code, cargo_weight):
+        """Evaluate the forest on a single validated row."""
+        
+        if self.compact is not None:
+            return self.compact.predict(temperature, wind_speed, style_code, cargo_weight)
+        
+        # Interpolate inside the lookup grid, falling back to the forest outside it
+        if self.grid is not None and self.grid.contains(temperature, wind_speed, cargo_weight):
+            return self.grid.interpolate(temperature, wind_speed, style_code, cargo_weight)
+        
+        # Fill the preallocated buffer in training column order
+        row = self._feature_buffer()
+        row[0, 0] = temperature
+        row[0, 1] = wind_speed
+        row[0, 2] = cargo_weight
+        row[0, 3] = style_code
+        
+        if self._flat_forest is not None:
+            return self._flat_forest.predict(row)[0]
+        
+        # Average the trees in estimator order, as RandomForestRegressor.predict does
+        total = 0.0
+        for tree in self._trees:
+            total += tree.predict(row)[0, 0]
+        
+        return total / len(self._trees)
+    
+    def _predict_range_dataframe(self, temperature, wind_speed, driving_style, cargo_weight):
+        """Reference single-row prediction through pandas and sklearn validation."""
+        import pandas as pd
         
         if not self.is_trained and self.model is None:
             raise ValueError("Model not trained. Please train the model first.")
@@ -151,8 +578,109 @@ class RangePredictor:
         
         return predicted_range
     
+    def predict_batch(self, temperature, wind_speed, driving_style, cargo_weight, percentiles=None):
+        """Predict EV range for many rows at once from columnar inputs.
+        
+        With percentiles, also returns a percentiles x rows matrix of per-tree percentiles.
+        """
+        
+        if not self.is_trained and self.model is None:
+            raise ValueError("Model not trained. Please train the model first.")
+        
+        start = time.perf_counter()
+        styles = np.asarray(driving_style)
+        if not np.isin(styles, DRIVING_STYLES).all():
+            raise ValueError("Driving style must be one of: aggressive, moderate, eco")
+        
+        # Build the feature matrix in the column order used during training
+        X = np.empty((len(styles), len(FEATURE_COLUMNS)), dtype=np.float64)
+        X[:, 0] = temperature
+        X[:, 1] = wind_speed
+        X[:, 2] = cargo_weight
+        # Classes are sorted, as LabelEncoder stores them, so a binary search encodes them
+        X[:, 3] = np.searchsorted(np.asarray(self.style_classes), styles)
+        
+        if self.metrics is None:
+            predictions = self._predict_rows(X)
+        else:
+            built = time.perf_counter()
+            self.metrics.observe(built - start, 'batch_features')
+            predictions = self._predict_rows(X)
+            self.metrics.observe(time.perf_counter() - built, 'batch_model')
+        
+        if percentiles is None:
+            return predictions
+        return predictions, self._percentile_bands(X, percentiles)
+    
+    def predict_many(self, temperature, wind_speed, driving_style, cargo_weight):
+        """Predict rows as separate predict_range calls would, in as few model calls as possible.
+        
+        Rows are looked up in the prediction cache like single predictions and the
+        misses are evaluated by one predict_batch call; a lone row takes the
+        single-row fast path. Returns a list of predictions.
+        """
+        if len(driving_style) == 1:
+            return [self.predict_range(temperature[0], wind_speed[0], driving_style[0], cargo_weight[0])]
+        if self.cache is None:
+            return self.predict_batch(temperature, wind_speed, driving_style, cargo_weight).tolist()
+        
+        # Predict each missing bucket once, at its representative inputs, as predict_range does
+        keys = [self.cache.key(*row) for row in zip(temperature, wind_speed, driving_style, cargo_weight)]
+        predictions = [self.cache.get(key) for key in keys]
+        missing = list(dict.fromkeys(key for key, value in zip(keys, predictions) if value is None))
+        if not missing:
+            return predictions
+        
+        values = dict(zip(missing, self.predict_batch(*zip(*(self.cache.inputs(key) for key in missing))).tolist()))
+        for key, value in values.items():
+            self.cache.put(key, value)
+        return [values[key] if value is None else value for key, value in zip(keys, predictions)]
+    
+    def _predict_rows(self, X):
+        """Predict a feature matrix with the selected engine."""
+        if self.compact is not None:
+            if not np.isfinite(X).all():
+                raise ValueError("Input contains NaN or infinity.")
+            return self.compact.predict_matrix(X)
+        
+        if self.grid is not None:
+            if not np.isfinite(X).all():
+                raise ValueError("Input contains NaN or infinity.")
+            
+            # Interpolate rows inside the grid and send the rest to the forest
+            inside = self.grid.contains_matrix(X)
+            predictions = np.empty(len(X), dtype=np.float64)
+            predictions[inside] = self.grid.interpolate_matrix(X[inside])
+            if not inside.all():
+                predictions[~inside] = self._predict_matrix(X[~inside])
+            return predictions
+        
+        # Single forest evaluation for the whole batch
+        return self._predict_matrix(X)
+    
+    def _predict_matrix(self, X):
+        """Evaluate the forest on a feature matrix in training column order."""
+        if self._flat_forest is not None:
+            if not np.isfinite(X).all():
+                raise ValueError("Input contains NaN or infinity.")
+            return self._flat_forest.predict(X)
+        
+        # Trees compare float32 features, as model.predict converts them
+        rows = np.ascontiguousarray(X, dtype=np.float32)
+        if not np.isfinite(rows).all():
+            raise ValueError("Input contains NaN or infinity.")
+        
+        # Sum the trees in estimator order, as RandomForestRegressor.predict does, without
+        # its per-call validation and per-tree dispatch that dominate small batches
+        total = np.zeros(len(rows), dtype=np.float64)
+        for tree in self._trees:
+            total += tree.predict(rows)[:, 0]
+        return total / len(self._trees)
+    
     def save_model(self):
         """Save the trained model to disk."""
+        import joblib
+        
         if self.model is not None:
             # Create models directory if it doesn't exist
             os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
@@ -162,18 +690,138 @@ class RangePredictor:
                 'model': self.model,
                 'label_encoder': self.label_encoder
             }
-            joblib.dump(model_data, self.model_path)
+            # Write under a temporary name so running workers never load a partial file
+            temp_path = f"{self.model_path}.{os.getpid()}.tmp"
+            joblib.dump(model_data, temp_path)
+            os.replace(temp_path, self.model_path)
+            self._signature = None
             print(f"Model saved to {self.model_path}")
+            
+            if self.model_format == 'mmap':
+                self.save_forest_artifact()
+            
+            if self._unsaved:
+                # Build the grid or surrogate deferred by train_model(save=False)
+                self._unsaved = False
+                self._prepare_fast_path()
+    
+    def save_forest_artifact(self):
+        """Write the forest as a flat binary artifact that workers memory-map."""
+        flat_forest = self._compile_flat_forest()
+        if flat_forest is None:
+            return
+        
+        os.makedirs(os.path.dirname(self.forest_path) or '.', exist_ok=True)
+        flat_forest.save(self.forest_path, metadata={
+            'classes': list(self.style_classes),
+            'feature_columns': FEATURE_COLUMNS,
+            'source_signature': self._model_signature()
+        })
+        print(f"Forest artifact saved to {self.forest_path}")
     
-    def load_model(self):
-        """Load the trained model from disk."""
+    def memory_bytes(self):
+        """Approximate memory held by the loaded model and its engine artifacts, in bytes.
+        
+        Memory-mapped forests are counted in full, although workers share their pages.
+        """
+        total = sum(tree.__getstate__()['nodes'].nbytes + tree.value.nbytes for tree in self._trees)
+        for forest in (self._flat_forest, self._interval_forest):
+            if forest is not None:
+                total += sum(array.nbytes for array in
+                             (forest.feature, forest.threshold, forest.children, forest.value, forest.roots))
+        if self.grid is not None:
+            total += self.grid.values.nbytes
+        if self.compact is not None:
+            total += self.compact.coefficients.nbytes
+        return total
+    
+    @property
+    def supports_percentiles(self):
+        """Whether per-tree percentiles can be computed, i.e. the forest is loaded."""
+        return self._flat_forest is not None or self.model is not None
+    
+    @property
+    def memory_mapped(self):
+        """Whether predictions are served from the shared memory-mapped forest."""
+        return self.model is None and self._flat_forest is not None
+    
+    def _load_forest_artifact(self):
+        """Memory-map the forest artifact if it matches the saved model, else return None."""
+        if not os.path.exists(self.forest_path):
+            return None
+        
+        try:
+            flat_forest, metadata = FlatForest.load(self.forest_path, verify=self.verify_checksum)
+        except Exception as e:
+            print(f"Error loading forest artifact: {e}")
+            return None
+        
+        # An artifact left behind by an older model must not shadow a retrained one
+        if metadata.get('feature_columns') != FEATURE_COLUMNS or (
+                os.path.exists(self.model_path) and metadata.get('source_signature') != self._model_signature()):
+            print(f"Forest artifact {self.forest_path} does not match {self.model_path}, ignoring it")
+            return None
+        
+        self.style_classes = list(metadata['classes'])
+        self._signature = metadata.get('source_signature')
+        return flat_forest
+    
+    def load_model(self, train_on_error=True):
+        """Load the trained model from disk.
+        
+        If the file cannot be loaded a new model is trained, or with
+        train_on_error=False the error is raised.
+        """
+        if self.engine == 'compact' and os.path.exists(self.model_path):
+            compact = self._read_compact()
+            # A surrogate over the bound is reported once the forest has loaded
+            if compact is not None and self._within_bound(compact):
+                # The surrogate answers every input, so the forest is never loaded
+                self.model = None
+                self.label_encoder = None
+                self.style_classes = list(compact.styles)
+                self.is_trained = True
+                self._prepare_fast_path(compact=compact)
+                print(f"Compact model loaded from {self.compact_path} (max error {compact.max_error:.2f} km)")
+                return
+        
+        if self.model_format == 'mmap':
+            flat_forest = self._load_forest_artifact()
+            if flat_forest is not None:
+                # The mapped arrays replace the forest, so no process keeps a private copy
+                self.model = None
+                self.label_encoder = None
+                self.is_trained = True
+                self._prepare_fast_path(flat_forest)
+                print(f"Model memory-mapped from {self.forest_path}")
+                return
+        
+        import joblib
+        
         try:
             model_data = joblib.load(self.model_path)
             self.model = model_data['model']
             self.label_encoder = model_data['label_encoder']
+            self.style_classes = list(self.label_encoder.classes_)
+            self._signature = None
             self.is_trained = True
+            
+            if self.model_format == 'mmap':
+                # First load after training or an upgrade: export, then map what was written
+                self.save_forest_artifact()
+                flat_forest = self._load_forest_artifact()
+                if flat_forest is not None:
+                    self.model = None
+                    self.label_encoder = None
+                    self._prepare_fast_path(flat_forest)
+                    print(f"Model memory-mapped from {self.forest_path}")
+                    return
+            
+            self._prepare_fast_path()
             print(f"Model loaded from {self.model_path}")
         except Exception as e:
+            if not train_on_error:
+                raise
             print(f"Error loading model: {e}")
             print("Training new model...")
             self.train_model()
@@ -0,0 +1,136 @@
+"""
+Out-of-core training data sources and the incremental training command.
+
+Chunks are DataFrames with the columns temperature, wind_speed, driving_style,
+cargo_weight and range_km, as produced by RangePredictor.generate_synthetic_data.
+
+    python -m models.training --source sqlite --database trips.db --table trips --target measured_range_km
+    python -m models.training --source csv --path trips.csv --target actual_range_km
+
+A vehicle's model for the model registry is trained to its file in MODEL_REGISTRY_DIR:
+
+    python -m models.training --source synthetic --base-range-km 520 --model-path models/vehicles/suv-90kwh.joblib
+"""
+
+import argparse
+import fnmatch
+import pandas as pd
+from config import Config
+from database import connect
+from history_shards import SHARD_GLOB
+
+TRAINING_COLUMNS = ['temperature', 'wind_speed', 'driving_style', 'cargo_weight']
+
+# Rough peak memory per training row: the chunk DataFrame, sklearn's float32
+# copy of the features, and the bootstrap indices and weights of each tree
+BYTES_PER_ROW = 200
+
+def chunk_rows_for_memory(memory_limit_mb=None):
+    """Number of rows per chunk that keeps a chunk within the memory limit."""
+    memory_limit_mb = memory_limit_mb or Config.TRAINING_MEMORY_LIMIT_MB
+    return max(1000, int(memory_limit_mb * 1024 * 1024 // BYTES_PER_ROW))
+
+def iter_sqlite_chunks(database_path, chunk_size, target, table):
+    """Stream training rows from a SQLite table of measured trips.
+
+    target is the table's column of measured ranges. The prediction history is
+    refused: it only stores the model's own output, and training on it would
+    only teach the model to repeat itself. The table and columns are checked
+    before the generator is returned, so a ValueError is raised to the caller.
+    """
+    if table == 'predictions' or fnmatch.fnmatchcase(table, SHARD_GLOB):
+        raise ValueError(f"{table} holds the model's own predictions, not measured ranges; "
+                         "import measured trips into a table and train from it")
+    if target == 'predicted_range':
+        raise ValueError("predicted_range holds the model's own predictions; use a column of measured ranges")
+
+    conn = connect(database_path)
+    try:
+        columns = {row['name'] for row in conn.execute(f'PRAGMA table_info("{table}")')}
+    finally:
+        conn.close()
+    if not columns:
+        raise ValueError(f'No such table: {table}')
+    missing = [column for column in TRAINING_COLUMNS + [target] if column not in columns]
+    if missing:
+        raise ValueError(f"Table {table} has no column: {', '.join(missing)}")
+
+    def generate():
+        conn = connect(database_path)
+        try:
+            cursor = conn.execute(f'SELECT {", ".join(TRAINING_COLUMNS)}, "{target}" FROM "{table}"')
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    return
+                yield pd.DataFrame([tuple(row) for row in rows], columns=TRAINING_COLUMNS + ['range_km'])
+        finally:
+            conn.close()
+
+    return generate()
+
+def iter_csv_chunks(path, chunk_size, target='range_km'):
+    """Stream training rows from a CSV file."""
+    for chunk in pd.read_csv(path, usecols=TRAINING_COLUMNS + [target], chunksize=chunk_size):
+        yield chunk.rename(columns={target: 'range_km'})
+
+def iter_parquet_chunks(path, chunk_size, target='range_km'):
+    """Stream training rows from a Parquet file (requires pyarrow)."""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Reading Parquet files requires pyarrow: pip install pyarrow")
+
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=TRAINING_COLUMNS + [target]):
+        yield batch.to_pandas().rename(columns={target: 'range_km'})
+
+def main(argv=None):
+    """Train the model incrementally from history, CSV or Parquet data."""
+    from models.range_predictor import RangePredictor
+
+    parser = argparse.ArgumentParser(description='Incrementally train the VoltSage range model.')
+    parser.add_argument('--source', choices=['sqlite', 'csv', 'parquet', 'synthetic'], required=True)
+    parser.add_argument('--path', help='CSV or Parquet file')
+    parser.add_argument('--database', default=Config.DATABASE_PATH, help='SQLite database path')
+    parser.add_argument('--table', help='SQLite table of measured trips')
+    parser.add_argument('--target', help='Column holding the range in km')
+    parser.add_argument('--samples', type=int, default=1000000, help='Rows to generate for --source synthetic')
+    parser.add_argument('--base-range-km', type=float, default=400.0,
+                        help='Ideal-conditions range of the vehicle for --source synthetic')
+    parser.add_argument('--memory-limit-mb', type=float, default=Config.TRAINING_MEMORY_LIMIT_MB)
+    parser.add_argument('--estimators-per-chunk', type=int, default=Config.TRAINING_ESTIMATORS_PER_CHUNK)
+    parser.add_argument('--max-estimators', type=int, default=Config.TRAINING_MAX_ESTIMATORS)
+    parser.add_argument('--model-path', default=Config.MODEL_PATH)
+    options = parser.parse_args(argv)
+
+    if options.source in ('csv', 'parquet') and not options.path:
+        parser.error(f'--path is required for --source {options.source}')
+    if options.source == 'sqlite' and not (options.table and options.target):
+        parser.error('--table and --target are required for --source sqlite: the prediction history '
+                     "only stores the model's own output, so name a table and column of measured ranges")
+
+    chunk_size = chunk_rows_for_memory(options.memory_limit_mb)
+    predictor = RangePredictor(model_path=options.model_path, load=False, base_range=options.base_range_km)
+
+    if options.source == 'sqlite':
+        try:
+            chunks = iter_sqlite_chunks(options.database, chunk_size, options.target, options.table)
+        except ValueError as e:
+            parser.error(str(e))
+    elif options.source == 'csv':
+        chunks = iter_csv_chunks(options.path, chunk_size, options.target or 'range_km')
+    elif options.source == 'parquet':
+        chunks = iter_parquet_chunks(options.path, chunk_size, options.target or 'range_km')
+    else:
+        chunks = predictor.generate_synthetic_chunks(options.samples, chunk_size)
+
+    print(f"Training in chunks of {chunk_size} rows ({options.memory_limit_mb:g} MB limit)")
+    predictor.train_incremental(
+        chunks,
+        estimators_per_chunk=options.estimators_per_chunk,
+        max_estimators=options.max_estimators
+    )
+
+if __name__ == '__main__':
+    main()
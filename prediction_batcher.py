@@ -0,0 +1,90 @@
+import asyncio
+import threading
+
+class PredictionBatcher:
+    """Coalesces concurrent single-row predictions into one batched model call.
+
+    Rows arriving within window seconds of the first pending row (or until
+    max_batch_size rows are pending) are evaluated together by predict_batch,
+    which takes columnar temperature, wind_speed, driving_style and cargo_weight
+    sequences. It runs in the event loop's default executor, so the loop keeps
+    accepting requests while a batch is evaluated.
+    """
+
+    def __init__(self, predict_batch, window=0.002, max_batch_size=256):
+        self.predict_batch = predict_batch
+        self.window = window
+        self.max_batch_size = max_batch_size
+
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+        self.largest_batch = 0
+        self.failed = 0
+
+    async def predict(self, temperature, wind_speed, driving_style, cargo_weight):
+        """Predict one validated row as part of the next batch."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(((temperature, wind_speed, driving_style, cargo_weight), future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def stats(self):
+        """Return batch counters."""
+        with self._lock:
+            return {
+                'window_ms': self.window * 1000.0,
+                'max_batch_size': self.max_batch_size,
+                'pending': len(self._pending),
+                'batches': self.batches,
+                'rows': self.rows,
+                'mean_batch_size': self.rows / self.batches if self.batches else 0.0,
+                'largest_batch': self.largest_batch,
+                'failed': self.failed
+            }
+
+    def _flush(self):
+        """Start evaluating every pending row."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if batch:
+            # Keep a reference so the task is not garbage collected while it runs
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        """Evaluate a batch and resolve the waiting requests."""
+        columns = [list(column) for column in zip(*(row for row, _ in batch))]
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(None, self.predict_batch, *columns)
+        except Exception as e:
+            with self._lock:
+                self.failed += len(batch)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        with self._lock:
+            self.batches += 1
+            self.rows += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+
+        # Requests whose clients disconnected have cancelled futures
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(float(result))
@@ -6,7 +6,7 @@ Run this script to start the VoltSage EV Range Predictor application.
 
 import os
 import sys
-from app import app
+from app import app, init_app
 from config import config
 
 def main():
@@ -35,6 +35,7 @@ def main():
         sys.exit(1)
     
     # Start the application
+    init_app()
     try:
         print(f"🌐 Starting server on http://{app.config['HOST']}:{app.config['PORT']}")
         print("📱 Press Ctrl+C to stop the server")
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+VoltSage ASGI Startup Script
+Serves the application through asgi.py, which micro-batches concurrent
+/api/predict requests. Requires an ASGI server: pip install uvicorn
+"""
+
+import os
+import sys
+from config import Config
+
+def main():
+    """Start the VoltSage ASGI server."""
+    try:
+        import uvicorn
+    except ImportError:
+        print("❌ The async server requires uvicorn: pip install uvicorn")
+        sys.exit(1)
+
+    # Check if database exists
+    if not os.path.exists(Config.DATABASE_PATH):
+        print("⚠️ Database not found. Please run setup_db.py first.")
+        print("   python setup_db.py")
+        sys.exit(1)
+
+    print("🚗 VoltSage EV Range Predictor (async)")
+    print("=" * 50)
+    print(f"Database: {Config.DATABASE_PATH}")
+    print(f"Model path: {Config.MODEL_PATH}")
+    print(f"Batch window: {Config.ASYNC_BATCH_WINDOW_MS:g} ms, max batch size: {Config.ASYNC_MAX_BATCH_SIZE}")
+    print("=" * 50)
+    print(f"🌐 Starting server on http://{Config.HOST}:{Config.PORT}")
+    print("📱 Press Ctrl+C to stop the server")
+    print("-" * 50)
+
+    # One process: the batcher coalesces requests within a worker
+    uvicorn.run('asgi:application', host=Config.HOST, port=Config.PORT, log_level=Config.LOG_LEVEL.lower())
+
+if __name__ == '__main__':
+    main()
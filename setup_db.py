@@ -1,16 +1,91 @@
-import sqlite3
 import os
+import sys
+from datetime import datetime
+from config import Config
+from database import connect
+from history_shards import ensure_shards, insert_predictions, shard_predictions_table
+from history_stats import create_rollup_tables, rebuild_rollups
 
-def setup_database():
+def _create_history_indexes(conn):
+    """Indexes for keyset pagination and filtered history queries."""
+    # id is the rowid, which SQLite appends to every index, so (created_at) also orders by id
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_predictions_style_created_at
+        ON predictions(driving_style, created_at)
+    ''')
+    
+    # Covers time-ordered scans filtered by style or temperature without table lookups
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_predictions_created_at_cover
+        ON predictions(created_at, driving_style, temperature, predicted_range)
+    ''')
+    
+    # Superseded by the covering index, which has the same leading column
+    conn.execute('DROP INDEX IF EXISTS idx_created_at')
+
+def _create_history_rollups(conn):
+    """Rollup tables behind /api/history/stats, backfilled from existing rows."""
+    create_rollup_tables(conn)
+    rebuild_rollups(conn)
+
+def _shard_history_by_month(conn):
+    """Monthly shard tables behind a predictions view, with ids from one sequence."""
+    shard_predictions_table(conn)
+
+# Schema migrations, applied in order; PRAGMA user_version records how many have run
+MIGRATIONS = [
+    _create_history_indexes,
+    _create_history_rollups,
+    _shard_history_by_month
+]
+
+def apply_migrations(conn):
+    """Bring the database schema up to date."""
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        migration(conn)
+        conn.execute(f'PRAGMA user_version = {number}')
+        print(f"Applied migration {number}: {migration.__name__}")
+    
+    # Have this and next month's shards ready before the first insert needs them
+    ensure_shards(conn)
+    conn.commit()
+    return len(MIGRATIONS) - version
+
+def migrate_database(database_path=None):
+    """Migrate an existing database in place."""
+    database_path = database_path or Config.DATABASE_PATH
+    
+    if not os.path.exists(database_path):
+        print(f"Database '{database_path}' not found. Run setup_db.py first.")
+        return False
+    
+    conn = connect(database_path)
+    applied = apply_migrations(conn)
+    if applied:
+        conn.execute('ANALYZE')
+    conn.close()
+    
+    print(f"Database '{database_path}' is up to date ({applied} migrations applied).")
+    return True
+
+def setup_database(database_path=None):
     """Create the SQLite database and tables."""
+    database_path = database_path or Config.DATABASE_PATH
     
     # Remove existing database if it exists
-    if os.path.exists('voltsage.db'):
-        os.remove('voltsage.db')
+    if os.path.exists(database_path):
+        os.remove(database_path)
         print("Removed existing database.")
     
+    # Remove leftover write-ahead log files
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(database_path + suffix):
+            os.remove(database_path + suffix)
+    
     # Create new database
-    conn = sqlite3.connect('voltsage.db')
+    conn = connect(database_path)
     cursor = conn.cursor()
     
     # Create predictions table
@@ -26,30 +101,32 @@ def setup_database():
         )
     ''')
     
-    # Create index for faster queries
-    cursor.execute('''
-        CREATE INDEX idx_created_at ON predictions(created_at)
-    ''')
+    # Create indexes, rollups and the monthly shards
+    apply_migrations(conn)
     
     # Insert some sample data for testing
+    created_at = datetime.now()
     sample_data = [
-        (20.0, 10.0, 'moderate', 100.0, 350.0),
-        (25.0, 5.0, 'eco', 50.0, 380.0),
-        (15.0, 15.0, 'aggressive', 200.0, 320.0),
-        (30.0, 8.0, 'moderate', 150.0, 340.0),
-        (10.0, 20.0, 'eco', 75.0, 360.0)
+        (20.0, 10.0, 'moderate', 100.0, 350.0, created_at),
+        (25.0, 5.0, 'eco', 50.0, 380.0, created_at),
+        (15.0, 15.0, 'aggressive', 200.0, 320.0, created_at),
+        (30.0, 8.0, 'moderate', 150.0, 340.0, created_at),
+        (10.0, 20.0, 'eco', 75.0, 360.0, created_at)
     ]
     
-    cursor.executemany('''
-        INSERT INTO predictions (temperature, wind_speed, driving_style, cargo_weight, predicted_range)
-        VALUES (?, ?, ?, ?, ?)
-    ''', sample_data)
+    insert_predictions(conn, sample_data)
+    
+    # Include the sample data in the statistics rollups
+    rebuild_rollups(conn)
     
     conn.commit()
     conn.close()
     
     print("Database setup completed successfully!")
-    print("Created 'voltsage.db' with predictions table and sample data.")
+    print(f"Created '{database_path}' with predictions table and sample data.")
 
 if __name__ == '__main__':
-    setup_database() 
\ No newline at end of file
+    if '--migrate' in sys.argv[1:]:
+        migrate_database()
+    else:
+        setup_database() 
\ No newline at end of file
@@ -4,9 +4,38 @@ Test script for VoltSage EV Range Predictor
 """
 
 import requests
+import asyncio
+import csv
 import json
+import io
+import os
+import shutil
+import tempfile
+import threading
 import time
+import numpy as np
+from datetime import datetime, timedelta
+from config import Config
 from models.range_predictor import RangePredictor
+from models.prediction_cache import PredictionCache
+from models.model_registry import ModelRegistry, UnknownVehicleError
+from models.training import iter_csv_chunks, iter_sqlite_chunks
+from models.tuning import build_candidates, evaluate_candidate, pareto_front, select_candidate
+from model_reloader import ModelReloader
+from prediction_batcher import PredictionBatcher
+import app as flask_app
+from asgi import call_wsgi
+from metrics import Histogram
+from database import ConnectionPool, connect
+from setup_db import setup_database
+from history_shards import insert_predictions, list_shards
+from history_stats import query_stats, rebuild_rollups, update_rollups
+from history_query import decode_cursor, encode_cursor, fetch_history_page
+from history_export import stream_history
+from history_retention import archive_shard, read_archive
+from history_writer import HistoryWriter
+from trip_simulation import simulate_trip
+from weather import FileWeatherProvider, WeatherError, WeatherService
 
 def test_model():
     """Test the machine learning model."""
@@ -65,6 +94,1102 @@ def test_model():
         print(f"❌ Model test failed: {e}")
         return False
 
+def run_test(test):
+    """Run a test for main()'s summary; returns whether it passed.
+    
+    Tests assert their checks, so a failure also fails the test under pytest.
+    """
+    try:
+        test()
+        return True
+    except Exception as e:
+        print(f"❌ {test.__name__} failed: {e}")
+        return False
+
+def test_batch_prediction():
+    """Test that batch predictions match single-row predictions."""
+    print("\n📦 Testing Batch Prediction...")
+    
+    predictor = RangePredictor()
+    
+    rows = [
+        (20, 10, 'moderate', 100),
+        (-5, 25, 'aggressive', 300),
+        (25, 5, 'eco', 50),
+        (35, 0, 'moderate', 450)
+    ]
+    
+    batch = predictor.predict_batch(
+        temperature=[row[0] for row in rows],
+        wind_speed=[row[1] for row in rows],
+        driving_style=[row[2] for row in rows],
+        cargo_weight=[row[3] for row in rows]
+    )
+    
+    for row, batch_range in zip(rows, batch):
+        single_range = predictor.predict_range(*row)
+        assert abs(single_range - batch_range) <= 1e-9, f"Batch mismatch for {row}: {batch_range} != {single_range}"
+    
+    print(f"✅ Batch of {len(rows)} predictions matches single predictions")
+
+def test_flat_engine():
+    """Test that the flat forest engine matches the sklearn engine exactly."""
+    print("\n🌲 Testing Flat Forest Engine...")
+    
+    sklearn_predictor = RangePredictor(engine='sklearn')
+    flat_predictor = RangePredictor(engine='flat')
+    
+    assert flat_predictor._flat_forest is not None, "Flat forest failed validation against model.predict"
+    
+    for case in [(20, 10, 'moderate', 100), (-30, 80, 'aggressive', 900), (45, 0, 'eco', 0)]:
+        expected = sklearn_predictor.predict_range(*case)
+        actual = flat_predictor.predict_range(*case)
+        assert expected == actual, f"Flat engine mismatch for {case}: {actual} != {expected}"
+    
+    print("✅ Flat engine predictions are identical")
+
+def test_trip_simulation():
+    """Test that a trip simulation matches per-segment predictions."""
+    print("\n🗺️ Testing Trip Simulation...")
+    
+    predictor = RangePredictor()
+    
+    summary, waypoints = simulate_trip(
+        predictor,
+        distance_km=[100, 120, 150],
+        temperature=[20, -5, 0],
+        wind_speed=[10, 30, 20],
+        driving_style=['moderate', 'moderate', 'aggressive'],
+        cargo_change=[0, -150, 0],
+        initial_cargo_weight=200
+    )
+    
+    # Charge used by each segment, from one /api/predict style call per segment
+    charge = 100.0
+    for distance, case in zip([100, 120, 150], [(20, 10, 'moderate', 200), (-5, 30, 'moderate', 50),
+                                                 (0, 20, 'aggressive', 50)]):
+        charge -= distance / predictor.predict_range(*case) * 100.0
+    
+    assert abs(summary['final_charge_percent'] - charge) <= 0.001 and len(waypoints) == 3, \
+        f"Trip charge {summary['final_charge_percent']} != {charge:.3f}"
+    assert summary['feasible'] == (charge >= 0), "Trip feasibility does not match the final charge"
+    
+    print(f"✅ Trip simulation works: {summary['final_charge_percent']:.1f}% charge after "
+          f"{summary['total_distance_km']:.0f} km")
+
+def test_model_registry():
+    """Test lazy per-vehicle model loading with LRU eviction under a memory budget."""
+    print("\n🚙 Testing Model Registry...")
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for vehicle_id, base_range in [('city', 250), ('sedan', 450), ('suv', 520)]:
+            predictor = RangePredictor(model_path=os.path.join(temp_dir, f'{vehicle_id}.joblib'),
+                                       load=False, base_range=base_range)
+            predictor.train_model(n_estimators=5, n_samples=500)
+        
+        # Budget for two of the three models
+        model_size = predictor.memory_bytes()
+        registry = ModelRegistry(temp_dir, lambda path: RangePredictor(model_path=path, load=False),
+                                 memory_budget_bytes=int(model_size * 2.5))
+        assert registry.vehicle_ids() == ['city', 'sedan', 'suv'] and not registry.loaded(), \
+            "Registry should list the vehicles without loading them"
+        
+        # Concurrent first requests share one load
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            predictors = list(executor.map(lambda _: registry.get('city'), range(4)))
+        city_range = predictors[0].predict_range(20, 10, 'moderate', 100)
+        assert len({id(p) for p in predictors}) == 1 and registry.stats()['loads'] == 1, \
+            "Concurrent requests loaded the model more than once"
+        
+        # Loading a third model evicts the least recently used one
+        registry.get('sedan')
+        registry.get('city')
+        suv_range = registry.get('suv', rows=10).predict_range(20, 10, 'moderate', 100)
+        assert registry.loaded() == ['city', 'suv'], f"Unexpected loaded models: {registry.loaded()}"
+        assert city_range < suv_range, f"Vehicle models are not distinct: {city_range:.2f} vs {suv_range:.2f} km"
+        
+        try:
+            registry.get('../city')
+        except UnknownVehicleError:
+            pass
+        else:
+            raise AssertionError("Unknown vehicle should be rejected")
+        
+        stats = registry.stats()
+        usage = stats['models']
+        assert usage['city']['requests'] == 5 and usage['suv']['rows'] == 10 and usage['sedan']['evictions'] == 1, \
+            f"Unexpected usage stats: {usage}"
+        assert stats['memory_bytes'] <= stats['memory_budget_bytes'], "Loaded models exceed the memory budget"
+        
+        print(f"✅ Model registry works: {stats['loaded']} of 3 models loaded, "
+              f"{stats['evictions']} eviction, city {city_range:.2f} km, SUV {suv_range:.2f} km")
+
+def test_weather_service():
+    """Test cached, coalesced and bulk weather lookups with the file provider."""
+    print("\n🌦️ Testing Weather Service...")
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        stub_path = os.path.join(temp_dir, 'weather_stub.json')
+        with open(stub_path, 'w') as f:
+            json.dump({'observations': [
+                {'latitude': 52.52, 'longitude': 13.40, 'time': '2025-01-15T08:00',
+                 'temperature': -2.5, 'wind_speed': 18},
+                {'latitude': 48.85, 'longitude': 2.35, 'temperature': 8, 'wind_speed': 25}
+            ]}, f)
+        
+        class SlowProvider(FileWeatherProvider):
+            """File provider that takes long enough for lookups to overlap."""
+            def fetch(self, cells):
+                time.sleep(0.05)
+                return super().fetch(cells)
+        
+        service = WeatherService(SlowProvider(stub_path), ttl=60, precision=5)
+        when = datetime(2025, 1, 15, 8, 40)
+        
+        # Points in the same cell and hour share one lookup
+        berlin = service.lookup_many([(52.52, 13.40, when), (52.521, 13.401, when.replace(minute=5))])
+        assert [row['temperature'] for row in berlin] == [-2.5, -2.5] and service.stats()['fetches'] == 1, \
+            f"Unexpected bulk lookup: {berlin}"
+        
+        # Concurrent lookups of an uncached cell wait for a single fetch
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: service.lookup(48.85, 2.35, when), range(8)))
+        stats = service.stats()
+        assert all(result['wind_speed'] == 25 for result in results) and stats['fetches'] == 2, \
+            f"Concurrent lookups were not coalesced: {stats}"
+        
+        # Cells without data fail, and the failure is not cached
+        try:
+            service.lookup(0.0, 0.0, when)
+        except WeatherError:
+            pass
+        else:
+            raise AssertionError("Lookup without data should fail")
+        assert service.stats()['errors'] == 1 and service.lookup(52.52, 13.40, when)['temperature'] == -2.5, \
+            "Failed lookup changed the cache"
+        
+        stats = service.stats()
+        print(f"✅ Weather service works: {stats['fetches']} fetches, {stats['hits']} hits, "
+              f"{stats['coalesced']} coalesced")
+
+def test_history_shards():
+    """Test monthly history shards, shard-routed paging and archiving."""
+    print("\n🗄️ Testing History Shards...")
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        database_path = os.path.join(temp_dir, 'history.db')
+        setup_database(database_path)
+        conn = connect(database_path)
+        
+        # Three months of rows, plus the sample rows from setup
+        start = datetime(2025, 11, 20)
+        insert_predictions(conn, [
+            (20.0, 10.0, 'moderate', 100.0, 300.0 + i % 50, start + timedelta(hours=9 * i)) for i in range(300)
+        ])
+        conn.commit()
+        
+        # Paging through the shards returns the same rows as the view
+        expected = [row['id'] for row in conn.execute('SELECT id FROM predictions ORDER BY created_at DESC, id DESC')]
+        ids, args = [], {'limit': '40'}
+        while True:
+            page, _, limit = fetch_history_page(conn, args)
+            ids.extend(row['id'] for row in page)
+            if len(page) < limit:
+                break
+            args = {'limit': '40', 'cursor': encode_cursor(page[-1]['created_at'], page[-1]['id'])}
+        assert ids == expected and len(set(ids)) == len(ids), \
+            f"Shard paging returned {len(ids)} rows, expected {len(expected)}"
+        
+        # Archiving a month drops its shard and keeps every row in the file
+        count = conn.execute('SELECT COUNT(*) FROM predictions_2025_11').fetchone()[0]
+        shard_rows = conn.execute('SELECT id, driving_style, created_at FROM predictions_2025_11 ORDER BY created_at, id').fetchall()
+        path, archived = archive_shard(conn, 'predictions_2025_11', os.path.join(temp_dir, 'archive'), chunk_size=7)
+        remaining = conn.execute('SELECT COUNT(*) FROM predictions').fetchone()[0]
+        assert archived == count and len(read_archive(path)['id']) == count and remaining == len(expected) - count, \
+            "Archived rows do not match the dropped shard"
+        archive = read_archive(path)
+        assert list(zip(archive['id'].tolist(), archive['driving_style'].tolist(), archive['created_at'].tolist())) == \
+            [tuple(row) for row in shard_rows], "Chunked archive does not hold the shard rows in order"
+        assert 'predictions_2025_11' not in list_shards(conn), "Archived shard was not dropped"
+        conn.close()
+        
+        print(f"✅ History shards work: {len(expected)} rows paged, {count} archived")
+
+def test_stage_metrics():
+    """Test predictor stage timings and their Prometheus rendering."""
+    print("\n⏱️ Testing Stage Metrics...")
+    
+    histogram = Histogram('voltsage_predictor_stage_seconds', 'Predictor stages.', ['stage'])
+    predictor = RangePredictor(metrics=histogram)
+    predictor.predict_range(20, 10, 'moderate', 100)
+    predictor.predict_batch([20, 25], [10, 5], ['moderate', 'eco'], [100, 50])
+    
+    counts = {labels[0]: sum(series[0]) for labels, series in histogram.snapshot().items()}
+    assert counts == {'predict_range': 1, 'model': 1, 'batch_features': 1, 'batch_model': 1}, \
+        f"Unexpected stage counts: {counts}"
+    
+    lines = histogram.render()
+    expected = [
+        'voltsage_predictor_stage_seconds_bucket{stage="model",le="+Inf"} 1',
+        'voltsage_predictor_stage_seconds_count{stage="model"} 1',
+        '# TYPE voltsage_predictor_stage_seconds histogram'
+    ]
+    assert all(line in lines for line in expected), "Histogram rendering is missing expected lines"
+    
+    print(f"✅ Stage metrics work: {len(lines)} exposition lines")
+
+def test_prediction_batcher():
+    """Test that concurrent async predictions are coalesced into batches."""
+    print("\n🧺 Testing Prediction Batcher...")
+    
+    predictor = RangePredictor()
+    batcher = PredictionBatcher(predictor.predict_batch, window=0.005, max_batch_size=16)
+    cases = [(-10 + i, i % 40, ['aggressive', 'moderate', 'eco'][i % 3], 20 * i) for i in range(40)]
+    
+    async def predict_all():
+        return await asyncio.gather(*(batcher.predict(*case) for case in cases))
+    
+    results = asyncio.run(predict_all())
+    expected = [predictor.predict_range(*case) for case in cases]
+    assert all(abs(result - value) <= 1e-9 for result, value in zip(results, expected)), \
+        "Batched predictions differ from single-row predictions"
+    
+    stats = batcher.stats()
+    assert stats['rows'] == len(cases) and stats['batches'] == 3 and stats['largest_batch'] == 16, \
+        f"Unexpected batching: {stats}"
+    
+    # Batched rows share the cache with single predictions, and a lone row takes the fast path
+    cached = RangePredictor(cache=PredictionCache())
+    reference = RangePredictor(cache=PredictionCache())
+    columns = [list(column) for column in zip(*(cases + cases[:5]))]
+    assert cached.predict_many(*columns) == [reference.predict_range(*case) for case in cases + cases[:5]], \
+        "Cached batch predictions differ from cached single-row predictions"
+    cached.predict_many(*columns)
+    assert cached.cache.stats()['entries'] == len(cases) and cached.cache.stats()['hits'] == len(cases) + 5, \
+        f"Unexpected cache use: {cached.cache.stats()}"
+    assert cached.predict_many([21.0], [3.0], ['eco'], [80.0]) == [reference.predict_range(21.0, 3.0, 'eco', 80.0)], \
+        "Single-row batch differs from predict_range"
+    
+    print(f"✅ Prediction batcher works: {stats['rows']} requests in {stats['batches']} batches")
+
+def test_prediction_percentiles():
+    """Test per-tree percentile bands for single and batch predictions."""
+    print("\n📊 Testing Prediction Percentiles...")
+    
+    predictor = RangePredictor()
+    
+    predicted_range, (p10, p90) = predictor.predict_range(20, 10, 'moderate', 100, percentiles=[10, 90])
+    assert predicted_range == predictor.predict_range(20, 10, 'moderate', 100) and p10 <= p90, \
+        f"Unexpected percentiles: {predicted_range:.2f} km, P10 {p10:.2f}, P90 {p90:.2f}"
+    
+    predictions, bands = predictor.predict_batch(
+        [20, -10], [10, 40], ['moderate', 'aggressive'], [100, 800], percentiles=[10, 90]
+    )
+    assert bands.shape == (2, 2) and bands[0, 0] == p10 and bands[1, 0] == p90, \
+        f"Batch percentiles do not match single-row percentiles: {bands}"
+    
+    print(f"✅ Percentile bands work: {predicted_range:.2f} km (P10 {p10:.2f}, P90 {p90:.2f})")
+
+def test_compact_engine():
+    """Test that the compact surrogate stays within its error bound of the forest."""
+    print("\n📐 Testing Compact Engine...")
+    
+    forest_predictor = RangePredictor()
+    
+    with tempfile.TemporaryDirectory() as directory:
+        model_path = os.path.join(directory, 'ev_range_model.joblib')
+        shutil.copy(forest_predictor.model_path, model_path)
+        
+        # The first load distills the surrogate, the second loads it without the forest
+        RangePredictor(model_path=model_path, engine='compact')
+        compact_predictor = RangePredictor(model_path=model_path, engine='compact')
+        compact = compact_predictor.compact
+        assert compact is not None and compact_predictor.model is None, "Compact model was not loaded on its own"
+        
+        for case in [(20, 10, 'moderate', 100), (-30, 80, 'aggressive', 900), (45, 0, 'eco', 0)]:
+            error = abs(compact_predictor.predict_range(*case) - forest_predictor.predict_range(*case))
+            assert error <= compact.max_error + 1e-9, \
+                f"Compact error {error:.2f} km for {case} exceeds {compact.max_error:.2f} km"
+    
+    print(f"✅ Compact engine: {compact.n_parameters} parameters, "
+          f"max error {compact.max_error:.2f} km, mean error {compact.mean_error:.2f} km")
+
+def test_memory_mapped_model():
+    """Test that the memory-mapped forest artifact serves identical predictions."""
+    print("\n🗺️ Testing Memory-Mapped Model...")
+    
+    sklearn_predictor = RangePredictor()
+    
+    with tempfile.TemporaryDirectory() as directory:
+        model_path = os.path.join(directory, 'ev_range_model.joblib')
+        shutil.copy(sklearn_predictor.model_path, model_path)
+        
+        # The first load exports the artifact, the second maps it without unpickling
+        RangePredictor(model_path=model_path, model_format='mmap')
+        mapped_predictor = RangePredictor(model_path=model_path, model_format='mmap')
+        assert mapped_predictor.memory_mapped, "Forest artifact was not memory-mapped"
+        
+        for case in [(20, 10, 'moderate', 100), (-30, 80, 'aggressive', 900), (45, 0, 'eco', 0)]:
+            expected = sklearn_predictor.predict_range(*case)
+            actual = mapped_predictor.predict_range(*case)
+            assert expected == actual, f"Memory-mapped mismatch for {case}: {actual} != {expected}"
+        
+        # A corrupted artifact fails its checksum and falls back to the pickle
+        with open(mapped_predictor.forest_path, 'r+b') as f:
+            f.seek(-1, os.SEEK_END)
+            last = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(bytes([last[0] ^ 1]))
+        assert mapped_predictor._load_forest_artifact() is None, "Corrupted forest artifact passed the checksum"
+    
+    print("✅ Memory-mapped predictions are identical")
+
+def test_model_reload():
+    """Test that a reload swaps in a valid model and keeps the old one on failure."""
+    print("\n🔄 Testing Model Reload...")
+    
+    with tempfile.TemporaryDirectory() as directory:
+        model_path = os.path.join(directory, 'ev_range_model.joblib')
+        shutil.copy(RangePredictor().model_path, model_path)
+        
+        active = []
+        reloader = ModelReloader(
+            lambda load: RangePredictor(model_path=model_path, load=load),
+            lambda predictor, seconds: active.append(predictor)
+        )
+        
+        assert reloader.reload() and len(active) == 1, "Valid model was not swapped in"
+        
+        with open(model_path, 'wb') as f:
+            f.write(b'not a model')
+        try:
+            reloader.reload()
+        except Exception:
+            pass
+        else:
+            raise AssertionError("Corrupted model was swapped in")
+        
+        stats = reloader.stats()
+        assert len(active) == 1 and stats['reloads'] == 1 and stats['failures'] == 1, \
+            f"Unexpected reload counters: {stats}"
+    
+    print(f"✅ Reload swaps valid models and rejects broken ones: {stats['reloads']} reload, {stats['failures']} failure")
+
+def test_prediction_cache():
+    """Test prediction cache hits, evictions and invalidation."""
+    print("\n🗃️ Testing Prediction Cache...")
+    
+    cache = PredictionCache(max_entries=2)
+    predictor = RangePredictor(cache=cache)
+    
+    first = predictor.predict_range(20.1, 10.2, 'moderate', 101)
+    second = predictor.predict_range(20, 10, 'moderate', 100)
+    predictor.predict_range(5, 1, 'eco', 1)
+    predictor.predict_range(-5, 1, 'eco', 1)
+    
+    stats = cache.stats()
+    assert first == second and stats['hits'] == 1 and stats['misses'] == 3 and stats['evictions'] == 1, \
+        f"Unexpected cache behaviour: {stats}"
+    
+    predictor.load_model()
+    assert cache.stats()['entries'] == 0, "Cache was not invalidated after reloading the model"
+    
+    print(f"✅ Cache hits, evictions and invalidation work: {stats}")
+
+def test_range_grid():
+    """Test grid interpolation accuracy and the forest fallback outside the grid."""
+    print("\n🧮 Testing Range Grid...")
+    
+    forest_predictor = RangePredictor()
+    
+    with tempfile.TemporaryDirectory() as directory:
+        model_path = os.path.join(directory, 'ev_range_model.joblib')
+        shutil.copy(forest_predictor.model_path, model_path)
+        
+        # A coarse grid keeps the build quick; the second load reads the saved grid
+        RangePredictor(model_path=model_path, engine='grid', grid_steps=(5.0, 10.0, 100.0))
+        grid_predictor = RangePredictor(model_path=model_path, engine='grid', grid_steps=(5.0, 10.0, 100.0))
+        grid = grid_predictor.grid
+        assert grid is not None and grid.max_error is not None, "Range grid was not loaded"
+        
+        # Grid points hold the forest's own predictions
+        for case in [(20, 10, 'moderate', 100), (-40, 0, 'eco', 0), (50, 100, 'aggressive', 1000)]:
+            error = abs(grid_predictor.predict_range(*case) - forest_predictor.predict_range(*case))
+            assert error <= 1e-9, f"Grid point {case} differs from the forest by {error:.6f} km"
+        
+        # Between grid points the error stays close to the measured one
+        rng = np.random.default_rng(7)
+        rows = [rng.uniform(-40, 50, 500), rng.uniform(0, 100, 500),
+                rng.choice(['aggressive', 'moderate', 'eco'], 500).tolist(), rng.uniform(0, 1000, 500)]
+        errors = np.abs(grid_predictor.predict_batch(*rows) - forest_predictor.predict_batch(*rows))
+        assert errors.mean() <= 2 * grid.mean_error, \
+            f"Mean interpolation error {errors.mean():.2f} km, measured {grid.mean_error:.2f} km"
+        single = [grid_predictor.predict_range(*row) for row in zip(*rows)][:20]
+        assert np.allclose(single, grid_predictor.predict_batch(*rows)[:20], rtol=0, atol=1e-9), \
+            "Single-row and batch interpolation differ"
+        
+        # Inputs outside the grid are answered by the forest exactly
+        outside = [(60, 10, 'moderate', 100), (20, 120, 'eco', 50), (0, 5, 'aggressive', 1500)]
+        for case in outside:
+            assert not grid.contains(case[0], case[1], case[3]), f"{case} should be outside the grid"
+            assert grid_predictor.predict_range(*case) == forest_predictor.predict_range(*case), \
+                f"Out-of-grid prediction for {case} does not match the forest"
+        mixed = list(zip(*([(20, 10, 'moderate', 100)] + outside)))
+        batch = grid_predictor.predict_batch(*mixed)
+        expected = forest_predictor.predict_batch(*mixed)
+        assert np.allclose(batch[1:], expected[1:], rtol=0, atol=1e-9), \
+            "Out-of-grid batch rows do not match the forest"
+    
+    print(f"✅ Range grid works: max error {grid.max_error:.2f} km, mean error {grid.mean_error:.2f} km, "
+          f"{len(outside)} out-of-grid inputs served by the forest")
+
+def test_history_writer():
+    """Test writer batching, flushing, dropping when full and connection retries."""
+    print("\n✍️ Testing History Writer...")
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        database_path = os.path.join(temp_dir, 'history.db')
+        setup_database(database_path)
+        row = (20.0, 10.0, 'moderate', 100.0, 350.0, datetime(2025, 6, 1, 12, 0))
+        
+        # Rows queued together are committed in batches of at most batch_size
+        writer = HistoryWriter(lambda: connect(database_path), batch_size=50, flush_interval=0.05)
+        writer.start()
+        assert writer.submit([row] * 120) == 0, "Rows were dropped below the queue capacity"
+        writer.flush()
+        stats = writer.stats()
+        assert stats['written'] == 120 and stats['queue_depth'] == 0, f"Flush left rows unwritten: {stats}"
+        assert 3 <= stats['batches'] < 120, f"Rows were not batched: {stats}"
+        writer.close()
+        
+        conn = connect(database_path)
+        stored = conn.execute("SELECT COUNT(*) FROM predictions WHERE created_at LIKE '2025-06-01%'").fetchone()[0]
+        conn.close()
+        assert stored == 120, f"{stored} of 120 rows were stored"
+        
+        # A full queue drops new rows instead of blocking the caller
+        writer = HistoryWriter(lambda: connect(database_path), max_queue_size=10)
+        assert writer.submit([row] * 15) == 5, "Rows beyond the queue capacity were not dropped"
+        writer.start()
+        writer.flush()
+        writer.close()
+        stats = writer.stats()
+        assert stats['dropped'] == 5 and stats['written'] == 10, f"Unexpected drop counters: {stats}"
+        
+        # Rows are counted as failed while the database cannot be opened, and flush still returns
+        attempts = []
+        
+        def unavailable():
+            attempts.append(time.monotonic())
+            raise OSError('database unavailable')
+        
+        writer = HistoryWriter(unavailable, batch_size=10, retry_interval=0.01)
+        writer.start()
+        writer.submit([row] * 3)
+        writer.flush()
+        writer.close(timeout=1.0)
+        stats = writer.stats()
+        assert stats['failed'] == 3 and stats['connect_errors'] == len(attempts) >= 1, \
+            f"Unexpected failure counters: {stats}"
+        
+        # Without a running thread, flush writes the queued rows itself instead of hanging
+        writer = HistoryWriter(lambda: connect(database_path))
+        writer.submit([row] * 4)
+        writer.flush()
+        writer.start()
+        writer.close()
+        writer.submit([row] * 2)
+        writer.flush()
+        stats = writer.stats()
+        assert stats['written'] == 6 and stats['queue_depth'] == 0, f"Flush without a thread left rows: {stats}"
+    
+    print("✅ History writer batches, flushes, drops when full and survives connection errors")
+
+def create_history_database(directory, n_rows=300):
+    """Create a history database with the setup sample rows plus n_rows rows over three months."""
+    database_path = os.path.join(directory, 'history.db')
+    setup_database(database_path)
+    rows = [
+        (-10.0 + (i * 7) % 50, float(i % 30), ['aggressive', 'moderate', 'eco'][i % 3], float((i * 37) % 500),
+         250.0 + (i * 13) % 200 + 0.25, datetime(2025, 11, 20) + timedelta(hours=7 * i))
+        for i in range(n_rows)
+    ]
+    conn = connect(database_path)
+    insert_predictions(conn, rows)
+    update_rollups(conn, rows)
+    conn.commit()
+    conn.close()
+    return database_path
+
+def test_history_pages():
+    """Test keyset cursor round trips, filters and projection of history pages."""
+    print("\n📜 Testing History Pages...")
+    
+    # Cursors round-trip the keyset position, and malformed ones are rejected
+    assert decode_cursor(encode_cursor('2025-12-01 10:00:00', 42)) == ('2025-12-01 10:00:00', 42), \
+        "Cursor did not round-trip"
+    for cursor in ['not-a-cursor', encode_cursor('2025-12-01', 1)[:-4]]:
+        try:
+            decode_cursor(cursor)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"Malformed cursor {cursor!r} was accepted")
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        conn = connect(create_history_database(temp_dir))
+        
+        # Filtered pages, followed by their cursors, return exactly the filtered rows newest first
+        filters = {'driving_style': 'eco', 'min_temperature': '0', 'max_temperature': '25',
+                   'start': '2025-12-01', 'end': '2026-02-01T12:00:00'}
+        expected = [row['id'] for row in conn.execute('''
+            SELECT id FROM predictions
+            WHERE driving_style = 'eco' AND temperature >= 0 AND temperature <= 25
+              AND created_at >= '2025-12-01 00:00:00' AND created_at < '2026-02-01 12:00:00'
+            ORDER BY created_at DESC, id DESC
+        ''')]
+        ids, args, pages = [], dict(filters, limit='7'), 0
+        while True:
+            page, fields, limit = fetch_history_page(conn, args)
+            ids.extend(row['id'] for row in page)
+            pages += 1
+            if len(page) < limit:
+                break
+            args = dict(filters, limit='7', cursor=encode_cursor(page[-1]['created_at'], page[-1]['id']))
+        assert expected and ids == expected, f"Filtered paging returned {len(ids)} rows, expected {len(expected)}"
+        
+        # Projection returns the requested fields, plus the keyset columns for the cursor
+        page, fields, _ = fetch_history_page(conn, {'fields': 'predicted_range,driving_style', 'limit': '3'})
+        assert fields == ['predicted_range', 'driving_style'] and len(page) == 3, f"Unexpected projection: {fields}"
+        assert set(page[0].keys()) == {'predicted_range', 'driving_style', 'created_at', 'id'}, \
+            f"Unexpected projected columns: {page[0].keys()}"
+        
+        # Invalid arguments are rejected before any shard is read
+        for bad in [{'limit': '0'}, {'limit': 'many'}, {'fields': 'password'}, {'driving_style': 'sporty'},
+                    {'min_temperature': 'warm'}, {'start': 'yesterday'}]:
+            try:
+                fetch_history_page(conn, bad)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(f"Invalid arguments {bad} were accepted")
+        conn.close()
+    
+    print(f"✅ History pages work: {len(expected)} filtered rows in {pages} pages")
+
+def test_history_export():
+    """Test that NDJSON and CSV exports stream the filtered history, oldest first."""
+    print("\n📤 Testing History Export...")
+    
+    # Bad arguments are rejected when the stream is created, not halfway through it
+    for args, fmt in [({}, 'xml'), ({'driving_style': 'sporty'}, 'csv'), ({'fields': 'password'}, 'ndjson')]:
+        try:
+            stream_history(args, fmt)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"Invalid export {fmt} {args} was accepted")
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        database_path = create_history_database(temp_dir)
+        conn = connect(database_path)
+        fields = ['created_at', 'driving_style', 'temperature', 'predicted_range']
+        expected = [tuple(row) for row in conn.execute('''
+            SELECT created_at, driving_style, temperature, predicted_range FROM predictions
+            WHERE driving_style = 'moderate' AND created_at >= '2025-12-15 00:00:00'
+              AND created_at < '2026-02-10 00:00:00'
+            ORDER BY created_at, id
+        ''')]
+        conn.close()
+        args = {'driving_style': 'moderate', 'start': '2025-12-15', 'end': '2026-02-10', 'fields': ','.join(fields)}
+        
+        # NDJSON streams one object per row, across shards, in small chunks
+        chunks = list(stream_history(args, 'ndjson', chunk_size=4, database_path=database_path))
+        exported = [json.loads(line) for line in ''.join(chunks).splitlines()]
+        assert expected and [tuple(row[field] for field in fields) for row in exported] == expected, \
+            f"NDJSON export returned {len(exported)} rows, expected {len(expected)}"
+        assert len(chunks) > len(expected) // 4, f"Export was not streamed in chunks: {len(chunks)}"
+        
+        # CSV starts with a header row and holds the same rows as text
+        text = ''.join(stream_history(args, 'csv', chunk_size=4, database_path=database_path))
+        header, *records = list(csv.reader(io.StringIO(text)))
+        assert header == fields, f"Unexpected CSV header: {header}"
+        assert records == [[str(value) for value in row] for row in expected], "CSV rows differ from the history"
+        
+        # Without filters every row is exported, still oldest first
+        everything = [json.loads(line) for line in ''.join(stream_history({}, database_path=database_path)).splitlines()]
+        assert len(everything) == 305, f"Unfiltered export returned {len(everything)} rows"
+        keys = [(row['created_at'], row['id']) for row in everything]
+        assert keys == sorted(keys), "Unfiltered export is not ordered oldest first"
+    
+    print(f"✅ History export works: {len(expected)} filtered rows in {len(chunks)} NDJSON chunks")
+
+def test_history_stats():
+    """Test rollup statistics against the raw prediction rows."""
+    print("\n📈 Testing History Stats...")
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        conn = connect(create_history_database(temp_dir))
+        bin_width = 5.0
+        
+        # Rollups maintained batch by batch match a rebuild from the predictions table
+        incremental = query_stats(conn, {'percentiles': '10,50,90'}, bin_width=bin_width)
+        rebuild_rollups(conn, bin_width=bin_width)
+        rebuilt = query_stats(conn, {'percentiles': '10,50,90'}, bin_width=bin_width)
+        assert len(incremental['groups']) == len(rebuilt['groups']) == 3, "Expected one group per driving style"
+        for before, after in zip(incremental['groups'], rebuilt['groups']):
+            assert before.keys() == after.keys() and before['driving_style'] == after['driving_style'], \
+                f"Groups differ: {before} vs {after}"
+            for key in ['count', 'mean', 'min', 'max', 'p10', 'p50', 'p90']:
+                assert abs(before[key] - after[key]) < 1e-9, \
+                    f"{before['driving_style']}: incremental {key} {before[key]} != rebuilt {after[key]}"
+        
+        # Counts, means and extremes are exact and percentiles are within one histogram bin
+        for group in rebuilt['groups']:
+            ranges = np.array([row[0] for row in conn.execute(
+                'SELECT predicted_range FROM predictions WHERE driving_style = ?', (group['driving_style'],)
+            )])
+            assert group['count'] == len(ranges), f"{group['driving_style']}: count {group['count']} != {len(ranges)}"
+            assert abs(group['mean'] - ranges.mean()) < 1e-9, f"{group['driving_style']}: mean differs"
+            assert (group['min'], group['max']) == (ranges.min(), ranges.max()), \
+                f"{group['driving_style']}: extremes differ"
+            for percentile in [10, 50, 90]:
+                exact = np.percentile(ranges, percentile)
+                assert abs(group[f'p{percentile}'] - exact) <= bin_width, \
+                    f"{group['driving_style']}: p{percentile} {group[f'p{percentile}']:.1f} vs {exact:.1f}"
+        
+        # Hour aligned time bounds count exactly the raw rows inside them
+        args = {'group_by': 'hour', 'start': '2025-12-03T05:00', 'end': '2026-01-04T17:00'}
+        stats = query_stats(conn, args, bin_width=bin_width)
+        expected = conn.execute('''
+            SELECT COUNT(*) FROM predictions
+            WHERE created_at >= '2025-12-03 05:00:00' AND created_at < '2026-01-04 17:00:00'
+        ''').fetchone()[0]
+        assert stats['period'] == 'hour', f"Unexpected period: {stats['period']}"
+        assert expected and sum(group['count'] for group in stats['groups']) == expected, \
+            "Time bounded counts differ from the raw rows"
+        assert len(stats['groups']) == expected, "Each 7 hour apart row should have its own hour"
+        
+        # Bounds inside an hour are widened to the whole hours they touch
+        args = {'group_by': 'hour', 'start': '2025-12-03T05:30', 'end': '2026-01-04T16:10'}
+        rounded = query_stats(conn, args, bin_width=bin_width)
+        assert (rounded['start'], rounded['end']) == ('2025-12-03 05:00:00', '2026-01-04 17:00:00'), \
+            f"Bounds were not rounded to the hour: {rounded['start']} - {rounded['end']}"
+        assert rounded['groups'] == stats['groups'], "Unaligned bounds changed the hourly groups"
+        
+        # Invalid grouping, percentiles and driving styles are rejected
+        for bad in [{'group_by': 'month'}, {'group_by': 'hour,day'}, {'percentiles': '101'}, {'driving_style': 'sporty'}]:
+            try:
+                query_stats(conn, bad)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(f"Invalid stats arguments {bad} were accepted")
+        conn.close()
+    
+    print(f"✅ History stats match the raw rows for {len(rebuilt['groups'])} driving styles")
+
+def test_synthetic_data():
+    """Test that the vectorized generator is deterministic and matches the original per-row loop."""
+    print("\n🎲 Testing Synthetic Data...")
+    
+    predictor = RangePredictor()
+    n_samples = 20000
+    
+    # The same seed reproduces the same rows, a different seed does not
+    data = predictor.generate_synthetic_data(n_samples)
+    assert data.equals(predictor.generate_synthetic_data(n_samples)), "Same seed produced different data"
+    assert not data.equals(predictor.generate_synthetic_data(n_samples, seed=7)), "Different seeds produced the same data"
+    chunks = [chunk.reset_index(drop=True) for chunk in predictor.generate_synthetic_chunks(2500, chunk_size=1000)]
+    assert [len(chunk) for chunk in chunks] == [1000, 1000, 500], f"Unexpected chunk sizes: {[len(c) for c in chunks]}"
+    again = predictor.generate_synthetic_chunks(2500, chunk_size=1000)
+    assert all(chunk.equals(other.reset_index(drop=True)) for chunk, other in zip(chunks, again)), \
+        "Chunks are not deterministic"
+    
+    # Without noise and clipping, each row is the product of the original factors
+    def loop_range(temperature, wind_speed, driving_style, cargo_weight):
+        temp_factor = 0.85 if temperature < 0 else 0.90 if temperature > 30 else 1.0
+        style_factor = {'aggressive': 0.75, 'moderate': 1.0, 'eco': 1.15}[driving_style]
+        return 400 * temp_factor * (1.0 - wind_speed * 0.01) * style_factor * (1.0 - cargo_weight * 0.0002)
+    
+    expected = np.array([loop_range(*row) for row in data[
+        ['temperature', 'wind_speed', 'driving_style', 'cargo_weight']
+    ].itertuples(index=False)])
+    unclipped = (data['range_km'] > 200) & (data['range_km'] < 500)
+    noise = data['range_km'][unclipped] - expected[unclipped]
+    assert abs(noise.mean()) < 0.5 and abs(noise.std() - 10) < 0.5, \
+        f"Noise has mean {noise.mean():.2f} and std {noise.std():.2f}, expected 0 and 10"
+    assert data['range_km'].between(200, 500).all(), "Ranges outside [200, 500]"
+    
+    # Per-style distributions match the original loop drawing from NumPy's legacy generator
+    rng = np.random.RandomState(42)
+    temperature = rng.uniform(-10, 40, n_samples)
+    wind_speed = rng.uniform(0, 30, n_samples)
+    driving_styles = rng.choice(['aggressive', 'moderate', 'eco'], n_samples)
+    cargo_weight = rng.uniform(0, 500, n_samples)
+    legacy = []
+    for i in range(n_samples):
+        range_km = loop_range(temperature[i], wind_speed[i], driving_styles[i], cargo_weight[i])
+        legacy.append(max(200, min(500, range_km + rng.normal(0, 10))))
+    legacy = np.array(legacy)
+    for style in ['aggressive', 'moderate', 'eco']:
+        new = data['range_km'][data['driving_style'] == style]
+        old = legacy[driving_styles == style]
+        assert abs(new.mean() - old.mean()) < 2.0 and abs(new.std() - old.std()) < 2.0, \
+            f"{style}: mean {new.mean():.1f}/{old.mean():.1f}, std {new.std():.1f}/{old.std():.1f}"
+    
+    print(f"✅ Synthetic data is deterministic and matches the original loop over {n_samples} rows")
+
+def test_incremental_training():
+    """Test chunked training, its tree budget and the training chunk readers."""
+    print("\n🧱 Testing Incremental Training...")
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        model_path = os.path.join(temp_dir, 'incremental.joblib')
+        predictor = RangePredictor(model_path=model_path, load=False)
+        chunks = predictor.generate_synthetic_chunks(12000, chunk_size=2000, seed=3)
+        
+        # Each chunk adds its trees until the budget is reached, then the rest is ignored
+        predictor.train_incremental(chunks, estimators_per_chunk=8, max_estimators=20, max_depth=8)
+        assert predictor.model.n_estimators == 20 and len(predictor.model.estimators_) == 20, \
+            f"Expected 20 trees, got {len(predictor.model.estimators_)}"
+        assert next(chunks, None) is not None, "Training kept reading chunks after the tree budget"
+        
+        # The saved model loads and predicts like a model trained in one pass
+        loaded = RangePredictor(model_path=model_path)
+        assert len(loaded.model.estimators_) == 20, "Saved model lost trees"
+        test_data = predictor.generate_synthetic_data(500, seed=11)
+        predictions = [loaded.predict_range(row.temperature, row.wind_speed, row.driving_style, row.cargo_weight)
+                       for row in test_data.itertuples(index=False)]
+        mae = np.mean(np.abs(np.array(predictions) - test_data['range_km'].to_numpy()))
+        assert mae < 20, f"Incrementally trained model has a mean error of {mae:.1f} km"
+        assert loaded.predict_range(20, 5, 'eco', 100) > loaded.predict_range(20, 5, 'aggressive', 100), \
+            "Eco driving should predict a longer range than aggressive driving"
+        
+        # Chunks without usable rows train nothing
+        try:
+            RangePredictor(model_path=model_path, load=False).train_incremental(iter([test_data.iloc[:0]]))
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("Training without rows did not raise")
+        
+        # CSV chunks map the target column onto range_km
+        csv_path = os.path.join(temp_dir, 'trips.csv')
+        test_data.rename(columns={'range_km': 'measured_range'}).to_csv(csv_path, index=False)
+        csv_chunks = list(iter_csv_chunks(csv_path, 200, target='measured_range'))
+        assert [len(chunk) for chunk in csv_chunks] == [200, 200, 100], "Unexpected CSV chunk sizes"
+        assert np.allclose(np.concatenate([chunk['range_km'] for chunk in csv_chunks]), test_data['range_km']), \
+            "CSV chunks changed the target values"
+        
+        # SQLite chunks come from a table of measured trips
+        database_path = os.path.join(temp_dir, 'trips.db')
+        conn = connect(database_path)
+        conn.execute('CREATE TABLE trips (temperature REAL, wind_speed REAL, driving_style TEXT, '
+                     'cargo_weight REAL, measured_range REAL)')
+        conn.executemany('INSERT INTO trips VALUES (?, ?, ?, ?, ?)', test_data.itertuples(index=False))
+        conn.commit()
+        conn.close()
+        sqlite_chunks = list(iter_sqlite_chunks(database_path, 200, 'measured_range', 'trips'))
+        assert [len(chunk) for chunk in sqlite_chunks] == [200, 200, 100], "Unexpected SQLite chunk sizes"
+        assert np.allclose(np.concatenate([chunk['range_km'] for chunk in sqlite_chunks]), test_data['range_km']), \
+            "SQLite chunks changed the target values"
+        
+        # The prediction history only holds the model's own output and is refused, as are missing columns
+        setup_database(database_path)
+        for target, table in [('predicted_range', 'predictions'), ('measured_range', 'predictions'),
+                              ('measured_range', 'predictions_2026_01'), ('predicted_range', 'trips'),
+                              ('actual_range', 'trips'), ('measured_range', 'journeys')]:
+            try:
+                iter_sqlite_chunks(database_path, 100, target, table)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(f"Training on {table}.{target} was accepted")
+    
+    print(f"✅ Incremental training works: 20 trees, mean error {mae:.1f} km")
+
+def test_sweep_selection():
+    """Test the sweep's candidates, Pareto front and model selection."""
+    print("\n🎛️ Testing Sweep Selection...")
+    
+    # Every combination, or a reproducible random subset of them
+    candidates = build_candidates([10, 50], [6, None], [1, 5, 10])
+    assert len(candidates) == 12, f"Expected 12 candidates, got {len(candidates)}"
+    subset = build_candidates([10, 50], [6, None], [1, 5, 10], n_random=4)
+    assert len(subset) == 4 and subset == build_candidates([10, 50], [6, None], [1, 5, 10], n_random=4), \
+        "Random candidates are not reproducible"
+    assert all(candidate in candidates for candidate in subset), "Random candidates outside the grid"
+    
+    def result(name, test_r2, latency_us, size_bytes):
+        return {'name': name, 'test_r2': test_r2, 'latency_us': latency_us, 'size_bytes': size_bytes}
+    
+    results = [
+        result('fast', 0.93, 5.0, 500),
+        result('small', 0.95, 10.0, 100),
+        result('accurate', 0.97, 10.0, 200),
+        result('slow', 0.90, 12.0, 600),
+        result('bloated', 0.93, 5.0, 700)
+    ]
+    
+    # Results beaten on every objective are not on the front
+    front = [r['name'] for r in pareto_front(results)]
+    assert front == ['fast', 'small', 'accurate'], f"Unexpected Pareto front: {front}"
+    
+    # The fastest eligible result wins, size breaks latency ties, and the most accurate is the fallback
+    for min_r2, expected in [(0.9, ('fast', True)), (0.94, ('small', True)), (0.99, ('accurate', False))]:
+        best, met = select_candidate(results, min_r2)
+        assert (best['name'], met) == expected, f"min_r2 {min_r2}: selected {best['name']}, {met}"
+    
+    # A real candidate reports every objective
+    measured = evaluate_candidate({'n_estimators': 5, 'max_depth': 4, 'min_samples_leaf': 5},
+                                  n_samples=500, latency_rows=20)
+    assert measured['n_estimators'] == 5 and measured['test_r2'] > 0.5, f"Unexpected result: {measured}"
+    assert measured['latency_us'] > 0 and measured['size_bytes'] > 0 and 5 <= measured['nodes'] <= 5 * 31, \
+        f"Unexpected measurements: {measured}"
+    
+    print(f"✅ Sweep selection works (R² {measured['test_r2']:.3f}, {measured['latency_us']:.1f} µs/row)")
+
+def test_asgi_disconnect():
+    """Test that a streamed WSGI response stops when the ASGI client disconnects."""
+    print("\n🔌 Testing ASGI Disconnect...")
+    
+    produced = []
+    closed = threading.Event()
+    
+    class Stream:
+        def __iter__(self):
+            for i in range(1000):
+                produced.append(i)
+                yield b'row\n'
+        
+        def close(self):
+            closed.set()
+    
+    def wsgi_app(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return Stream()
+    
+    async def serve():
+        sent = []
+        
+        async def send(message):
+            sent.append(message)
+            if len(sent) == 4:
+                raise OSError('Client disconnected')
+        
+        scope = {'type': 'http', 'method': 'GET', 'path': '/stream', 'headers': []}
+        try:
+            await call_wsgi(wsgi_app, scope, b'', send)
+        except OSError:
+            return sent
+        raise AssertionError("The failed send was not raised")
+    
+    # The loop is closed without waiting for its executor, so a stuck worker fails the test instead of hanging it
+    loop = asyncio.new_event_loop()
+    try:
+        sent = loop.run_until_complete(serve())
+        assert closed.wait(5), "The WSGI response was not closed after the client disconnected"
+    finally:
+        loop.close()
+    assert len(sent) == 4 and len(produced) < 100, f"Kept producing after the disconnect: {len(produced)} chunks"
+    
+    print(f"✅ Disconnected streams stop: {len(produced)} of 1000 chunks produced")
+
+def test_fast_path_matches_dataframe():
+    """Test that the fast single-row path equals the pandas/sklearn reference path exactly."""
+    print("\n🎯 Testing Fast Path Equality...")
+    
+    rng = np.random.default_rng(2024)
+    n_rows = 200
+    styles = ['aggressive', 'moderate', 'eco']
+    rows = list(zip(
+        rng.uniform(-30, 45, n_rows).tolist(),
+        rng.uniform(0, 80, n_rows).tolist(),
+        [styles[i] for i in rng.integers(0, len(styles), n_rows)],
+        rng.uniform(0, 900, n_rows).tolist()
+    ))
+    # Integer inputs take the same path as the JSON payloads that carry them
+    rows += [(20, 10, 'moderate', 100), (-5, 25, 'aggressive', 300), (25, 5, 'eco', 50)]
+    
+    for engine in ['sklearn', 'flat']:
+        predictor = RangePredictor(engine=engine)
+        for row in rows:
+            expected = predictor._predict_range_dataframe(*row)
+            actual = predictor.predict_range(*row)
+            assert actual == expected, f"{engine} fast path differs for {row}: {actual!r} != {expected!r}"
+    
+    print(f"✅ Fast path equals the DataFrame path on {len(rows)} seeded rows")
+
+def test_api_client():
+    """Test status codes and bodies of the API endpoints in process with Flask's test client."""
+    print("\n🧫 Testing API Client...")
+    
+    saved_modules = {name: getattr(flask_app, name) for name in ['db_pool', 'model_registry', 'weather_service', '_predictor']}
+    saved_config = {name: getattr(Config, name) for name in ['DATABASE_PATH', 'ADMIN_TOKEN', 'MAX_BATCH_SIZE']}
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        try:
+            # Point the app at a temporary history, vehicle model and weather stub
+            database_path = create_history_database(temp_dir)
+            Config.DATABASE_PATH = database_path
+            flask_app.db_pool = ConnectionPool(database_path)
+            
+            vehicles_dir = os.path.join(temp_dir, 'vehicles')
+            RangePredictor(model_path=os.path.join(vehicles_dir, 'city.joblib'), load=False,
+                           base_range=250).train_model(n_estimators=5, n_samples=500)
+            flask_app.model_registry = ModelRegistry(
+                vehicles_dir, lambda path: RangePredictor(model_path=path, load=False), memory_budget_bytes=1 << 30)
+            
+            stub_path = os.path.join(temp_dir, 'weather_stub.json')
+            with open(stub_path, 'w') as f:
+                json.dump({'observations': [
+                    {'latitude': 52.52, 'longitude': 13.40, 'time': '2025-01-15T08:00',
+                     'temperature': -2.5, 'wind_speed': 18}
+                ]}, f)
+            flask_app.weather_service = WeatherService(FileWeatherProvider(stub_path), ttl=60, precision=5)
+            
+            client = flask_app.app.test_client()
+            row = {'temperature': 20, 'wind_speed': 10, 'driving_style': 'moderate', 'cargo_weight': 100}
+            
+            # Readiness is 503 until the model is loaded, then 200
+            flask_app._predictor = None
+            response = client.get('/api/ready')
+            assert response.status_code == 503 and response.get_json() == {'ready': False}, \
+                f"Unloaded readiness: {response.status_code} {response.get_json()}"
+            flask_app.get_predictor()
+            response = client.get('/api/ready')
+            assert response.status_code == 200 and response.get_json()['ready'], \
+                f"Loaded readiness: {response.status_code} {response.get_json()}"
+            
+            # Single predictions, by vehicle and by location
+            response = client.post('/api/predict', json=row)
+            assert response.status_code == 200 and response.get_json()['predicted_range_km'] > 0, \
+                f"Prediction failed: {response.status_code} {response.get_json()}"
+            default_range = response.get_json()['predicted_range_km']
+            
+            response = client.post('/api/predict', json=dict(row, vehicle_id='city'))
+            body = response.get_json()
+            assert response.status_code == 200 and body['vehicle_id'] == 'city' and body['predicted_range_km'] < default_range, \
+                f"Vehicle prediction: {response.status_code} {body}"
+            response = client.post('/api/predict', json=dict(row, vehicle_id='bus'))
+            assert response.status_code == 400 and 'bus' in response.get_json()['error'], \
+                f"Unknown vehicle: {response.status_code} {response.get_json()}"
+            
+            located = {'latitude': 52.52, 'longitude': 13.40, 'time': '2025-01-15T08:40',
+                       'driving_style': 'moderate', 'cargo_weight': 100}
+            response = client.post('/api/predict', json=located)
+            body = response.get_json()
+            assert response.status_code == 200 and (body['temperature'], body['wind_speed']) == (-2.5, 18) \
+                and 'weather' in body, f"Located prediction: {response.status_code} {body}"
+            response = client.post('/api/predict', json=dict(located, latitude=0.0, longitude=0.0))
+            assert response.status_code == 502, f"Missing weather should be a 502, got {response.status_code}"
+            response = client.post('/api/predict', json=dict(located, latitude=123))
+            assert response.status_code == 400, f"Invalid latitude should be a 400, got {response.status_code}"
+            
+            # Batch validation errors and the size limit
+            Config.MAX_BATCH_SIZE = 3
+            for body, message in [
+                ('not json', 'Request body must be'),
+                ([], 'at least one row'),
+                ([row, {'temperature': 20}], 'Missing required field in row 1'),
+                ([row, dict(row, driving_style='sporty')], 'Invalid driving style in row 1'),
+                ({'temperature': [20, 10], 'wind_speed': [10], 'driving_style': ['eco', 'eco'], 'cargo_weight': [0, 0]},
+                 'same length'),
+                ([row] * 4, 'exceeds maximum of 3')
+            ]:
+                response = client.post('/api/predict/batch', json=body)
+                assert response.status_code == 400 and message in response.get_json()['error'], \
+                    f"Batch {body!r}: {response.status_code} {response.get_json()}"
+            response = client.post('/api/predict/batch', json=[row] * 3)
+            body = response.get_json()
+            assert response.status_code == 200 and body['count'] == 3 and body['predicted_range_km'] == [default_range] * 3, \
+                f"Batch prediction: {response.status_code} {body}"
+            
+            # Trip simulation
+            trip = {'cargo_weight': 200, 'segments': [
+                {'distance_km': 100, 'temperature': 20, 'wind_speed': 10},
+                {'distance_km': 120, 'temperature': -5, 'wind_speed': 30, 'cargo_change': -150}
+            ]}
+            response = client.post('/api/trip/simulate', json=trip)
+            body = response.get_json()
+            assert response.status_code == 200 and len(body['waypoints']) == 2 and body['total_distance_km'] == 220, \
+                f"Trip simulation: {response.status_code} {body}"
+            response = client.post('/api/trip/simulate', json={'segments': [{'distance_km': 100}]})
+            assert response.status_code == 400 and 'segment 0' in response.get_json()['error'], \
+                f"Invalid trip: {response.status_code} {response.get_json()}"
+            
+            # History pages follow X-Next-Cursor, and bad cursors are rejected
+            with flask_app.db_pool.connection() as conn:
+                total = conn.execute('SELECT COUNT(*) FROM predictions').fetchone()[0]
+            response = client.get('/api/history?limit=200')
+            first_page = response.get_json()
+            cursor = response.headers.get('X-Next-Cursor')
+            assert response.status_code == 200 and len(first_page) == 200 and cursor, \
+                f"First history page: {response.status_code} {len(first_page)} rows, cursor {cursor}"
+            response = client.get('/api/history', query_string={'limit': 200, 'cursor': cursor})
+            second_page = response.get_json()
+            assert response.status_code == 200 and 'X-Next-Cursor' not in response.headers and \
+                len(first_page) + len(second_page) == total and second_page[0]['id'] != first_page[-1]['id'], \
+                f"Second history page: {response.status_code} {len(second_page)} rows"
+            for bad in [{'cursor': 'not-a-cursor'}, {'limit': 0}, {'driving_style': 'sporty'}]:
+                response = client.get('/api/history', query_string=bad)
+                assert response.status_code == 400 and 'error' in response.get_json(), \
+                    f"History {bad}: {response.status_code}"
+            
+            # Export streams the history with the format's Content-Type
+            response = client.get('/api/history/export?format=csv')
+            streamed = response.is_streamed
+            lines = response.get_data(as_text=True).splitlines()
+            assert response.status_code == 200 and streamed and response.mimetype == 'text/csv' \
+                and len(lines) == 1 + total, f"CSV export: {response.status_code} {response.mimetype} {len(lines)} lines"
+            response = client.get('/api/history/export')
+            assert response.mimetype == 'application/x-ndjson' and \
+                'attachment' in response.headers['Content-Disposition'], f"NDJSON export: {response.headers}"
+            response.close()
+            response = client.get('/api/history/export?format=xml')
+            assert response.status_code == 400, f"Unknown export format: {response.status_code}"
+            
+            # Stats arguments
+            response = client.get('/api/history/stats?group_by=day')
+            assert response.status_code == 200 and response.get_json()['period'] == 'day', \
+                f"Stats: {response.status_code} {response.get_json()}"
+            for bad in [{'group_by': 'month'}, {'percentiles': '101'}, {'start': 'yesterday'}, {'driving_style': 'sporty'}]:
+                response = client.get('/api/history/stats', query_string=bad)
+                assert response.status_code == 400 and 'error' in response.get_json(), \
+                    f"Stats {bad}: {response.status_code}"
+            
+            # Prometheus exposition format
+            response = client.get('/metrics')
+            text = response.get_data(as_text=True)
+            assert response.status_code == 200 and response.content_type == 'text/plain; version=0.0.4; charset=utf-8', \
+                f"Metrics: {response.status_code} {response.content_type}"
+            assert '# TYPE voltsage_requests_total counter' in text and \
+                'voltsage_requests_total{route="/api/ready",method="GET",status="503"}' in text, \
+                "Metrics are missing the request counter"
+            
+            # Admin endpoints do not exist without a token, and need the right one
+            Config.ADMIN_TOKEN = ''
+            assert client.get('/api/admin/reload').status_code == 404, "Admin endpoint exists without a token"
+            Config.ADMIN_TOKEN = 'secret'
+            assert client.get('/api/admin/reload', headers={'X-Admin-Token': 'wrong'}).status_code == 403, \
+                "Wrong admin token was accepted"
+            assert client.get('/api/admin/reload').status_code == 403, "Missing admin token was accepted"
+            response = client.post('/api/admin/reload', json={'vehicle_id': 'city'}, headers={'X-Admin-Token': 'secret'})
+            assert response.status_code == 200 and response.get_json() == {'status': 'unloaded', 'vehicle_id': 'city'}, \
+                f"Admin reload: {response.status_code} {response.get_json()}"
+            
+            flask_app.db_pool.close()
+        finally:
+            for name, value in saved_modules.items():
+                setattr(flask_app, name, value)
+            for name, value in saved_config.items():
+                setattr(Config, name, value)
+    
+    print("✅ API endpoints return the expected statuses and bodies")
+
 def test_api():
     """Test the Flask API endpoints."""
     print("\n🌐 Testing API Endpoints...")
@@ -160,6 +1285,78 @@ def main():
     # Test model
     model_ok = test_model()
     
+    # Test batch prediction
+    batch_ok = run_test(test_batch_prediction)
+    
+    # Test flat forest engine
+    flat_ok = run_test(test_flat_engine)
+    
+    # Test trip simulation
+    trip_ok = run_test(test_trip_simulation)
+    
+    # Test the vehicle model registry
+    registry_ok = run_test(test_model_registry)
+    
+    # Test weather lookups
+    weather_ok = run_test(test_weather_service)
+    
+    # Test monthly history shards
+    shards_ok = run_test(test_history_shards)
+    
+    # Test stage metrics
+    metrics_ok = run_test(test_stage_metrics)
+    
+    # Test async request batching
+    batcher_ok = run_test(test_prediction_batcher)
+    
+    # Test prediction percentiles
+    percentiles_ok = run_test(test_prediction_percentiles)
+    
+    # Test compact surrogate engine
+    compact_ok = run_test(test_compact_engine)
+    
+    # Test memory-mapped model artifact
+    mmap_ok = run_test(test_memory_mapped_model)
+    
+    # Test hot model reload
+    reload_ok = run_test(test_model_reload)
+    
+    # Test prediction cache
+    cache_ok = run_test(test_prediction_cache)
+    
+    # Test range grid engine
+    grid_ok = run_test(test_range_grid)
+    
+    # Test background history writer
+    writer_ok = run_test(test_history_writer)
+    
+    # Test keyset history paging
+    pages_ok = run_test(test_history_pages)
+    
+    # Test NDJSON and CSV history export
+    export_ok = run_test(test_history_export)
+    
+    # Test history rollup statistics
+    stats_ok = run_test(test_history_stats)
+    
+    # Test synthetic data generation
+    synthetic_ok = run_test(test_synthetic_data)
+    
+    # Test incremental training
+    incremental_ok = run_test(test_incremental_training)
+    
+    # Test hyperparameter sweep selection
+    sweep_ok = run_test(test_sweep_selection)
+    
+    # Test ASGI client disconnects
+    disconnect_ok = run_test(test_asgi_disconnect)
+    
+    # Test fast path equality
+    fast_path_ok = run_test(test_fast_path_matches_dataframe)
+    
+    # Test API endpoints in process
+    client_ok = run_test(test_api_client)
+    
     # Test API (only if Flask app is running)
     api_ok = test_api()
     
@@ -169,10 +1366,34 @@ def main():
     print("\n" + "=" * 50)
     print("📋 Test Results:")
     print(f"   Machine Learning Model: {'✅ PASS' if model_ok else '❌ FAIL'}")
+    print(f"   Batch Prediction: {'✅ PASS' if batch_ok else '❌ FAIL'}")
+    print(f"   Flat Forest Engine: {'✅ PASS' if flat_ok else '❌ FAIL'}")
+    print(f"   Trip Simulation: {'✅ PASS' if trip_ok else '❌ FAIL'}")
+    print(f"   Model Registry: {'✅ PASS' if registry_ok else '❌ FAIL'}")
+    print(f"   Weather Service: {'✅ PASS' if weather_ok else '❌ FAIL'}")
+    print(f"   History Shards: {'✅ PASS' if shards_ok else '❌ FAIL'}")
+    print(f"   Stage Metrics: {'✅ PASS' if metrics_ok else '❌ FAIL'}")
+    print(f"   Prediction Batcher: {'✅ PASS' if batcher_ok else '❌ FAIL'}")
+    print(f"   Prediction Percentiles: {'✅ PASS' if percentiles_ok else '❌ FAIL'}")
+    print(f"   Compact Engine: {'✅ PASS' if compact_ok else '❌ FAIL'}")
+    print(f"   Memory-Mapped Model: {'✅ PASS' if mmap_ok else '❌ FAIL'}")
+    print(f"   Model Reload: {'✅ PASS' if reload_ok else '❌ FAIL'}")
+    print(f"   Prediction Cache: {'✅ PASS' if cache_ok else '❌ FAIL'}")
+    print(f"   Range Grid: {'✅ PASS' if grid_ok else '❌ FAIL'}")
+    print(f"   History Writer: {'✅ PASS' if writer_ok else '❌ FAIL'}")
+    print(f"   History Paging: {'✅ PASS' if pages_ok else '❌ FAIL'}")
+    print(f"   History Export: {'✅ PASS' if export_ok else '❌ FAIL'}")
+    print(f"   History Stats: {'✅ PASS' if stats_ok else '❌ FAIL'}")
+    print(f"   Synthetic Data: {'✅ PASS' if synthetic_ok else '❌ FAIL'}")
+    print(f"   Incremental Training: {'✅ PASS' if incremental_ok else '❌ FAIL'}")
+    print(f"   Sweep Selection: {'✅ PASS' if sweep_ok else '❌ FAIL'}")
+    print(f"   ASGI Disconnect: {'✅ PASS' if disconnect_ok else '❌ FAIL'}")
+    print(f"   Fast Path Equality: {'✅ PASS' if fast_path_ok else '❌ FAIL'}")
+    print(f"   API Client: {'✅ PASS' if client_ok else '❌ FAIL'}")
     print(f"   API Endpoints: {'✅ PASS' if api_ok else '❌ FAIL (Flask not running)'}")
     print(f"   Web Interface: {'✅ PASS' if web_ok else '❌ FAIL (Flask not running)'}")
     
-    if model_ok:
+    if model_ok and batch_ok and flat_ok and trip_ok and registry_ok and weather_ok and shards_ok and metrics_ok and batcher_ok and percentiles_ok and compact_ok and mmap_ok and reload_ok and cache_ok and grid_ok and writer_ok and pages_ok and export_ok and stats_ok and synthetic_ok and incremental_ok and sweep_ok and disconnect_ok and fast_path_ok and client_ok:
         print("\n🎉 Core functionality is working!")
         if not (api_ok and web_ok):
             print("💡 To test API and web interface, start the Flask app:")
@@ -0,0 +1,147 @@
+"""
+Trip-level range simulation.
+
+A route is a sequence of segments, each driven under its own conditions. The
+model predicts the full-battery range for every segment's conditions in one
+batch; a segment of distance d then uses d / range of the battery, and the
+remaining range at each waypoint is the charge left times the range under the
+current conditions.
+"""
+
+import math
+import numpy as np
+from models.range_predictor import DRIVING_STYLES
+
+def _number(value, name, minimum=None, maximum=None):
+    """Convert a request value to a finite float within bounds."""
+    if isinstance(value, bool):
+        raise ValueError(f'Invalid numeric value for {name}')
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid numeric value for {name}')
+    if not math.isfinite(number):
+        raise ValueError(f'Invalid numeric value for {name}')
+    if minimum is not None and number < minimum:
+        raise ValueError(f'{name} must be at least {minimum:g}')
+    if maximum is not None and number > maximum:
+        raise ValueError(f'{name} must be at most {maximum:g}')
+    return number
+
+def _driving_style(value, name):
+    """Validate a driving style."""
+    if value not in DRIVING_STYLES:
+        raise ValueError(f'Invalid {name}. Must be one of: aggressive, moderate, eco')
+    return value
+
+def parse_trip(data, max_segments):
+    """Validate a trip request and return its options and columnar segments.
+
+    Each segment needs distance_km, temperature and wind_speed, and may set
+    cargo_change (kg loaded or, when negative, unloaded at its start) and
+    driving_style (defaults to the trip's).
+    """
+    if not isinstance(data, dict):
+        raise ValueError('Request body must be an object')
+
+    segments = data.get('segments')
+    if not isinstance(segments, list) or not segments:
+        raise ValueError('segments must be a non-empty array')
+    if len(segments) > max_segments:
+        raise ValueError(f'Trip exceeds maximum of {max_segments} segments')
+
+    trip_style = _driving_style(data.get('driving_style', 'moderate'), 'driving_style')
+    options = {
+        'initial_cargo_weight': _number(data.get('cargo_weight', 0.0), 'cargo_weight', minimum=0),
+        'initial_charge_percent': _number(data.get('initial_charge_percent', 100.0),
+                                          'initial_charge_percent', minimum=0, maximum=100),
+        'battery_capacity_kwh': None,
+        'percentile': None
+    }
+    if data.get('battery_capacity_kwh') is not None:
+        options['battery_capacity_kwh'] = _number(data['battery_capacity_kwh'], 'battery_capacity_kwh', minimum=0)
+    if data.get('percentile') is not None:
+        options['percentile'] = _number(data['percentile'], 'percentile', minimum=0, maximum=100)
+
+    columns = {'distance_km': [], 'temperature': [], 'wind_speed': [], 'cargo_change': [], 'driving_style': []}
+    for i, segment in enumerate(segments):
+        if not isinstance(segment, dict):
+            raise ValueError(f'Segment {i} must be an object')
+        for field in ('distance_km', 'temperature', 'wind_speed'):
+            if field not in segment:
+                raise ValueError(f'Missing required field in segment {i}: {field}')
+        columns['distance_km'].append(_number(segment['distance_km'], f'distance_km in segment {i}', minimum=0))
+        columns['temperature'].append(_number(segment['temperature'], f'temperature in segment {i}'))
+        columns['wind_speed'].append(_number(segment['wind_speed'], f'wind_speed in segment {i}', minimum=0))
+        columns['cargo_change'].append(_number(segment.get('cargo_change', 0.0), f'cargo_change in segment {i}'))
+        columns['driving_style'].append(
+            _driving_style(segment.get('driving_style', trip_style), f'driving_style in segment {i}')
+        )
+
+    return options, columns
+
+def simulate_trip(predictor, distance_km, temperature, wind_speed, driving_style, cargo_change,
+                  initial_cargo_weight=0.0, initial_charge_percent=100.0, battery_capacity_kwh=None,
+                  percentile=None):
+    """Simulate a trip segment by segment with a single batch prediction.
+
+    With percentile (e.g. 10), each segment uses that percentile of the trees'
+    predicted ranges instead of the mean, for a conservative estimate.
+    Returns the trip summary and one waypoint per segment end.
+    """
+    distance_km = np.asarray(distance_km, dtype=np.float64)
+    cargo_weight = initial_cargo_weight + np.cumsum(np.asarray(cargo_change, dtype=np.float64))
+    if (cargo_weight < 0).any():
+        segment = int(np.argmax(cargo_weight < 0))
+        raise ValueError(f'Cargo weight becomes negative in segment {segment}')
+
+    # Full-battery range under every segment's conditions, in one model evaluation
+    if percentile is None:
+        segment_range = predictor.predict_batch(temperature, wind_speed, driving_style, cargo_weight)
+    else:
+        _, bands = predictor.predict_batch(temperature, wind_speed, driving_style, cargo_weight,
+                                           percentiles=[percentile])
+        segment_range = bands[0]
+
+    # Share of the battery each segment uses, and the charge left at each waypoint
+    used_percent = distance_km / segment_range * 100.0
+    charge_percent = initial_charge_percent - np.cumsum(used_percent)
+    remaining_range = np.maximum(charge_percent, 0.0) / 100.0 * segment_range
+    cumulative_distance = np.cumsum(distance_km)
+
+    # Interpolate where within its segment the battery runs out
+    exhausted_at = None
+    if (charge_percent < 0).any():
+        segment = int(np.argmax(charge_percent < 0))
+        charge_before = initial_charge_percent if segment == 0 else charge_percent[segment - 1]
+        start = cumulative_distance[segment] - distance_km[segment]
+        exhausted_at = float(start + charge_before / 100.0 * segment_range[segment])
+
+    # Round whole columns, then zip them into one object per waypoint
+    columns = {
+        'segment': list(range(len(distance_km))),
+        'distance_km': np.round(cumulative_distance, 3).tolist(),
+        'cargo_weight': np.round(cargo_weight, 3).tolist(),
+        'segment_range_km': np.round(segment_range, 2).tolist(),
+        'charge_used_percent': np.round(used_percent, 3).tolist(),
+        'charge_percent': np.round(charge_percent, 3).tolist(),
+        'remaining_range_km': np.round(remaining_range, 2).tolist()
+    }
+    if battery_capacity_kwh is not None:
+        energy_used = (initial_charge_percent - charge_percent) / 100.0 * battery_capacity_kwh
+        columns['energy_used_kwh'] = np.round(energy_used, 3).tolist()
+    waypoints = [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+    summary = {
+        'segment_count': len(distance_km),
+        'total_distance_km': round(float(cumulative_distance[-1]), 3),
+        'final_charge_percent': round(float(charge_percent[-1]), 3),
+        'remaining_range_km': round(float(remaining_range[-1]), 2),
+        'feasible': exhausted_at is None,
+        'range_exhausted_at_km': None if exhausted_at is None else round(exhausted_at, 3),
+        'percentile': percentile
+    }
+    if battery_capacity_kwh is not None:
+        summary['energy_used_kwh'] = waypoints[-1]['energy_used_kwh']
+
+    return summary, waypoints
@@ -0,0 +1,343 @@
+"""
+Weather conditions for predictions made from a location and time.
+
+Lookups are cached per geohash cell and UTC hour: every point in a cell and
+hour shares the conditions at the cell's centre, so nearby vehicles and
+repeated requests reuse one provider call. Concurrent lookups of a cell that
+is already being fetched wait for that fetch instead of starting another,
+and a batch of points is resolved with a single provider call for all of its
+missing cells.
+"""
+
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime, timezone
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+WEATHER_PROVIDERS = ['open-meteo', 'file', 'none']
+
+class WeatherError(Exception):
+    """A weather provider could not supply the requested conditions."""
+
+def encode_geohash(latitude, longitude, precision=5):
+    """Geohash of a point with precision characters."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+def decode_geohash(geohash):
+    """Centre (latitude, longitude) of a geohash cell."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            interval = lon_range if even else lat_range
+            middle = (interval[0] + interval[1]) / 2
+            if value >> shift & 1:
+                interval[0] = middle
+            else:
+                interval[1] = middle
+            even = not even
+    return (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
+
+def parse_time(value):
+    """Parse an ISO 8601 time as a naive UTC datetime; naive times are taken as UTC."""
+    if value is None:
+        return datetime.now(timezone.utc).replace(tzinfo=None)
+    if not isinstance(value, str):
+        raise ValueError('time must be an ISO 8601 string')
+    try:
+        when = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError('time must be an ISO 8601 string')
+    if when.tzinfo is not None:
+        when = when.astimezone(timezone.utc).replace(tzinfo=None)
+    return when
+
+def parse_location(latitude, longitude, when=None, suffix=''):
+    """Validate a location and time from a request; returns (latitude, longitude, time)."""
+    point = []
+    for name, value, limit in (('latitude', latitude, 90), ('longitude', longitude, 180)):
+        if isinstance(value, bool):
+            raise ValueError(f'Invalid numeric value for {name}{suffix}')
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid numeric value for {name}{suffix}')
+        if not (math.isfinite(number) and -limit <= number <= limit):
+            raise ValueError(f'{name}{suffix} must be between -{limit} and {limit}')
+        point.append(number)
+    try:
+        point.append(parse_time(when))
+    except ValueError as e:
+        raise ValueError(f'{e}{suffix}')
+    return tuple(point)
+
+class WeatherProvider:
+    """Source of hourly conditions.
+
+    fetch() receives a list of (geohash, latitude, longitude, hour) cells, where
+    the coordinates are the cell centre and hour is a naive UTC datetime on the
+    hour, and returns a {'temperature': °C, 'wind_speed': km/h} dict for each.
+    """
+
+    name = 'provider'
+
+    def fetch(self, cells):
+        raise NotImplementedError
+
+class OpenMeteoProvider(WeatherProvider):
+    """Hourly conditions from the Open-Meteo forecast API.
+
+    The cells of a bulk fetch are sent as comma-separated coordinate lists, up
+    to max_locations per HTTP request.
+    """
+
+    name = 'open-meteo'
+
+    def __init__(self, base_url='https://api.open-meteo.com/v1/', api_key='', timeout=2.0, max_locations=100):
+        import requests
+        self.url = base_url.rstrip('/') + '/forecast'
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_locations = max_locations
+        self.session = requests.Session()
+
+    def fetch(self, cells):
+        results = []
+        for start in range(0, len(cells), self.max_locations):
+            results.extend(self._fetch_chunk(cells[start:start + self.max_locations]))
+        return results
+
+    def _fetch_chunk(self, cells):
+        hours = [cell[3] for cell in cells]
+        params = {
+            'latitude': ','.join(f'{cell[1]:.5f}' for cell in cells),
+            'longitude': ','.join(f'{cell[2]:.5f}' for cell in cells),
+            'hourly': 'temperature_2m,wind_speed_10m',
+            'wind_speed_unit': 'kmh',
+            'timezone': 'GMT',
+            'start_hour': min(hours).strftime('%Y-%m-%dT%H:%M'),
+            'end_hour': max(hours).strftime('%Y-%m-%dT%H:%M')
+        }
+        if self.api_key:
+            params['apikey'] = self.api_key
+
+        try:
+            response = self.session.get(self.url, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            body = response.json()
+        except Exception as e:
+            raise WeatherError(f'Open-Meteo request failed: {e}')
+
+        # A single location is returned as an object, several as a list
+        locations = body if isinstance(body, list) else [body]
+        if len(locations) != len(cells):
+            raise WeatherError(f'Open-Meteo returned {len(locations)} locations for {len(cells)}')
+
+        results = []
+        for cell, location in zip(cells, locations):
+            hourly = location.get('hourly', {})
+            key = cell[3].strftime('%Y-%m-%dT%H:%M')
+            try:
+                index = hourly['time'].index(key)
+                temperature = hourly['temperature_2m'][index]
+                wind_speed = hourly['wind_speed_10m'][index]
+            except (KeyError, ValueError):
+                raise WeatherError(f'Open-Meteo has no data for {key}')
+            if temperature is None or wind_speed is None:
+                raise WeatherError(f'Open-Meteo has no data for {key}')
+            results.append({'temperature': float(temperature), 'wind_speed': float(wind_speed)})
+        return results
+
+class FileWeatherProvider(WeatherProvider):
+    """Conditions read from a local JSON file, for tests and offline development.
+
+    The file holds observations and an optional default:
+
+        {"default": {"temperature": 15, "wind_speed": 10},
+         "observations": [{"latitude": 52.52, "longitude": 13.40, "time": "2025-01-15T08:00",
+                           "temperature": -2.5, "wind_speed": 18}]}
+
+    A cell uses an observation inside it for the same hour, then one inside it
+    without a time, then the default.
+    """
+
+    name = 'file'
+
+    def __init__(self, path):
+        with open(path) as f:
+            data = json.load(f)
+        self.default = None
+        if data.get('default') is not None:
+            self.default = {field: float(data['default'][field]) for field in ('temperature', 'wind_speed')}
+        self.observations = []
+        for observation in data.get('observations', []):
+            latitude, longitude, when = parse_location(
+                observation['latitude'], observation['longitude'], observation.get('time')
+            )
+            self.observations.append((
+                encode_geohash(latitude, longitude, 12),
+                when.replace(minute=0, second=0, microsecond=0) if 'time' in observation else None,
+                {'temperature': float(observation['temperature']), 'wind_speed': float(observation['wind_speed'])}
+            ))
+
+    def fetch(self, cells):
+        results = []
+        for geohash, _, _, hour in cells:
+            matches = [(when, conditions) for cell, when, conditions in self.observations if cell.startswith(geohash)]
+            conditions = next((c for when, c in matches if when == hour), None)
+            conditions = conditions or next((c for when, c in matches if when is None), None) or self.default
+            if conditions is None:
+                raise WeatherError(f'No weather data for cell {geohash} at {hour.isoformat()}')
+            results.append(dict(conditions))
+        return results
+
+class WeatherService:
+    """TTL cache of provider conditions keyed on (geohash, UTC hour), with coalesced fetches."""
+
+    def __init__(self, provider, ttl=1800.0, max_entries=10000, precision=5, timeout=10.0):
+        if max_entries <= 0:
+            raise ValueError("max_entries must be positive")
+        if not 1 <= precision <= 12:
+            raise ValueError("precision must be between 1 and 12")
+
+        self.provider = provider
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.precision = precision
+        self.timeout = timeout
+
+        # key -> (expiry, conditions), oldest first
+        self._entries = OrderedDict()
+        # key -> Future of the fetch that will fill it
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.fetches = 0
+        self.fetched_cells = 0
+        self.errors = 0
+
+    def key(self, latitude, longitude, when):
+        """Cache key of a point: its geohash cell and UTC hour."""
+        return encode_geohash(latitude, longitude, self.precision), when.replace(minute=0, second=0, microsecond=0)
+
+    def lookup(self, latitude, longitude, when):
+        """Conditions at one point; see lookup_many."""
+        return self.lookup_many([(latitude, longitude, when)])[0]
+
+    def lookup_many(self, points):
+        """Conditions for (latitude, longitude, time) points, in order.
+
+        Each result has temperature, wind_speed, and the geohash and hour it
+        was resolved for. Raises WeatherError when the provider fails.
+        """
+        keys = [self.key(*point) for point in points]
+        results, waiting, missing = {}, {}, []
+        now = time.monotonic()
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    results[key] = entry[1]
+                elif key in self._pending:
+                    self.coalesced += 1
+                    waiting[key] = self._pending[key]
+                else:
+                    self.misses += 1
+                    self._pending[key] = Future()
+                    missing.append(key)
+
+        if missing:
+            results.update(zip(missing, self._fetch(missing)))
+
+        for key, future in waiting.items():
+            try:
+                results[key] = future.result(timeout=self.timeout)
+            except WeatherError:
+                raise
+            except Exception as e:
+                raise WeatherError(str(e))
+
+        return [
+            dict(results[key], geohash=key[0], time=key[1].isoformat(timespec='minutes') + 'Z')
+            for key in keys
+        ]
+
+    def _fetch(self, keys):
+        """Fetch missing cells with one provider call, settle their futures and return the conditions."""
+        cells = [(geohash, *decode_geohash(geohash), hour) for geohash, hour in keys]
+        try:
+            values = self.provider.fetch(cells)
+            if len(values) != len(keys):
+                raise WeatherError(f'{self.provider.name} returned {len(values)} results for {len(keys)} cells')
+        except Exception as e:
+            error = e if isinstance(e, WeatherError) else WeatherError(str(e))
+            with self._lock:
+                self.errors += 1
+                futures = [self._pending.pop(key) for key in keys]
+            for future in futures:
+                future.set_exception(error)
+            raise error
+
+        expiry = time.monotonic() + self.ttl
+        with self._lock:
+            self.fetches += 1
+            self.fetched_cells += len(keys)
+            for key, conditions in zip(keys, values):
+                self._entries[key] = (expiry, conditions)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            futures = [self._pending.pop(key) for key in keys]
+        for future, conditions in zip(futures, values):
+            future.set_result(conditions)
+        return values
+
+    def clear(self):
+        """Drop every cached cell."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return the cache size and lookup/fetch counters."""
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'provider': self.provider.name,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'geohash_precision': self.precision,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'fetches': self.fetches,
+                'fetched_cells': self.fetched_cells,
+                'errors': self.errors,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }